@@ -0,0 +1,158 @@
+#! /usr/bin/env python3
+
+#
+# Copyright 2019-2020
+# 
+# Bernd-Christian Renner and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""This is the ahoi benchmark (throughput and allocations of the hot paths)."""
+
+import argparse
+import sys
+
+from ahoi.bench import runner
+from ahoi.bench.cases import CASES, RECORDED, IMG_FILE
+
+
+def runCases(files, pattern=None, minTime=0.5):
+    """Run all cases (matching pattern) on synthetic and recorded input."""
+    results = []
+    for (name, setup, synth, kind) in CASES:
+        if pattern is not None and pattern not in name:
+            continue
+
+        inputs = [('synthetic', synth)]
+        if kind is not None and files.get(kind) is not None:
+            inputs.append(('recorded', lambda k=kind: RECORDED[k](files[k])))
+
+        for (inpName, load) in inputs:
+            fullName = "%s[%s]" % (name, inpName)
+            try:
+                case = setup(load())
+            except ImportError as e:
+                print("%-45s skipped (%s)" % (fullName, str(e)))
+                continue
+            if case is None:
+                print("%-45s skipped (no suitable input)" % fullName)
+                continue
+
+            fn, items = case
+            r = runner.run(fullName, fn, items, minTime)
+            print("%-45s %12.0f ops/s %8.1f blocks/op %10.0f B/op" % (r.name, r.opsPerSec, r.allocBlocks, r.allocPeak))
+            results.append(r)
+    return results
+
+
+if __name__ == "__main__":
+    ##
+    # process command lines arguments
+    ##
+
+    parser = argparse.ArgumentParser(
+        description="AHOI benchmark.",
+        epilog="""\
+          Returns 1 if a regression against the baseline is found.""")
+
+    parser.add_argument(
+        '-l', '--log',
+        type=str,
+        default=None,
+        dest='log',
+        help='packet log (as written by logOn) to be used as recorded input'
+    )
+
+    parser.add_argument(
+        '-i', '--image',
+        type=str,
+        default=IMG_FILE,
+        dest='image',
+        help='image to be used as recorded input of the image splitter'
+    )
+
+    parser.add_argument(
+        '-k', '--filter',
+        type=str,
+        default=None,
+        dest='pattern',
+        help='only run benchmarks containing this string'
+    )
+
+    parser.add_argument(
+        '-t', '--time',
+        type=float,
+        default=0.5,
+        dest='minTime',
+        help='minimum run time per benchmark in seconds (default: 0.5)'
+    )
+
+    parser.add_argument(
+        '-o', '--output',
+        type=str,
+        default=None,
+        dest='output',
+        help='save results as JSON (e.g. as a new baseline)'
+    )
+
+    parser.add_argument(
+        '-b', '--baseline',
+        type=str,
+        default=None,
+        dest='baseline',
+        help='compare results to this JSON file'
+    )
+
+    parser.add_argument(
+        '-r', '--threshold',
+        type=float,
+        default=0.2,
+        dest='threshold',
+        help='relative change to be flagged as regression (default: 0.2)'
+    )
+
+    args = parser.parse_args()
+
+    results = runCases({'log': args.log, 'image': args.image}, args.pattern, args.minTime)
+
+    if args.output is not None:
+        runner.save(args.output, results)
+        print("saved results to %s" % args.output)
+
+    if args.baseline is not None:
+        regressions = runner.compare(results, runner.load(args.baseline), args.threshold)
+        for (name, metric, old, new) in regressions:
+            print("REGRESSION: %s %s %.1f -> %.1f" % (name, metric, old, new))
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("no regressions")
+
+# eof
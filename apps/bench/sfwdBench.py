@@ -0,0 +1,352 @@
+#! /usr/bin/env python3
+
+#
+# Copyright 2019-2020
+# 
+# Bernd-Christian Renner and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""This is the ahoi serial forwarder benchmark (end-to-end latency and throughput)."""
+
+import argparse
+import json
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ahoi.bench import runner
+from ahoi.com.streamer import Streamer
+from ahoi.modem.packet import makePacket, getBytes, byteArrayToPacket
+from ahoi.sim.emulator import ModemEmulator
+
+SFWD = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sfwd', 'sfwd.py')
+LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib')
+
+STAMP_FORMAT = '>BIQ'  # direction, sequence number, send time (ns)
+STAMP_LEN = struct.calcsize(STAMP_FORMAT)
+PKT_TYPE = 0x42
+
+UP = 0  # modem -> client
+DOWN = 1  # client -> modem
+
+
+class Direction:
+    """Packets sent and received (with latency) in one direction."""
+
+    def __init__(self, name):
+        self.name = name
+        self.sent = 0
+        self.received = 0
+        self.bytes = 0
+        self.latency = []  # one-way latency (s)
+        self.lock = threading.Lock()
+
+    def record(self, payload):
+        now = time.monotonic_ns()
+        _, _, t = struct.unpack(STAMP_FORMAT, payload[0:STAMP_LEN])
+        with self.lock:
+            self.received += 1
+            self.bytes += len(payload)
+            self.latency.append((now - t) * 1e-9)
+
+    def report(self, duration):
+        lat = sorted(self.latency)
+        res = {
+            'sent': self.sent,
+            'received': self.received,
+            'dropped': self.sent - self.received,
+            'pktPerSec': self.received / duration,
+            'bytesPerSec': self.bytes / duration,
+        }
+        for p in (50, 90, 99, 100):
+            res['p%u' % p] = runner.percentile(lat, p) * 1e3 if lat else None
+        return res
+
+
+def stampedPayload(direction, seq, size):
+    stamp = struct.pack(STAMP_FORMAT, direction, seq, time.monotonic_ns())
+    return stamp + bytes(max(size - STAMP_LEN, 0))
+
+
+def pace(rate, duration, fn):
+    """Call fn(seq) rate times per second for duration seconds."""
+    t0 = time.monotonic()
+    seq = 0
+    while True:
+        t = t0 + seq / rate
+        if t - t0 >= duration:
+            break
+        delay = t - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        fn(seq)
+        seq = seq + 1
+
+
+def clientRx(sock, stats, stop):
+    """Receive and decode packets forwarded by sfwd."""
+    streamer = Streamer()
+    while not stop.is_set():
+        r, _, _ = select.select([sock], [], [], 0.1)
+        if not r:
+            continue
+        rx = sock.recv(4096)
+        if not rx:
+            return
+        for b in rx:
+            f = streamer.dec(b)
+            if f is not None:
+                pkt = byteArrayToPacket(f)
+                if pkt.header.type == PKT_TYPE and pkt.header.len >= STAMP_LEN:
+                    stats.record(pkt.payload)
+
+
+def connect(port, timeout=10.0):
+    """Connect to sfwd (retry until it is up)."""
+    t = time.monotonic() + timeout
+    while True:
+        try:
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+        except OSError:
+            if time.monotonic() > t:
+                raise
+            time.sleep(0.1)
+
+
+def freePort():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def runBench(size, rate, duration, directions, numClients, drain, verbose, sfwdArgs=()):
+    """Run one benchmark, return dict with results per direction."""
+    stats = {UP: Direction('up'), DOWN: Direction('down')}
+    emu = ModemEmulator(id=1)
+    dev = emu.openPty()
+
+    def hostRx(pkt):
+        if pkt.header.type == PKT_TYPE and pkt.header.len >= STAMP_LEN:
+            stats[DOWN].record(pkt.payload)
+    emu.hostRxCallback = hostRx
+
+    # start forwarder in a scratch dir (it writes log files)
+    port = freePort()
+    env = dict(os.environ)
+    env['PYTHONPATH'] = LIB + os.pathsep + env.get('PYTHONPATH', '')
+    tmp = tempfile.TemporaryDirectory()
+    out = None if verbose else subprocess.DEVNULL
+    proc = subprocess.Popen([sys.executable, SFWD, '-i', '127.0.0.1', '-p', str(port)] + list(sfwdArgs) + [dev],
+                            cwd=tmp.name, env=env, stdout=out, stderr=out)
+
+    stop = threading.Event()
+    clients = []
+    threads = []
+    try:
+        for _ in range(numClients):
+            sock = connect(port)
+            clients.append(sock)
+            th = threading.Thread(target=clientRx, args=(sock, stats[UP], stop), daemon=True)
+            th.start()
+            threads.append(th)
+        time.sleep(0.5)  # let sfwd accept the connections
+
+        def sendUp(seq):
+            pkt = makePacket(src=2, dst=255, pkt_type=PKT_TYPE, dsn=seq % 256,
+                             payload=stampedPayload(UP, seq, size))
+            stats[UP].sent += numClients  # every client should receive it
+            emu.receive(pkt)
+
+        def sendDown(seq):
+            sock = clients[seq % numClients]
+            pkt = makePacket(src=0, dst=255, pkt_type=PKT_TYPE, dsn=seq % 256,
+                             payload=stampedPayload(DOWN, seq, size))
+            stats[DOWN].sent += 1
+            sock.sendall(Streamer().enc(getBytes(pkt)))
+
+        senders = []
+        if 'up' in directions:
+            senders.append(threading.Thread(target=pace, args=(rate, duration, sendUp)))
+        if 'down' in directions:
+            senders.append(threading.Thread(target=pace, args=(rate, duration, sendDown)))
+        for th in senders:
+            th.start()
+        for th in senders:
+            th.join()
+        time.sleep(drain)  # wait for packets in flight
+    finally:
+        stop.set()
+        for th in threads:
+            th.join()
+        for sock in clients:
+            sock.close()
+        proc.terminate()
+        try:
+            proc.wait(5.0)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        emu.close()
+        tmp.cleanup()
+
+    return {s.name: s.report(duration) for s in stats.values() if s.name in directions}
+
+
+def printResult(size, rate, res):
+    for (name, r) in res.items():
+        lat = ' '.join('p%s=%s' % (p, '%.2fms' % r['p' + p] if r['p' + p] is not None else 'n.a.')
+                       for p in ('50', '90', '99', '100'))
+        print("%4uB @ %6.1f/s %-4s: sent %6u recv %6u drop %5u | %8.1f pkt/s %10.0f B/s | %s" % (
+            size, rate, name, r['sent'], r['received'], r['dropped'], r['pktPerSec'], r['bytesPerSec'], lat))
+
+
+if __name__ == "__main__":
+    ##
+    # process command lines arguments
+    ##
+
+    parser = argparse.ArgumentParser(
+        description="AHOI serial forwarder benchmark.",
+        epilog="""\
+          Runs sfwd between an emulated modem (pty) and TCP clients and
+          measures one-way latency, throughput and drops. Arguments
+          after -- are passed to sfwd, e.g. sfwdBench.py -r 50 -- -r -q""")
+
+    parser.add_argument(
+        '-s', '--size',
+        type=int,
+        nargs='+',
+        default=[32],
+        dest='sizes',
+        help='payload size(s) in bytes (default: 32, %u to 255)' % STAMP_LEN
+    )
+
+    parser.add_argument(
+        '-r', '--rate',
+        type=float,
+        nargs='+',
+        default=[5.0],
+        dest='rates',
+        help='packet rate(s) per direction in packets per second (default: 5)'
+    )
+
+    parser.add_argument(
+        '-d', '--duration',
+        type=float,
+        default=10.0,
+        dest='duration',
+        help='duration of each run in seconds (default: 10)'
+    )
+
+    parser.add_argument(
+        '-w', '--direction',
+        type=str,
+        choices=['up', 'down', 'both'],
+        default='both',
+        dest='direction',
+        help='up: modem to clients, down: clients to modem (default: both)'
+    )
+
+    parser.add_argument(
+        '-n', '--clients',
+        type=int,
+        default=1,
+        dest='clients',
+        help='number of TCP clients (default: 1)'
+    )
+
+    parser.add_argument(
+        '--drain',
+        type=float,
+        default=2.0,
+        dest='drain',
+        help='time to wait for packets in flight after sending in seconds (default: 2)'
+    )
+
+    parser.add_argument(
+        '-o', '--output',
+        type=str,
+        default=None,
+        dest='output',
+        help='save results as JSON'
+    )
+
+    parser.add_argument(
+        '-a', '--sfwd-args',
+        type=str,
+        default='',
+        dest='sfwdArgs',
+        help='extra arguments passed to sfwd, as one argument (use -a="-r -q" if they start with -)'
+    )
+
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        dest='verbose',
+        help='show output of sfwd'
+    )
+
+    parser.add_argument(
+        nargs=argparse.REMAINDER,
+        dest='sfwdRest',
+        metavar='-- SFWD_ARGS',
+        help='extra arguments passed to sfwd (after --)'
+    )
+
+    args = parser.parse_args()
+    sfwdArgs = args.sfwdArgs.split() + args.sfwdRest[(1 if args.sfwdRest[0:1] == ['--'] else 0):]
+
+    directions = ['up', 'down'] if args.direction == 'both' else [args.direction]
+    results = []
+    for size in args.sizes:
+        size = min(max(size, STAMP_LEN), 255)
+        for rate in args.rates:
+            res = runBench(size, rate, args.duration, directions,
+                           args.clients, args.drain, args.verbose, sfwdArgs)
+            printResult(size, rate, res)
+            results.append({'size': size, 'rate': rate, 'clients': args.clients, 'results': res})
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("saved results to %s" % args.output)
+
+# eof
@@ -0,0 +1,139 @@
+#! /usr/bin/env python3
+
+#
+# Copyright 2019-2020
+# 
+# Bernd-Christian Renner and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""This is the ahoi startup benchmark (start-up time of mosh and import times)."""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from ahoi.bench import runner
+
+APPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LIB = os.path.join(APPS, '..', 'lib')
+
+# modules that are slow to load and should only be imported when used
+HEAVY = ['serial', 'socket', 'numpy', 'matplotlib', 'pygame', 'PIL', 'picamera']
+
+MODULES = [
+    'ahoi.modem.modem',
+    'ahoi.handlers.RangingHandler',
+    'ahoi.handlers.SamplePlotHandler',
+    'ahoi.imgtx.imgtx',
+]
+
+IMPORT_PROBE = """\
+import sys, time
+t = time.perf_counter()
+import %s
+t = time.perf_counter() - t
+print(t)
+print(' '.join(m for m in %r if m in sys.modules))
+"""
+
+
+def env():
+    e = dict(os.environ)
+    e['PYTHONPATH'] = LIB + os.pathsep + e.get('PYTHONPATH', '')
+    return e
+
+
+def timeCmd(cmd, num):
+    """Run cmd num times, return sorted wall-clock times (s)."""
+    times = []
+    for _ in range(num):
+        t = time.perf_counter()
+        subprocess.run(cmd, env=env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - t)
+    return sorted(times)
+
+
+def timeImport(module, num):
+    """Import module in fresh interpreters, return sorted times and loaded heavy modules."""
+    times = []
+    loaded = ''
+    for _ in range(num):
+        res = subprocess.run([sys.executable, '-c', IMPORT_PROBE % (module, HEAVY)],
+                             env=env(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             universal_newlines=True)
+        lines = res.stdout.splitlines()
+        if res.returncode != 0 or len(lines) < 1:
+            return None, 'import failed'
+        times.append(float(lines[0]))
+        loaded = lines[1] if len(lines) > 1 else ''
+    return sorted(times), loaded
+
+
+def printTimes(name, times, extra=''):
+    print("%-36s median %7.1f ms  min %7.1f ms  %s" % (
+        name, runner.percentile(times, 50) * 1e3, times[0] * 1e3, extra))
+
+
+if __name__ == "__main__":
+    ##
+    # process command lines arguments
+    ##
+
+    parser = argparse.ArgumentParser(
+        description="AHOI startup benchmark.",
+        epilog="""\
+          Measures start-up time of mosh and import times of library modules,
+          and lists slow-to-load modules pulled in by each import.""")
+
+    parser.add_argument(
+        '-n', '--num',
+        type=int,
+        default=10,
+        dest='num',
+        help='number of runs (default: 10)'
+    )
+
+    args = parser.parse_args()
+
+    printTimes('python (interpreter only)', timeCmd([sys.executable, '-c', 'pass'], args.num))
+    printTimes('mosh --help', timeCmd([sys.executable, os.path.join(APPS, 'mosh', 'mosh.py'), '--help'], args.num))
+
+    for m in MODULES:
+        times, loaded = timeImport(m, args.num)
+        if times is None:
+            print("%-36s %s" % ('import ' + m, loaded))
+            continue
+        printTimes('import ' + m, times, ('loads: ' + loaded) if loaded else '')
+
+# eof
@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+
+#
+# Copyright 2019-2020
+# 
+# Bernd-Christian Renner and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""This is the ahoi modem emulator (software stand-in for a modem)."""
+
+import argparse
+import signal
+import time
+
+from ahoi.sim.emulator import ModemEmulator
+
+emu = None
+running = True
+
+
+def sigInt_handler(signal, frame):
+    # finish up
+    global running
+    print('Received SIGINT, closing ...')
+    running = False
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, sigInt_handler)
+
+    ##
+    # process command lines arguments
+    ##
+
+    parser = argparse.ArgumentParser(
+        description="AHOI modem emulator.",
+        epilog="""\
+          Connect with e.g. 'mosh.py <pty>' or 'mosh.py tcp@localhost:<port>'.""")
+
+    parser.add_argument(
+        '-p', '--port',
+        type=int,
+        default=None,
+        dest='port',
+        help='serve via TCP at this port instead of a pseudo-terminal (0 for any free port)'
+    )
+
+    parser.add_argument(
+        '-i', '--ip',
+        type=str,
+        default='127.0.0.1',
+        dest='ip',
+        help='TCP host (IP) address (default: 127.0.0.1)'
+    )
+
+    parser.add_argument(
+        '--id',
+        type=int,
+        default=0,
+        dest='id',
+        help='modem id (default: 0)'
+    )
+
+    parser.add_argument(
+        '-l', '--latency',
+        type=float,
+        default=0.0,
+        dest='latency',
+        help='command processing latency in seconds (default: 0)'
+    )
+
+    parser.add_argument(
+        '--peer',
+        type=str,
+        action='append',
+        default=[],
+        dest='peers',
+        metavar='ID:DISTANCE',
+        help='virtual peer answering acks and ranging requests (distance in m), may be repeated'
+    )
+
+    args = parser.parse_args()
+
+    emu = ModemEmulator(args.id, args.latency)
+    for p in args.peers:
+        pid, dist = p.split(':')
+        emu.addPeer(int(pid), float(dist))
+
+    if args.port is None:
+        dev = emu.openPty()
+        print("Emulated modem %u available at %s" % (args.id, dev))
+    else:
+        host, port = emu.listen(args.ip, args.port)
+        print("Emulated modem %u available at tcp@%s:%u" % (args.id, host, port))
+
+    while running:
+        time.sleep(0.1)
+
+    emu.close()
+
+# eof
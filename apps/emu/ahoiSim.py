@@ -0,0 +1,151 @@
+#! /usr/bin/env python3
+
+#
+# Copyright 2019-2020
+# 
+# Bernd-Christian Renner and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""This is the ahoi network simulator (emulated modems on a shared channel)."""
+
+import argparse
+import configparser
+import math
+import signal
+import time
+
+from ahoi.sim.channel import AcousticChannel
+
+running = True
+
+
+def sigInt_handler(signal, frame):
+    # finish up
+    global running
+    print('Received SIGINT, closing ...')
+    running = False
+
+
+def readNodes(config):
+    """Read node list (id, x, y, z) from config."""
+    nodes = []
+    n = 0
+    while True:
+        key = 'node[%u]' % n
+        if key not in config['NODES']:
+            break
+        vals = list(map(float, config['NODES'][key].split(',')))
+        nodes.append((int(vals[0]), vals[1], vals[2], vals[3]))
+        n = n + 1
+    return nodes
+
+
+def gridNodes(num, spacing):
+    """Place num nodes (ids 1..num) on a square grid."""
+    cols = int(math.ceil(math.sqrt(num)))
+    return [(i + 1, (i % cols) * spacing, (i // cols) * spacing, 1.0) for i in range(num)]
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, sigInt_handler)
+
+    ##
+    # process command lines arguments
+    ##
+
+    parser = argparse.ArgumentParser(
+        description="AHOI network simulator.",
+        epilog="""\
+          Each node is an emulated modem, reachable via a pseudo-terminal or TCP.""")
+
+    parser.add_argument(
+        '-c', '--config',
+        type=str,
+        default='config/default.ini',
+        dest='confFile',
+        help='config file (default: config/default.ini)'
+    )
+
+    parser.add_argument(
+        '-n', '--nodes',
+        type=int,
+        default=0,
+        dest='num',
+        help='place this many nodes on a grid instead of using the nodes from the config'
+    )
+
+    parser.add_argument(
+        '-s', '--spacing',
+        type=float,
+        default=100.0,
+        dest='spacing',
+        help='grid spacing in m (default: 100)'
+    )
+
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.confFile)
+
+    sos = config['CHANNEL'].getfloat('speedOfSound')
+    loss = config['CHANNEL'].getfloat('loss')
+    maxRange = config['CHANNEL'].getfloat('maxRange')
+    basePort = config['NETWORK'].getint('basePort')
+    latency = config['NETWORK'].getfloat('latency')
+
+    if args.num > 0:
+        nodes = gridNodes(args.num, args.spacing)
+    else:
+        nodes = readNodes(config)
+
+    # set up channel and nodes
+    channel = AcousticChannel(sos, loss, maxRange if maxRange > 0 else None)
+    for i, (nid, x, y, z) in enumerate(nodes):
+        node = channel.addNode(nid, x, y, z, latency)
+        if basePort > 0:
+            host, port = node.listen('127.0.0.1', basePort + i)
+            dev = "tcp@%s:%u" % (host, port)
+        else:
+            dev = node.openPty()
+        print("node %3u @ (%7.1f,%7.1f,%5.1f): %s" % (nid, x, y, z, dev))
+
+    # run until interrupted, show channel statistics from time to time
+    t = 0
+    while running:
+        time.sleep(0.1)
+        t = t + 1
+        if t % 100 == 0:
+            print("channel: %s" % ", ".join("%s=%u" % kv for kv in channel.stats.items()))
+
+    channel.close()
+
+# eof
@@ -41,13 +41,12 @@ from __future__ import print_function
 
 from typing import Union
 
-import numpy as np
-
 import threading
 import configparser
 import struct
 
 from ahoi.modem.modem import Modem
+from ahoi.loc.lateration import laterate
 
 
 class Anchor3D:
@@ -75,7 +74,7 @@ class Robot:
         # connect to modem
         self.modem = Modem()
         self.modem.connect(com)
-        self.modem.addRxCallback(self.__handlePkt)
+        self.modem.addRxCallback(self.__handlePkt, type=0x7F)
         self.modem.setTxEcho(True)
         self.modem.setRxEcho(True)
         self.modem.receive(True)  # receive non-blocking (as thread)
@@ -126,22 +125,7 @@ class Robot:
             print("cannot determine position with less than 3 anchors!")  # TODO raise error
             return
 
-        ## prepare matrix
-        M = np.empty([N - 1, 2], dtype=float)   # type: np.ndarray
-        b = np.empty([N - 1, 1], dtype=float)   # type: np.ndarray
-        a0 = self.A[R[0]]
-        rr0 = -a0.d ** 2 + (a0.z - self.z) ** 2 + a0.x ** 2 + a0.y ** 2
-        for i in range(1, N):
-            ai = self.A[R[i]]
-            rri = ai.d ** 2 - (ai.z - self.z) ** 2
-            M[i - 1][0] = 2 * (a0.x - ai.x)
-            M[i - 1][1] = 2 * (a0.y - ai.y)
-            b[i - 1] = rri + rr0 - a0.x ** 2 - ai.y ** 2
-            #print(M[i-1], b[i-1])
-
-        ## solve with BLAS
-        self.x, self.y = np.linalg.lstsq(M, b, rcond=None)[0]
-        ###px, py = np.linalg.lstsq(M, b, rcond=0.0)[0]
+        self.x, self.y = laterate([(self.A[i].x, self.A[i].y, self.A[i].z, self.A[i].d) for i in R], self.z)
         print("estimated position: %g, %g" % (self.x, self.y))
 
     # handle ranging acks
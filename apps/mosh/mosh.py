@@ -53,6 +53,7 @@ except ImportError:
 
 # modem and serial connection
 from ahoi.modem.modem import Modem
+from ahoi.metrics import trace
 
 # handlers
 # from ahoi.handlers.SamplePlotHandler import SamplePlotHandler
@@ -164,6 +165,11 @@ cmdList = {
         'param': 'chips:int',
         'info': "Get/set number of chips (spreading factor) per symbol."
     },
+    "flowctrl": {
+        'func': "doFlowCtrl",
+        'param': '[mode:(off/signal/ack) [window:int [gap:float]]]',
+        'info': "Pace sent packets by the modem's packet queue instead of fixed delays. 'signal' sets the pkt pin to queue state mode and polls the serial control line it is wired to, 'ack' allows 'window' unacknowledged packets; packets that will not be acked (no ack requested, broadcasts) count as unacknowledged for 'gap' seconds (default: 1.0, about a packet's airtime). Use with a 'sendrep' delay of 0 to send as fast as the modem can take packets."
+    },
     "filterraw": {
         'func': "doFilterRaw",
         'param': '[stage:int value:int]',
@@ -300,6 +306,11 @@ cmdList = {
         'param': '[duration:uint<100>]',
         'info': "Play an audible test sound (ca. 4kHz) for duration/100 s"
     },
+    "trace": {
+        'func': "doTrace",
+        'param': 'on [size:uint<65536>] | off | dump file:string',
+        'info': "Trace received packets through reading, decoding and handlers (keeping the last size events) and dump the trace as JSON for chrome://tracing or ui.perfetto.dev"
+    },
     "batvol": {
         'func': "doBatVol",
         'param': '',
@@ -467,6 +478,26 @@ def doFilterRaw(inp):
     return myModem.filterRaw(stage, level)
 
 
+def doFlowCtrl(inp):
+    """Set flow control mode."""
+    mode = None
+    window = 1
+    gap = 1.0
+    if len(inp) > 1:
+        param = inp[1].split(' ')
+        if len(param) > 3:
+            return -1
+        if param[0] in ['signal', 'ack']:
+            mode = param[0]
+        elif param[0] != 'off':
+            return -1
+        if len(param) >= 2:
+            window = int(param[1])
+        if len(param) == 3:
+            gap = float(param[2])
+    return myModem.setFlowControl(mode, window, gap=gap)
+
+
 def doFreqBands(inp):
     """Get/Set freq band setup."""
     print("WARNING: setter not implemented")
@@ -949,6 +980,35 @@ def doTestSound(inp):
     return myModem.testSound(dur)
 
 
+def doTrace(inp):
+    """Turn packet tracing on/off or dump trace to file."""
+    if len(inp) < 2:
+        return -1
+
+    param = inp[1].split(' ')
+    if param[0] == 'on' and len(param) <= 2:
+        size = trace.DFLT_SIZE if len(param) == 1 else int(param[1])
+        if size <= 0:
+            return -1
+        trace.enable(size)
+        return 0
+    if param[0] == 'off' and len(param) == 1:
+        trace.disable()
+        return 0
+    if param[0] == 'dump' and len(param) == 2:
+        if trace.tracer is None:
+            print("ERROR: tracing is off")
+            return 0
+        try:
+            n = trace.tracer.dump(param[1])
+        except OSError as e:
+            print("ERROR: cannot write trace: %s" % str(e))
+            return 0
+        print("wrote %u events to %s" % (n, param[1]))
+        return 0
+    return -1
+
+
 def doTxGain(inp):
     """Get/set Tx gain."""
     value = None
@@ -1113,20 +1173,29 @@ if __name__ == "__main__":
           NOTE: no security measures are implemented.
           Input is not validated.""")
 
+    parser.add_argument(
+        '-c', '--cache',
+        action='store_true',
+        dest='cache',
+        help='answer get commands from cached config values where possible'
+    )
+
     parser.add_argument(
         nargs='?',
         type=str,
         default=None,
         dest='dev',
         metavar='device',
-        help='device name with connected ahoi modem')
+        help='device name with connected ahoi modem, tcp@host[:port], or URI (e.g. serial:///dev/ttyUSB0?baudrate=115200, tcp://host:port?reconnect=0, unix:///tmp/ahoi.sock, replay:///path/to/log, sim://?id=1; reconnect=N retries N times, 0 forever)')
 
     args = parser.parse_args()
 
     # create modem instance and connect
     myModem = Modem()
-    myModem.connect(args.dev)
+    if not myModem.connect(args.dev):
+        parser.error("cannot connect to modem at %s" % args.dev)
     dev = myModem.com.dev
+    myModem.setConfigCache(args.cache)
     myModem.setTxEcho(True)
     myModem.setRxEcho(True)
     # myModem.addRxCallback(printRxRaw)
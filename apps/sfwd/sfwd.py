@@ -38,27 +38,65 @@
 """This is the ahoi serial forwarder (TCP to serial translator)."""
 
 import argparse
+import os
 import signal
 import threading
 import time
 
 from ahoi.com.serial import ModemSerialCom
 from ahoi.com.socket import ModemSocketCom
+from ahoi.com.forwarder import Forwarder, Link, Tap
+from ahoi.com.reconnect import ReconnectPolicy
+from ahoi.modem.packet import makePacket
+
+# optional features (server, beacon, multicast, shared memory, metrics)
+# are imported when used
 
 sock = None
 com = None
 sockThread = None
+fwd = None
+beacon = None
+rings = []
+
+
+def parseDevices(devs, port):
+    """Split 'device[:port]' arguments, consecutive ports by default."""
+    if port is None:
+        port = ModemSocketCom.DFLT_PORT
+    res = []
+    for d in devs:
+        dev, _, p = d.rpartition(':')
+        if dev and p.isdigit():
+            port = int(p)
+        else:
+            dev = d
+        res.append((dev, port))
+        port += 1
+    return res
+
+
+def sigUsr1_handler(signal, frame):
+    if fwd is not None:
+        fwd.printStats()
 
 
 def sigInt_handler(signal, frame):
     # finish up
     print('Received SIGINT, closing ...')
+    if beacon is not None:
+        beacon.close()
+    if fwd is not None:
+        fwd.close()
+        return
     if sock is not None:
         sock.close()
     if com is not None:
         com.close()
     if sockThread is not None:
         sockThread.join()
+    for r in rings:
+        r.close()
     exit()
 
 
@@ -92,30 +130,270 @@ if __name__ == "__main__":
     )
 
     parser.add_argument(
+        '-u', '--unix',
+        type=str,
+        default=None,
+        dest='unix',
+        metavar='PATH',
+        help='also accept clients at Unix socket PATH (several modems: PATH.PORT)'
+    )
+
+    parser.add_argument(
+        '-n', '--clients',
+        type=int,
+        default=16,
+        dest='clients',
+        help='maximum number of TCP clients (default: 16)'
+    )
+
+    parser.add_argument(
+        '-s', '--slow',
+        type=str,
+        choices=['disconnect', 'throttle'],
+        default=None,
+        dest='slow',
+        help='handling of clients that cannot keep up: disconnect them or skip packets '
+             '(not in raw mode, default: disconnect)'
+    )
+
+    parser.add_argument(
+        '-r', '--raw',
+        action='store_true',
+        dest='raw',
+        help='forward raw bytes without decoding packets (lowest latency)'
+    )
+
+    parser.add_argument(
+        '-d', '--txdelay',
+        type=float,
+        default=None,
+        dest='txDelay',
+        help='minimum gap between packets to the modem in seconds (raw mode only, default: 0.1)'
+    )
+
+    parser.add_argument(
+        '-q', '--nolog',
+        action='store_true',
+        dest='nolog',
+        help='do not log packets (raw mode only)'
+    )
+
+    parser.add_argument(
+        '-t', '--stats',
+        type=float,
+        default=0,
+        dest='stats',
+        help='print statistics every STATS seconds (raw mode only, default: 0 = off)'
+    )
+
+    parser.add_argument(
+        '-R', '--reconnect',
+        action='store_true',
+        dest='reconnect',
+        help='keep running and reconnect if the modem is disconnected (not in raw mode)'
+    )
+
+    parser.add_argument(
+        '-m', '--multicast',
+        type=str,
         nargs='?',
+        const='239.255.24.64:2466',
+        default=None,
+        dest='multicast',
+        metavar='GROUP[:PORT]',
+        help='publish received packets to UDP multicast group (default: %(const)s, '
+             'several modems: consecutive ports)'
+    )
+
+    parser.add_argument(
+        '--multicast-iface',
         type=str,
         default=None,
-        dest='dev',
-        metavar='device',
-        help='device name with connected ahoi modem')
+        dest='mcastIface',
+        metavar='ADDR',
+        help='address of interface to publish multicast on (default: by route, 127.0.0.1 for local testing)'
+    )
+
+    parser.add_argument(
+        '--shm',
+        type=str,
+        default=None,
+        dest='shm',
+        metavar='NAME',
+        help='publish received packets to shared memory ring NAME (for shm://NAME, '
+             'several modems: NAME.PORT)'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        type=int,
+        default=None,
+        dest='metrics',
+        metavar='PORT',
+        help='serve metrics (Prometheus text format) via HTTP at PORT'
+    )
+
+    parser.add_argument(
+        '-b', '--beacon',
+        type=float,
+        default=None,
+        dest='beacon',
+        metavar='INTERVAL',
+        help='announce gateway via UDP beacons every INTERVAL seconds '
+             '(0: answer discovery queries only, default: off)'
+    )
+
+    parser.add_argument(
+        '--beacon-addr',
+        type=str,
+        default='<broadcast>',
+        dest='beaconAddr',
+        help='address to send beacons to (default: broadcast, 127.255.255.255 for local testing)'
+    )
+
+    parser.add_argument(
+        '--beacon-port',
+        type=int,
+        default=2465,
+        dest='beaconPort',
+        help='UDP port of beacons (default: %(default)s)'
+    )
+
+    parser.add_argument(
+        nargs='*',
+        type=str,
+        dest='devs',
+        metavar='device[:port]',
+        help='device name(s) with connected ahoi modem, optionally with TCP port '
+             '(default: consecutive ports starting at --port)')
 
     args = parser.parse_args()
 
     # setup serial connection
-    if args.dev is None:
-        args.dev = ModemSerialCom.scanAndSelect()
+    if len(args.devs) == 0:
+        args.devs = [ModemSerialCom.scanAndSelect()]
+    devs = parseDevices(args.devs, args.port)
+
+    t = time.strftime("%Y%m%d-%H%M%S")
+
+    # several modems are always served in raw mode
+    raw = args.raw or len(devs) > 1
+    if raw and args.slow is not None:
+        parser.error("-s/--slow is not supported in raw mode (-r or several modems)")
+    if raw and args.reconnect:
+        parser.error("-R/--reconnect is not supported in raw mode (-r or several modems)")
+    if not raw and (args.txDelay is not None or args.nolog or args.stats > 0):
+        parser.error("-d/--txdelay, -q/--nolog and -t/--stats need raw mode (-r or several modems)")
+
+    if args.shm is not None:
+        try:
+            from ahoi.com.shmring import ShmRingWriter
+        except ImportError:
+            parser.error("--shm needs Python 3.8 or newer (multiprocessing.shared_memory)")
 
-    com = ModemSerialCom(args.dev)
+    if args.beacon is not None:
+        from ahoi.com.beacon import Beacon
+        beacon = Beacon(args.beaconAddr, args.beaconPort, args.beacon)
+
+    if args.metrics is not None:
+        from ahoi.metrics.exporter import MetricsServer
+        MetricsServer(args.ip, args.metrics).start()
+
+    if args.multicast is not None:
+        from ahoi.com.multicast import MulticastPublisher, MCAST_PORT
+        mcastGroup, _, mcastPort = args.multicast.partition(':')
+        mcastPort = int(mcastPort) if mcastPort else MCAST_PORT
+
+    # requests to learn firmware version and id of modems for beacons
+    queries = [makePacket(pkt_type=0x80), makePacket(pkt_type=0x84)]
+
+    if raw:
+        # single loop forwarding bytes of all modems, packets are logged by
+        # one tap thread
+        if not args.raw:
+            print("Serving several modems, using raw mode")
+        signal.signal(signal.SIGUSR1, sigUsr1_handler)
+        tap = None if args.nolog and beacon is None and args.multicast is None and args.shm is None else Tap()
+        fwd = Forwarder()
+        for (i, (dev, port)) in enumerate(devs):
+            unixPath = args.unix
+            if unixPath is not None and len(devs) > 1:
+                unixPath = "%s.%u" % (unixPath, port)
+            link = Link(dev, host=args.ip, port=port, maxClients=args.clients,
+                        txDelay=args.txDelay, tap=tap, unixPath=unixPath)
+            if not fwd.add(link):
+                continue
+            rxCbs = []
+            if beacon is not None:
+                rxCbs.append(beacon.add(port).snoop)
+                for pkt in queries:
+                    link.send(pkt)
+            if args.multicast is not None:
+                rxCbs.append(MulticastPublisher(mcastGroup, mcastPort + i, iface=args.mcastIface).publishPkt)
+            if args.shm is not None:
+                rings.append(ShmRingWriter(args.shm if len(devs) == 1 else "%s.%u" % (args.shm, port)))
+                rxCbs.append(rings[-1].publishPkt)
+
+            def rxCb(pkt, cbs=rxCbs):
+                for cb in cbs:
+                    cb(pkt)
+            if args.nolog:
+                link.logOn(None, None, rxCb)
+            elif len(devs) == 1:
+                link.logOn("sfwd-" + t + ".tcp.log", "sfwd-" + t + ".serial.log", rxCb)
+            else:
+                name = os.path.basename(dev)
+                link.logOn("sfwd-" + t + "-" + name + ".tcp.log", "sfwd-" + t + "-" + name + ".serial.log", rxCb)
+        if len(fwd.links) == 0:
+            print("ERROR: cannot serve any modem")
+            exit(1)
+        if beacon is not None:
+            beacon.start()
+        if args.stats > 0:
+            fwd.every(args.stats, fwd.printStats)
+        fwd.run()
+        fwd.printStats()
+        if tap is not None:
+            tap.close()
+        if beacon is not None:
+            beacon.close()
+        for r in rings:
+            r.close()
+        exit()
+
+    com = ModemSerialCom(devs[0][0])
+    if args.multicast is not None:
+        com.addTelemetry(MulticastPublisher(mcastGroup, mcastPort, iface=args.mcastIface))
+    if args.shm is not None:
+        rings.append(ShmRingWriter(args.shm))
+        com.addTelemetry(rings[-1])
+    if args.reconnect:
+        com.setReconnectPolicy(ReconnectPolicy(maxDelay=5.0))
 
     # setup tcp connection
-    sock = ModemSocketCom(port=args.port, host=args.ip)
+    from ahoi.com.server import ModemSocketServer
+    sock = ModemSocketServer(port=devs[0][1], host=args.ip, maxClients=args.clients,
+                             policy=args.slow if args.slow is not None else ModemSocketServer.DISCONNECT,
+                             unixPath=args.unix)
 
     # cross connect
-    com.connect(sock.send)
+    if beacon is not None:
+        entry = beacon.add(devs[0][1])
+
+        def rxPkt(pkt):
+            entry.snoop(pkt)
+            sock.send(pkt)
+        com.connect(rxPkt)
+    else:
+        com.connect(sock.send)
     sock.start(com.send)
 
+    if beacon is not None:
+        for pkt in queries:
+            com.send(pkt)
+        beacon.start()
+
     # logging
-    t = time.strftime("%Y%m%d-%H%M%S")
     com.logOn("sfwd-" + t + ".tcp.log")
     sock.logOn("sfwd-" + t + ".serial.log")
 
@@ -131,5 +409,9 @@ if __name__ == "__main__":
 
     sock.close()
     com.close()
+    if beacon is not None:
+        beacon.close()
+    for r in rings:
+        r.close()
 
 # eof
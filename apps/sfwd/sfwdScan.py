@@ -35,11 +35,74 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-"""This is Modem Shell (mosh)."""
+"""This is the ahoi serial forwarder scanner (finds sfwd gateways in the local network)."""
+
+import argparse
 
 from ahoi.com.socket import ModemSocketCom
 
 if __name__ == "__main__":
-    ModemSocketCom.scan()
+    parser = argparse.ArgumentParser(
+        description="AHOI serial forwarder scanner.",
+        epilog="""\
+          Probes all hosts of the local /24 network concurrently, or
+          collects UDP beacons of gateways.""")
+
+    parser.add_argument(
+        '-p', '--port',
+        type=int,
+        default=None,
+        dest='port',
+        help='TCP port (default: ' + str(ModemSocketCom.DFLT_PORT) + ')'
+    )
+
+    parser.add_argument(
+        '-t', '--timeout',
+        type=float,
+        default=0.5,
+        dest='timeout',
+        help='timeout per host in seconds (default: 0.5)'
+    )
+
+    parser.add_argument(
+        '-n', '--num',
+        type=int,
+        default=64,
+        dest='num',
+        help='maximum number of concurrent probes (default: 64)'
+    )
+
+    parser.add_argument(
+        '-V', '--verify',
+        action='store_true',
+        dest='verify',
+        help='only list hosts answering a version request'
+    )
+
+    parser.add_argument(
+        '-b', '--beacon',
+        action='store_true',
+        dest='beacon',
+        help='find gateways sending UDP beacons (sfwd -b) instead of probing'
+    )
+
+    parser.add_argument(
+        '-a', '--addr',
+        type=str,
+        default='<broadcast>',
+        dest='addr',
+        help='address to send beacon query to (default: broadcast)'
+    )
+
+    args = parser.parse_args()
+
+    if args.beacon:
+        gateways = ModemSocketCom.discover(args.timeout, args.addr)
+        for gw in gateways:
+            print("found %s:%u (id %s, %s)" % (gw.host, gw.port, '?' if gw.id is None else gw.id, gw.version))
+        print("found %u gateway(s)" % len(gateways))
+        exit()
+
+    ModemSocketCom.scan(port=args.port, timeout=args.timeout, maxConcurrent=args.num, verify=args.verify)
 
 # eof
@@ -166,6 +166,11 @@ def main():
     pktCount = testConfig['PARAMETERS'].getint('pktCount')
     pktType = int(testConfig['PARAMETERS']['pktType'], 16)
     sleepTime = testConfig['PARAMETERS'].getfloat('sleepTime')
+    flowControl = testConfig['PARAMETERS'].get('flowControl', 'off')
+    if flowControl != 'off':
+        if myModem.setFlowControl(flowControl) != 0:
+            myModem.close()
+            return
     payloadLen = list(map(int, testConfig['PARAMETERS']['payloadLength']
                           .split(',')))
     # filterS0   = testConfig['PARAMETERS']['filterS0'].split(',')
@@ -1,3 +1,20 @@
-from .com import streamer, socket, base, serial
-from .handlers import Handler, SampleHandler
-from .modem import packet, modem
+import importlib
+
+# submodules are loaded on first access (transports and handlers pull in
+# pyserial, sockets, etc., which makes start-up slow on small devices)
+_SUBMODULES = {
+    'streamer': 'ahoi.com.streamer',
+    'socket': 'ahoi.com.socket',
+    'base': 'ahoi.com.base',
+    'serial': 'ahoi.com.serial',
+    'Handler': 'ahoi.handlers.Handler',
+    'SampleHandler': 'ahoi.handlers.SampleHandler',
+    'packet': 'ahoi.modem.packet',
+    'modem': 'ahoi.modem.modem',
+}
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(_SUBMODULES[name])
+    raise AttributeError("module 'ahoi' has no attribute '%s'" % name)
@@ -0,0 +1,273 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module with benchmark cases for the hot paths of the library.
+
+Each case is set up with its input (mostly a list of raw packets, i.e.
+header, payload and footer bytes) and returns a callable plus the number
+of items it handles per call, or None if the input holds nothing to
+work on (e.g. a log without sample data).
+"""
+
+import io
+import os.path
+import random
+
+from ahoi.com.streamer import Streamer
+from ahoi.modem.packet import byteArrayToPacket, getBytes, packet2HexString
+
+IMG_FILE = os.path.join(os.path.dirname(__file__), '..', 'imgtx', 'helpers', 'images', 'underwater1_1920x1440.jpg')
+
+
+def synthetic(num=200, seed=0):
+    """Generate a mix of data packets (with footer) and command responses."""
+    rnd = random.Random(seed)
+    pkts = []
+    for i in range(num):
+        if i % 4 == 3:
+            # command response
+            t = rnd.choice([0x80, 0x94, 0x95, 0xA8, 0xC0])
+            payload = bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, 20)))
+            pkts.append(bytes([0, 0, t, 0, 0, len(payload)]) + payload)
+        else:
+            # data packet, payload with some DLEs to exercise stuffing
+            payload = bytes(rnd.choice([0x10, rnd.getrandbits(8)]) for _ in range(rnd.randint(0, 64)))
+            footer = bytes(rnd.getrandbits(8) for _ in range(6))
+            pkts.append(bytes([rnd.randint(1, 9), 255, rnd.randint(0, 0x7E), 0, i % 256, len(payload)]) + payload + footer)
+    return pkts
+
+
+def synthSamples(num=2000):
+    """Generate a sample recording (header plus data packets of type 0xA0)."""
+    pkts = [bytes([1, 0, 0xA0, 0, 0, 5, 0, num >> 8, num & 0xFF, 0, 0])]
+    data = bytearray()
+    for i in range(num):
+        data += ((i * 37) % 65536).to_bytes(2, 'big')
+    for i in range(0, len(data), 200):
+        chunk = data[i:i + 200]
+        pkts.append(bytes([1, 0, 0xA0, 0, 0, len(chunk)]) + chunk)
+    return pkts
+
+
+def loadLog(fileName):
+    """Load raw packets from a log file (as written by logOn)."""
+    pkts = []
+    with open(fileName, 'r') as f:
+        for l in f:
+            # first field is the timestamp, following ones are pkt octets
+            o = l.split()[1:]
+            if len(o) >= 6:
+                pkts.append(bytes.fromhex(''.join(o)))
+    return pkts
+
+
+def streamerDec(pkts):
+    """Streamer.dec on the encoded byte stream of all packets."""
+    s = Streamer()
+    stream = bytearray()
+    for p in pkts:
+        stream += s.enc(p)
+
+    def fn():
+        dec = s.dec
+        return [r for r in map(dec, stream) if r is not None]
+    return fn, len(pkts)
+
+
+def streamerEnc(pkts):
+    """Streamer.enc of every packet."""
+    s = Streamer()
+
+    def fn():
+        return [s.enc(p) for p in pkts]
+    return fn, len(pkts)
+
+
+def bytesToPacket(pkts):
+    """byteArrayToPacket of every packet."""
+    raw = [bytearray(p) for p in pkts]
+
+    def fn():
+        return [byteArrayToPacket(r) for r in raw]
+    return fn, len(pkts)
+
+
+def packetToBytes(pkts):
+    """getBytes of every packet."""
+    objs = [byteArrayToPacket(bytearray(p)) for p in pkts]
+
+    def fn():
+        return [getBytes(o) for o in objs]
+    return fn, len(pkts)
+
+
+def packetToHex(pkts):
+    """packet2HexString of every packet."""
+    objs = [byteArrayToPacket(bytearray(p)) for p in pkts]
+
+    def fn():
+        return [packet2HexString(o) for o in objs]
+    return fn, len(pkts)
+
+
+def modemDispatch(pkts):
+    """Modem receive path (dispatch to type-filtered and catch-all callbacks)."""
+    from ahoi.modem.modem import Modem
+
+    modem = Modem()
+    modem.setRxEcho(False)
+    cnt = [0]
+
+    def cb(pkt):
+        cnt[0] += 1
+    modem.addRxCallback(cb)
+    for t in (0x00, 0x7F, 0xA0, 0xC0):
+        modem.addRxCallback(cb, type=t)
+    rx = getattr(modem, '_Modem__receivePacket')
+    objs = [byteArrayToPacket(bytearray(p)) for p in pkts]
+
+    def fn():
+        for o in objs:
+            rx(o)
+    return fn, len(pkts)
+
+
+def sampleHandler(pkts):
+    """SampleHandler.handlePkt on a complete sample recording."""
+    from ahoi.handlers.SampleHandler import SampleHandler
+
+    objs = [byteArrayToPacket(bytearray(p)) for p in pkts]
+    objs = [o for o in objs if o.header.type == 0xA0 and o.header.len > 0]
+    if len(objs) == 0 or objs[0].header.len != 5:
+        return None
+
+    def fn():
+        h = SampleHandler()
+        for o in objs:
+            h.handlePkt(o)
+        return h.data
+    return fn, len(objs)
+
+
+def _encodeJpeg(img):
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=25, progressive=True, optimize=True, subsampling=2)
+    return buf.getvalue()
+
+
+def synthJpeg():
+    """Generate a progressive JPEG image (as sent by imgtx)."""
+    from PIL import Image
+
+    img = Image.new('RGB', (320, 240))
+    img.putdata([((x * 7) % 256, (y * 3) % 256, (x * y) % 256) for y in range(240) for x in range(320)])
+    return _encodeJpeg(img)
+
+
+def loadJpeg(fileName=IMG_FILE):
+    """Load an image and convert it to a progressive JPEG (as sent by imgtx)."""
+    from PIL import Image
+
+    img = Image.open(fileName)
+    return _encodeJpeg(img.resize((640, 480)))
+
+
+def synthAnchors():
+    """Generate 8 anchors with exact distances to a node at (30, 60, 10)."""
+    pos = (30.0, 60.0, 10.0)
+    anchors = [(0, 0, 1), (100, 0, 2), (0, 100, 3), (100, 100, 1),
+               (50, 0, 5), (0, 50, 4), (100, 50, 2), (50, 100, 3)]
+    return [(x, y, z, ((x - pos[0]) ** 2 + (y - pos[1]) ** 2 + (z - pos[2]) ** 2) ** 0.5)
+            for (x, y, z) in anchors], pos[2]
+
+
+def jfifSplit(jpeg):
+    """jfif_splitter._split of a progressive JPEG."""
+    from ahoi.imgtx.helpers.jfif_splitter import jfif_splitter
+
+    js = jfif_splitter(True)
+
+    def fn():
+        js.imgStream = io.BytesIO(jpeg)
+        js._split()
+    return fn, 1
+
+
+def jfifGetImage(jpeg):
+    """jfif_splitter.getImage (merge and decode) of a split JPEG."""
+    from ahoi.imgtx.helpers.jfif_splitter import jfif_splitter
+
+    js = jfif_splitter(True)
+    js.imgStream = io.BytesIO(jpeg)
+    js._split()
+
+    def fn():
+        img = js.getImage()
+        img.load()
+    return fn, 1
+
+
+def lateration(inp):
+    """Lateration with 4 and 8 anchors."""
+    from ahoi.loc.lateration import laterate
+
+    anchors, z = inp
+
+    def fn():
+        return laterate(anchors[:4], z), laterate(anchors, z)
+    return fn, 2
+
+
+# name, setup, synthetic input, kind of recorded input (None if n.a.)
+CASES = [
+    ('streamer.dec', streamerDec, synthetic, 'log'),
+    ('streamer.enc', streamerEnc, synthetic, 'log'),
+    ('packet.byteArrayToPacket', bytesToPacket, synthetic, 'log'),
+    ('packet.getBytes', packetToBytes, synthetic, 'log'),
+    ('packet.packet2HexString', packetToHex, synthetic, 'log'),
+    ('modem.dispatch', modemDispatch, synthetic, 'log'),
+    ('handlers.SampleHandler', sampleHandler, synthSamples, 'log'),
+    ('imgtx.jfif_splitter._split', jfifSplit, synthJpeg, 'image'),
+    ('imgtx.jfif_splitter.getImage', jfifGetImage, synthJpeg, 'image'),
+    ('loc.lateration', lateration, synthAnchors, None),
+]
+
+# loaders of recorded input (by kind), called with a file name
+RECORDED = {
+    'log': loadLog,
+    'image': loadJpeg
+}
+
+# eof
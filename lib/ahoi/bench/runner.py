@@ -0,0 +1,165 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for running benchmarks and comparing results to a baseline."""
+
+import json
+import platform
+import time
+import tracemalloc
+
+
+class Result:
+    """Result of one benchmark (one case with one input set)."""
+
+    def __init__(self, name, opsPerSec, allocBlocks, allocPeak, items=1):
+        self.name = name
+        self.opsPerSec = opsPerSec  # items per second
+        self.allocBlocks = allocBlocks  # memory blocks allocated per item
+        self.allocPeak = allocPeak  # peak traced memory per item (bytes)
+        self.items = items  # items per call (e.g. packets per stream)
+
+    def toDict(self):
+        return {
+            'opsPerSec': self.opsPerSec,
+            'allocBlocks': self.allocBlocks,
+            'allocPeak': self.allocPeak,
+            'items': self.items
+        }
+
+
+def timeit(fn, minTime=0.5):
+    """Call fn repeatedly for at least minTime seconds, return calls per second."""
+    # calibrate number of calls per round (avoid timer overhead)
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= 0.01:
+            break
+        n = n * 2
+
+    # best of several rounds
+    best = dt / n
+    t = dt
+    while t < minTime:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter() - t0
+        best = min(best, dt / n)
+        t = t + dt
+    return 1.0 / best
+
+
+def allocs(fn, num=20):
+    """Count allocations of fn (memory blocks and peak bytes per call)."""
+    fn()  # warm up (caches, lazy init)
+    keep = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        base = tracemalloc.get_traced_memory()[0]
+        for _ in range(num):
+            keep.append(fn())
+        peak = tracemalloc.get_traced_memory()[1] - base
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    # results are kept alive, so every allocation made for them is counted
+    blocks = sum(s.count_diff for s in after.compare_to(before, 'filename'))
+    return max(blocks, 0) / num, max(peak, 0) / num
+
+
+def run(name, fn, items=1, minTime=0.5):
+    """Benchmark fn handling items per call."""
+    ops = timeit(fn, minTime) * items
+    blocks, peak = allocs(fn)
+    return Result(name, ops, blocks / items, peak / items, items)
+
+
+def percentile(values, p):
+    """Get p-th percentile (0..100) of sorted values (nearest rank)."""
+    if len(values) == 0:
+        return 0.0
+    k = max(int(round(p / 100.0 * len(values))) - 1, 0)
+    return values[min(k, len(values) - 1)]
+
+
+def save(fileName, results):
+    """Save results (list of Result) as JSON."""
+    data = {
+        'meta': {
+            'time': time.time(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'platform': platform.platform()
+        },
+        'results': {r.name: r.toDict() for r in results}
+    }
+    with open(fileName, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load(fileName):
+    """Load results saved by save(), return dict name -> values."""
+    with open(fileName, 'r') as f:
+        data = json.load(f)
+    return data['results']
+
+
+def compare(results, baseline, threshold=0.2):
+    """Compare results to baseline, return list of regressions.
+
+    A regression is a drop in throughput or a rise in allocated blocks
+    by more than threshold (relative). Each entry is a tuple of
+    (name, metric, baseline value, new value).
+    """
+    regressions = []
+    for r in results:
+        if r.name not in baseline:
+            continue
+        b = baseline[r.name]
+        if r.opsPerSec < b['opsPerSec'] * (1.0 - threshold):
+            regressions.append((r.name, 'opsPerSec', b['opsPerSec'], r.opsPerSec))
+        # allow for one block of noise (e.g. a resized list)
+        if r.allocBlocks > b['allocBlocks'] * (1.0 + threshold) + 1:
+            regressions.append((r.name, 'allocBlocks', b['allocBlocks'], r.allocBlocks))
+    return regressions
+
+# eof
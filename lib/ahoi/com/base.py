@@ -37,12 +37,44 @@
 
 import time
 import os.path
+import struct
+import threading
+import collections
 from abc import ABC
 from io import TextIOWrapper
-from typing import Callable, Union
+from typing import Callable, Deque, Dict, List, Union
 
 from ahoi.modem.packet import packet2HexString, byteArrayToPacket, getBytes
 from ahoi.com.streamer import Streamer
+from ahoi.com.reconnect import ReconnectPolicy
+from ahoi.metrics import trace
+from ahoi.metrics.registry import REGISTRY, trackQueue
+
+BYTES = REGISTRY.counter('ahoi_bytes_total', 'Bytes read from (rx) or written to (tx) a connection', ('dev', 'dir'))
+FRAMES = REGISTRY.counter('ahoi_frames_total', 'Frames received (rx) or sent (tx)', ('dev', 'dir'))
+PACKETS = REGISTRY.counter('ahoi_rx_packets_total', 'Received packets by type', ('dev', 'type'))
+DECODE_ERRORS = REGISTRY.counter('ahoi_decode_errors_total', 'Received frames too short for a packet', ('dev',))
+
+
+class ComMetrics:
+    """Metric series of one connection."""
+
+    def __init__(self, dev):
+        self.dev = str(dev)
+        self.rxBytes = BYTES.labels(self.dev, 'rx')
+        self.txBytes = BYTES.labels(self.dev, 'tx')
+        self.rxFrames = FRAMES.labels(self.dev, 'rx')
+        self.txFrames = FRAMES.labels(self.dev, 'tx')
+        self.decodeErrors = DECODE_ERRORS.labels(self.dev)
+        self.types = {}  # type: Dict
+
+    def rxPacket(self, type):
+        """Count received packet of type."""
+        s = self.types.get(type)
+        if s is None:
+            s = PACKETS.labels(self.dev, '0x%02X' % type)
+            self.types[type] = s
+        s.inc()
 
 
 class ModemBaseCom(ABC):
@@ -53,15 +85,86 @@ class ModemBaseCom(ABC):
         self.rxCallback = cb    # type: Union[Callable, None]
         self.streamer = Streamer()  # type: Streamer
         self.logFile = None # type: Union[TextIOWrapper, None]
+        self.txLock = threading.Lock()  # serializes writes to the device
+        self.reconnectPolicy = None  # type: Union[ReconnectPolicy, None]
+        self.reconnectCb = None  # type: Union[Callable, None]  # called after reconnect (e.g., by modem)
+        self.txQueue = collections.deque()  # type: Deque[bytes]  # frames to send after reconnect
+        self.maxTxQueue = 64
+        self.closing = False
+        self.telemetry = []  # type: List  # publish received packets (e.g., MulticastPublisher)
+        self.metrics = None  # type: Union[ComMetrics, None]  # created on first use (dev may change until then)
 
     def __del__(self):
         """Close connection."""
         self.close()
 
     def connect(self, cb=None):
-        """Register callback."""
+        """Register callback, return success."""
         if cb is not None:
             self.rxCallback = cb
+        return True
+
+    def addTelemetry(self, publisher):
+        """Publish every received packet via publisher.publish(data)."""
+        self.telemetry.append(publisher)
+
+    def removeTelemetry(self, publisher):
+        """Stop publishing via publisher."""
+        if publisher in self.telemetry:
+            self.telemetry.remove(publisher)
+
+    def setReconnectPolicy(self, policy=None):
+        """Reconnect automatically as defined by policy (None to disable)."""
+        self.reconnectPolicy = policy
+        if policy is not None:
+            trackQueue('reconnect:%s' % self.dev, self, lambda c: len(c.txQueue))
+
+    def queueTx(self, tx):
+        """Keep encoded frame to be sent after reconnect (drops oldest if full)."""
+        if len(self.txQueue) >= self.maxTxQueue:
+            self.txQueue.popleft()
+            print("WARNING: tx queue full, dropping oldest packet")
+        self.txQueue.append(bytes(tx))
+
+    def retryConnect(self, openFn, initial=False):
+        """(Re)connect via openFn as defined by the reconnect policy, return success.
+
+        After a reconnect, queued frames are sent via flushTx() and the
+        reconnect callbacks are called.
+        """
+        policy = self.reconnectPolicy
+        if policy is None:
+            return False
+        if not initial:
+            print("Connection to %s lost, reconnecting" % self.dev)
+            if policy.onDisconnect is not None:
+                policy.onDisconnect(self)
+        attempts = policy.run(openFn, self, lambda: self.closing)
+        if attempts == 0:
+            return False
+        if not initial:
+            print("Reconnected to %s" % self.dev)
+            self.streamer = Streamer()  # drop partial frame
+            self.flushTx()
+            if self.reconnectCb is not None:
+                self.reconnectCb()
+            if policy.onReconnect is not None:
+                policy.onReconnect(self, attempts)
+        return True
+
+    def flushTx(self):
+        """Send frames queued while disconnected."""
+        while self.txQueue:
+            try:
+                self.writeRaw(self.txQueue[0])
+            except Exception as e:
+                print("WARNING: cannot send queued packet: " + str(e))
+                return
+            self.txQueue.popleft()
+
+    def writeRaw(self, tx):
+        """Write encoded data to the device."""
+        pass
 
     def close(self):
         """Terminate."""
@@ -73,16 +176,59 @@ class ModemBaseCom(ABC):
         """Receive a packet."""
         pass
 
+    def poll(self, timeout=0.0):
+        """Handle received data, waiting up to timeout (s) for it.
+
+        Return number of bytes handled, -1 if the connection is closed.
+        """
+        print("ERROR: %s does not support polling" % type(self).__name__)
+        return -1
+
+    def fileno(self):
+        """File descriptor that becomes readable on received data (None if there is none)."""
+        return None
+
     def send(self, pkt):
         """Send a packet."""
         pass
 
-    def processRx(self, rx):
-        """handle received bytes and decode packet"""
+    def processRx(self, rx, streamer=None, rxTime=None, rxWallTime=None):
+        """handle received bytes and decode packet
+
+        Packets are stamped with the time the bytes were read (now, if
+        rxTime and rxWallTime are not given, see Packet).
+        """
+        if rxTime is None:
+            rxTime = time.monotonic_ns()
+        if rxWallTime is None:
+            rxWallTime = time.time_ns()
+        if streamer is None:
+            streamer = self.streamer
+        m = self.metrics if self.metrics is not None else self.__initMetrics()
+        m.rxBytes.inc(len(rx))
+        tr = trace.tracer
+        if tr is not None:
+            tr.instant('read', rxTime, len(rx))
         for b in rx:
-            r = self.streamer.dec(b)
-            if r is not None and self.rxCallback is not None:
-                pkt = byteArrayToPacket(r)
+            r = streamer.dec(b)
+            if r is None:
+                continue
+            m.rxFrames.inc()
+            tr = trace.tracer
+            if tr is not None:
+                t0 = time.monotonic_ns()
+                tr.instant('frame', t0, len(r))
+            for p in self.telemetry:
+                p.publish(r, rxWallTime / 1e9)
+            if self.rxCallback is not None:
+                try:
+                    pkt = byteArrayToPacket(r, rxTime, rxWallTime)
+                except struct.error:
+                    m.decodeErrors.inc()
+                    continue
+                m.rxPacket(pkt.header.type)
+                if tr is not None:
+                    tr.span('decode', t0, time.monotonic_ns(), pkt.header.type)
                 self.__log(pkt)
                 self.rxCallback(pkt)
 
@@ -95,12 +241,20 @@ class ModemBaseCom(ABC):
         # add start, stuffing and end sequence
         tx = self.streamer.enc(pktbytes)
 
+        m = self.metrics if self.metrics is not None else self.__initMetrics()
+        m.txFrames.inc()
+        m.txBytes.inc(len(tx))
         return tx
 
+    def __initMetrics(self):
+        self.metrics = ComMetrics(self.dev)
+        return self.metrics
+
     def __log(self, pkt):
         """Log packet"""
         if self.logFile is not None and not self.logFile.closed:
-            self.logFile.write("{:.3f}".format(time.time()) + " " + packet2HexString(pkt) + "\n")
+            t = time.time() if pkt.rxWallTime is None else pkt.rxWallTime / 1e9
+            self.logFile.write("{:.3f}".format(t) + " " + packet2HexString(pkt) + "\n")
             self.logFile.flush()
             os.fsync(self.logFile.fileno())
 
@@ -0,0 +1,276 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for discovering sfwd gateways via UDP beacons.
+
+A gateway announces each served modem with a small datagram (TCP port,
+modem id and firmware version) to the beacon port, periodically and in
+reply to queries. A BeaconListener sends a query and collects beacons
+into a cache whose entries expire when not refreshed.
+"""
+
+import collections
+import selectors
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Tuple, Union
+
+from ahoi.modem.packet import MM_ADDR_BCAST
+
+BEACON_PORT = 2465
+BEACON_MAGIC = b'AHOI'
+QUERY_MAGIC = b'AHOI?'
+BEACON_FORMAT = '>4sBHB'  # magic, format version, tcp port, modem id; version string follows
+BEACON_VERSION = 1
+
+ID_UNKNOWN = MM_ADDR_BCAST
+
+Gateway = collections.namedtuple('Gateway', ['host', 'port', 'id', 'version', 'lastSeen'])
+
+
+def packBeacon(port, id, version):
+    """Create beacon datagram."""
+    if id is None:
+        id = ID_UNKNOWN
+    return struct.pack(BEACON_FORMAT, BEACON_MAGIC, BEACON_VERSION, port, id) + version.encode('ascii', 'replace')
+
+
+def unpackBeacon(data):
+    """Return (port, id, version) of beacon datagram or None if invalid."""
+    n = struct.calcsize(BEACON_FORMAT)
+    if len(data) < n:
+        return None
+    magic, fmt, port, id = struct.unpack(BEACON_FORMAT, data[0:n])
+    if magic != BEACON_MAGIC or fmt != BEACON_VERSION:
+        return None
+    return port, (None if id == ID_UNKNOWN else id), data[n:].decode('ascii', 'replace')
+
+
+class BeaconEntry:
+    """Modem served at a TCP port, updated from the packets it sends."""
+
+    def __init__(self, port, id=None, version=''):
+        self.port = port
+        self.id = id  # type: Union[int, None]
+        self.version = version
+
+    def snoop(self, pkt):
+        """Update id and version from modem responses."""
+        if pkt.header.type == 0x80:
+            self.version = bytes(pkt.payload).decode('ascii', 'replace')
+        elif pkt.header.type == 0x84 and len(pkt.payload) > 0:
+            self.id = pkt.payload[0]
+
+
+class Beacon:
+    """Announce gateways via UDP and answer queries.
+
+    Beacons are sent every interval seconds (0 to only answer queries) to
+    addr (broadcast by default, use 127.255.255.255 for local testing).
+    """
+
+    def __init__(self, addr='<broadcast>', port=BEACON_PORT, interval=1.0):
+        self.addr = addr
+        self.port = port
+        self.interval = interval
+        self.entries = []  # type: List[BeaconEntry]
+        self.sock = None  # type: Union[socket.socket, None]
+        self.__running = False
+        self.__thread = None  # type: Union[threading.Thread, None]
+
+    def add(self, port, id=None, version=''):
+        """Announce the modem served at TCP port."""
+        entry = BeaconEntry(port, id, version)
+        self.entries.append(entry)
+        return entry
+
+    def start(self):
+        """Open socket and start sending beacons."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        try:
+            self.sock.bind(('', self.port))
+        except OSError as e:
+            print("ERROR: cannot open beacon port %u: %s" % (self.port, str(e)))
+            self.sock.close()
+            self.sock = None
+            return
+        self.sock.settimeout(0.2)
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def close(self):
+        """Stop sending beacons."""
+        self.__running = False
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __send(self, addr):
+        if self.sock is None:
+            return
+        for e in self.entries:
+            try:
+                self.sock.sendto(packBeacon(e.port, e.id, e.version), addr)
+            except OSError:
+                pass  # network down or no broadcast route
+
+    def __run(self):
+        tNext = time.monotonic()
+        while self.__running and self.sock is not None:
+            if self.interval > 0 and time.monotonic() >= tNext:
+                self.__send((self.addr, self.port))
+                tNext += self.interval
+            try:
+                data, sender = self.sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if data == QUERY_MAGIC:
+                self.__send(sender)
+
+
+class BeaconListener:
+    """Collect gateway beacons into a cache.
+
+    Beacons are received in reply to query() and, if passive, from
+    periodic announcements. Entries older than maxAge seconds are
+    dropped. cb(gateway) is called for every newly found gateway.
+    """
+
+    def __init__(self, port=BEACON_PORT, maxAge=5.0, passive=True, cb=None):
+        self.port = port
+        self.maxAge = maxAge
+        self.passive = passive
+        self.cb = cb  # type: Union[Callable, None]
+        self.__cache = {}  # type: Dict[Tuple[str, int], Gateway]
+        self.__lock = threading.Lock()
+        self.__changed = threading.Condition(self.__lock)
+        self.__sel = selectors.DefaultSelector()
+        self.__socks = []  # type: List[socket.socket]
+        self.__running = False
+        self.__thread = None  # type: Union[threading.Thread, None]
+
+    def start(self):
+        """Open sockets and start receiving."""
+        # replies to queries go to an ephemeral port
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind(('', 0))
+        self.__socks.append(sock)
+        if self.passive:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind(('', self.port))
+                self.__socks.append(sock)
+            except OSError:
+                sock.close()  # rely on queries only
+        for s in self.__socks:
+            s.setblocking(False)
+            self.__sel.register(s, selectors.EVENT_READ, s)
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def close(self):
+        """Stop receiving."""
+        self.__running = False
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        for s in self.__socks:
+            self.__sel.unregister(s)
+            s.close()
+        self.__socks = []
+
+    def query(self, addr='<broadcast>'):
+        """Ask gateways at addr (broadcast by default) to send their beacons."""
+        if self.__socks:
+            try:
+                self.__socks[0].sendto(QUERY_MAGIC, (addr, self.port))
+            except OSError as e:
+                print("ERROR: cannot send beacon query to %s: %s" % (addr, str(e)))
+
+    def gateways(self):
+        """Return list of known gateways (not expired)."""
+        with self.__lock:
+            self.__expire()
+            return sorted(self.__cache.values())
+
+    def wait(self, timeout=0.5, num=None):
+        """Wait up to timeout seconds or until num gateways are known, return gateways."""
+        deadline = time.monotonic() + timeout
+        with self.__changed:
+            while num is None or len(self.__cache) < num:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__changed.wait(remaining)
+        return self.gateways()
+
+    def __expire(self):
+        now = time.monotonic()
+        for k in [k for (k, g) in self.__cache.items() if now - g.lastSeen > self.maxAge]:
+            del self.__cache[k]
+
+    def __run(self):
+        while self.__running:
+            for key, _ in self.__sel.select(0.2):
+                try:
+                    data, sender = key.data.recvfrom(512)
+                except OSError:
+                    continue
+                b = unpackBeacon(data)
+                if b is None:
+                    continue
+                port, id, version = b
+                gw = Gateway(sender[0], port, id, version, time.monotonic())
+                with self.__changed:
+                    isNew = (gw.host, gw.port) not in self.__cache
+                    self.__cache[(gw.host, gw.port)] = gw
+                    self.__changed.notify_all()
+                if isNew and self.cb is not None:
+                    self.cb(gw)
+
+# eof
@@ -0,0 +1,553 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for forwarding raw byte streams between modems and TCP clients.
+
+A Forwarder serves one or more Links (serial device and TCP port) from a
+single selector loop. Bytes read from a serial device are passed to all
+TCP clients unchanged, and complete frames received from the clients are
+written to the device, without decoding and re-encoding packets. Packets
+can be decoded and logged by a Tap in a separate thread, which can be
+shared by all links.
+"""
+
+import collections
+import os
+import queue
+import selectors
+import socket
+import struct
+import threading
+import time
+import weakref
+from typing import Callable, Deque, Dict, List, Union
+
+from ahoi.com.base import BYTES, DECODE_ERRORS, FRAMES
+from ahoi.com.serial import ModemSerialCom
+from ahoi.com.socket import ModemSocketCom, peerName
+from ahoi.com.unix import removeStale
+from ahoi.com.streamer import Streamer
+from ahoi.metrics.registry import trackQueue
+from ahoi.modem.packet import byteArrayToPacket, getBytes, packet2HexString
+
+DLE = Streamer.DLE
+ETX = Streamer.ETX
+
+MAX_FRAME = 1024  # bytes without frame end before data is passed on as is
+
+
+def frameEnds(buf):
+    """Return offsets just after each end of frame (DLE ETX) in buf.
+
+    buf has to start at a frame boundary, i.e., not in the middle of a
+    stuffed DLE.
+    """
+    ends = []
+    i = buf.find(DLE)
+    while i >= 0 and i + 1 < len(buf):
+        if buf[i + 1] == ETX:
+            ends.append(i + 2)
+        # skip second byte of DLE sequence (incl. stuffed DLE)
+        i = buf.find(DLE, i + 2)
+    return ends
+
+
+class Tap:
+    """Decode and log forwarded byte streams in a separate thread.
+
+    Decoded packets are written to a log file and/or handed to a
+    callback. Data is queued with put() and dropped (and counted) if the queue is
+    full, so the forwarding path never waits for logging. Frames too short
+    for a packet are counted and skipped, exceptions of a callback are
+    printed, so neither stops the tap.
+    """
+
+    def __init__(self, maxQueue=4096):
+        self.numDropped = 0
+        self.numPkts = {}  # type: Dict[str, int]
+        self.__queue = queue.Queue(maxQueue)  # type: queue.Queue
+        self.__streams = {}  # type: Dict[str, List]
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        trackQueue('tap', self, lambda t: t.__queue.qsize(), lambda t: t.numDropped)
+
+    def open(self, key, fileName=None, cb=None):
+        """Log packets of stream key to file fileName and/or pass them to cb."""
+        f = open(fileName, 'w') if fileName is not None else None
+        self.__streams[key] = [Streamer(), f, cb, DECODE_ERRORS.labels(key)]
+        self.numPkts[key] = 0
+
+    def put(self, key, data):
+        """Queue data of stream key for logging (stamped with the current time)."""
+        try:
+            self.__queue.put_nowait((key, time.monotonic_ns(), time.time_ns(), bytes(data)))
+        except queue.Full:
+            self.numDropped += 1
+
+    def close(self):
+        """Log queued data and close files."""
+        self.__queue.put(None)
+        self.__thread.join()
+        for (_, f, _, _) in self.__streams.values():
+            if f is None:
+                continue
+            os.fsync(f.fileno())
+            print("Closed logfile {}".format(f.name))
+            f.close()
+        self.__streams.clear()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            key, t, wallTime, data = item
+            if key not in self.__streams:
+                continue
+            streamer, f, cb, decodeErrors = self.__streams[key]
+            for b in data:
+                r = streamer.dec(b)
+                if r is None:
+                    continue
+                self.numPkts[key] += 1
+                try:
+                    pkt = byteArrayToPacket(r, t, wallTime)
+                except struct.error:
+                    decodeErrors.inc()
+                    continue
+                if f is not None:
+                    f.write("{:.3f}".format(wallTime / 1e9) + " " + packet2HexString(pkt) + "\n")
+                if cb is not None:
+                    try:
+                        cb(pkt)
+                    except Exception as e:
+                        print("Tap: %s" % str(e))
+            if f is not None and self.__queue.empty():
+                f.flush()
+
+
+class RawClient:
+    """TCP client of a link."""
+
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.rxBuf = bytearray()  # incomplete frame
+        self.txBuf = bytearray()
+        self.events = 0
+        self.closing = False
+
+
+class Link:
+    """One serial device served to TCP clients at one port."""
+
+    def __init__(self, dev, host='', port=None, maxClients=16, maxBuf=65536,
+                 maxTxQueue=64, txDelay=None, tap=None, unixPath=None):
+        self.dev = dev
+        self.host = host
+        if port is not None and int(port) > 0:
+            self.port = int(port)
+        else:
+            self.port = ModemSocketCom.DFLT_PORT
+        self.maxClients = maxClients
+        self.maxBuf = maxBuf
+        self.maxTxQueue = maxTxQueue
+        self.txDelay = txDelay  # gap between frames to device (None: serial default)
+        self.tap = tap
+        self.com = None  # type: Union[ModemSerialCom, None]
+        self.fd = -1
+        self.events = 0  # selector events registered for device
+        self.sock = None  # type: Union[socket.socket, None]
+        self.unixPath = unixPath  # also accept clients at this Unix socket
+        self.unixSock = None  # type: Union[socket.socket, None]
+        self.clients = {}  # type: Dict[int, RawClient]
+        self.txFrames = collections.deque()  # type: Deque[bytes]
+        self.txBuf = bytearray()
+        self.txNext = 0.0  # earliest time for next frame to device
+        self.stats = {'rxBytes': 0, 'txBytes': 0, 'txFrames': 0, 'accepted': 0, 'dropped': 0}
+
+    def open(self):
+        """Open serial device and server socket, return success.
+
+        On failure, the link is closed again (other links are not affected).
+        """
+        print("Using serial connection at %s" % self.dev)
+        self.com = ModemSerialCom(self.dev)
+        try:
+            self.com.open()
+        except OSError as e:
+            print("ERROR: cannot connect to %s: %s" % (self.dev, str(e)))
+            self.close()
+            return False
+        if self.txDelay is None:
+            self.txDelay = self.com.txDelay
+        self.fd = self.com.com.fileno()
+        os.set_blocking(self.fd, False)
+
+        # metrics are read from the link's statistics when collected
+        ref = weakref.proxy(self)
+        BYTES.labels(self.dev, 'rx').setFunction(lambda: ref.stats['rxBytes'])
+        BYTES.labels(self.dev, 'tx').setFunction(lambda: ref.stats['txBytes'])
+        FRAMES.labels(self.dev, 'tx').setFunction(lambda: ref.stats['txFrames'])
+        if self.tap is not None:
+            FRAMES.labels(self.dev, 'rx').setFunction(lambda: ref.tap.numPkts.get(ref.dev + ':rx', 0))
+        trackQueue('link:%s' % self.dev, self, lambda l: len(l.txFrames))
+
+        print("Opening server via TCP at %s:%u" % (self.host, self.port))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.sock.bind((self.host, self.port))
+            self.sock.listen(self.maxClients)
+        except Exception as e:
+            print("forwarder.open(): " + str(e))  # FIXME debug message
+            print("ERROR: cannot create server.")
+            self.close()
+            return False
+        self.sock.setblocking(False)
+
+        if self.unixPath is not None:
+            print("Opening server via Unix socket at %s" % self.unixPath)
+            removeStale(self.unixPath)
+            self.unixSock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                self.unixSock.bind(self.unixPath)
+                self.unixSock.listen(self.maxClients)
+            except Exception as e:
+                print("forwarder.open(): " + str(e))  # FIXME debug message
+                print("ERROR: cannot create server.")
+                self.close()
+                return False
+            self.unixSock.setblocking(False)
+        return True
+
+    def close(self):
+        """Close clients, server socket and serial device."""
+        for c in list(self.clients.values()):
+            c.conn.close()
+        self.clients.clear()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.unixSock is not None:
+            self.unixSock.close()
+            self.unixSock = None
+            removeStale(self.unixPath)
+        if self.com is not None:
+            self.com.close()
+            self.com = None
+        self.fd = -1
+
+    def logOn(self, rxFileName, txFileName, rxCb=None):
+        """Log packets from (rx) and to (tx) the device via the tap.
+
+        rxCb is called (in the tap thread) with every packet from the device.
+        """
+        if self.tap is not None:
+            self.tap.open(self.dev + ':rx', rxFileName, rxCb)
+            self.tap.open(self.dev + ':tx', txFileName)
+
+    def send(self, pkt):
+        """Queue a packet to the device (e.g., a command of the forwarder itself)."""
+        self.txFrames.append(bytes(Streamer().enc(getBytes(pkt))))
+
+    def getStats(self):
+        """Return statistics (incl. number of packets logged by the tap)."""
+        stats = dict(self.stats)
+        stats['clients'] = len(self.clients)
+        stats['txQueue'] = len(self.txFrames)
+        if self.tap is not None:
+            stats['rxPkts'] = self.tap.numPkts.get(self.dev + ':rx', 0)
+            stats['txPkts'] = self.tap.numPkts.get(self.dev + ':tx', 0)
+        return stats
+
+    def printStats(self):
+        """Print statistics in one line."""
+        print("%s @ %u: " % (self.dev, self.port) +
+              ", ".join("%s %u" % (k, v) for (k, v) in self.getStats().items()))
+
+
+class Forwarder:
+    """Selector loop forwarding raw bytes for one or more links."""
+
+    SELECT_TIMEOUT = 0.5
+    READ_SIZE = 4096
+
+    def __init__(self):
+        self.links = []  # type: List[Link]
+        self.periodic = None  # type: Union[Callable, None]
+        self.period = 0.0
+        self.__nextPeriodic = 0.0
+        self.__sel = selectors.DefaultSelector()
+        self.__running = False
+        self.__wakeR, self.__wakeW = socket.socketpair()
+        self.__wakeR.setblocking(False)
+        self.__sel.register(self.__wakeR, selectors.EVENT_READ, None)
+
+    def add(self, link):
+        """Open link and add it to the loop, return success."""
+        if not link.open():
+            return False
+        self.links.append(link)
+        self.__sel.register(link.sock, selectors.EVENT_READ, (self.__accept, (link, link.sock)))
+        if link.unixSock is not None:
+            self.__sel.register(link.unixSock, selectors.EVENT_READ, (self.__accept, (link, link.unixSock)))
+        link.events = selectors.EVENT_READ
+        self.__sel.register(link.fd, link.events, (self.__serialEvent, link))
+        return True
+
+    def every(self, period, fn):
+        """Call fn every period seconds from the loop."""
+        self.period = period
+        self.periodic = fn
+        self.__nextPeriodic = time.monotonic() + period
+
+    def printStats(self):
+        """Print statistics of all links."""
+        for link in self.links:
+            link.printStats()
+
+    def close(self):
+        """Stop loop (from another thread or a signal handler)."""
+        self.__running = False
+        try:
+            self.__wakeW.send(b'\0')
+        except OSError:
+            pass
+
+    def run(self):
+        """Forward data (blocking, until closed)."""
+        self.__running = True
+        while self.__running and self.links:
+            for key, mask in self.__sel.select(self.__timeout()):
+                if key.data is None:
+                    try:
+                        self.__wakeR.recv(256)
+                    except OSError:
+                        pass
+                    continue
+                handler, arg = key.data
+                handler(arg, mask)
+            for link in list(self.links):
+                self.__update(link)
+            if self.periodic is not None and time.monotonic() >= self.__nextPeriodic:
+                self.__nextPeriodic += self.period
+                self.periodic()
+
+        for link in self.links:
+            self.__closeLink(link)
+
+    def __timeout(self):
+        """Time until the next frame to a device is due."""
+        timeout = self.SELECT_TIMEOUT
+        now = time.monotonic()
+        if self.periodic is not None:
+            timeout = min(timeout, max(0.0, self.__nextPeriodic - now))
+        for link in self.links:
+            if link.txFrames and not link.txBuf:
+                timeout = min(timeout, max(0.0, link.txNext - now))
+        return timeout
+
+    def __accept(self, arg, mask):
+        link, sock = arg
+        try:
+            conn, addr = sock.accept()
+        except OSError:
+            return
+        if len(link.clients) >= link.maxClients:
+            print("Connection from %s to %s refused (too many clients)" % (peerName(addr), link.dev))
+            conn.close()
+            return
+        conn.setblocking(False)
+        if conn.family == socket.AF_INET:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        c = RawClient(conn, addr)
+        link.clients[conn.fileno()] = c
+        c.events = selectors.EVENT_READ
+        self.__sel.register(conn, c.events, (self.__clientEvent, (link, c)))
+        link.stats['accepted'] += 1
+        print("Connection from %s to %s established" % (peerName(addr), link.dev))
+
+    def __serialEvent(self, link, mask):
+        if mask & selectors.EVENT_READ:
+            try:
+                rx = os.read(link.fd, self.READ_SIZE)
+            except (BlockingIOError, InterruptedError):
+                rx = None
+            except OSError as e:
+                print("ERROR: cannot read from %s: %s" % (link.dev, str(e)))
+                self.__removeLink(link)
+                return
+            if rx is not None and len(rx) == 0:
+                print("ERROR: cannot read from %s: device hung up" % link.dev)
+                self.__removeLink(link)
+                return
+            if rx:
+                link.stats['rxBytes'] += len(rx)
+                for c in link.clients.values():
+                    if c.closing:
+                        continue
+                    if len(c.txBuf) + len(rx) > link.maxBuf:
+                        print("Client %s too slow, disconnecting" % peerName(c.addr))
+                        link.stats['dropped'] += 1
+                        c.closing = True
+                        continue
+                    c.txBuf += rx
+                    self.__flushClient(c)
+                if link.tap is not None:
+                    link.tap.put(link.dev + ':rx', rx)
+        if mask & selectors.EVENT_WRITE:
+            self.__flushSerial(link)
+
+    def __clientEvent(self, arg, mask):
+        link, c = arg
+        if mask & selectors.EVENT_READ:
+            try:
+                rx = c.conn.recv(self.READ_SIZE)
+            except (BlockingIOError, InterruptedError):
+                rx = None
+            except OSError:
+                rx = b''
+            if rx is not None and not rx:
+                print("Client %s disconnected" % peerName(c.addr))
+                c.closing = True
+                return
+            if rx:
+                c.rxBuf += rx
+                # pass on complete frames only, so frames of several
+                # clients do not get mixed up
+                start = 0
+                for end in frameEnds(c.rxBuf):
+                    link.txFrames.append(bytes(c.rxBuf[start:end]))
+                    start = end
+                if start == 0 and len(c.rxBuf) > MAX_FRAME:
+                    start = len(c.rxBuf)
+                    link.txFrames.append(bytes(c.rxBuf))
+                del c.rxBuf[:start]
+        if mask & selectors.EVENT_WRITE and not c.closing:
+            self.__flushClient(c)
+
+    def __flushClient(self, c):
+        if len(c.txBuf) == 0:
+            return
+        try:
+            n = c.conn.send(c.txBuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            c.closing = True
+            return
+        del c.txBuf[:n]
+
+    def __flushSerial(self, link):
+        """Write pending frame to device, start next one if due."""
+        while True:
+            if not link.txBuf:
+                if not link.txFrames or time.monotonic() < link.txNext:
+                    return
+                frame = link.txFrames.popleft()
+                link.txBuf += frame
+                link.stats['txFrames'] += 1
+                if link.tap is not None:
+                    link.tap.put(link.dev + ':tx', frame)
+            try:
+                n = os.write(link.fd, link.txBuf)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print("ERROR: cannot write to %s: %s" % (link.dev, str(e)))
+                del link.txBuf[:]
+                return
+            link.stats['txBytes'] += n
+            del link.txBuf[:n]
+            if link.txBuf:
+                return
+            link.txNext = time.monotonic() + link.txDelay
+
+    def __update(self, link):
+        """Start due frames, update events and close clients."""
+        if link.fd < 0:
+            return
+        self.__flushSerial(link)
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if link.txBuf else 0)
+        if events != link.events:
+            self.__sel.modify(link.fd, events, (self.__serialEvent, link))
+            link.events = events
+        txFull = len(link.txFrames) >= link.maxTxQueue
+        for c in list(link.clients.values()):
+            if c.closing:
+                self.__closeClient(link, c)
+                continue
+            # stop reading from clients while frames to the device pile up
+            events = 0 if txFull else selectors.EVENT_READ
+            if c.txBuf:
+                events |= selectors.EVENT_WRITE
+            if events != c.events:
+                if c.events == 0:
+                    self.__sel.register(c.conn, events, (self.__clientEvent, (link, c)))
+                elif events == 0:
+                    self.__sel.unregister(c.conn)
+                else:
+                    self.__sel.modify(c.conn, events, (self.__clientEvent, (link, c)))
+                c.events = events
+
+    def __closeClient(self, link, c):
+        fd = c.conn.fileno()
+        if c.events != 0:
+            self.__sel.unregister(c.conn)
+            c.events = 0
+        try:
+            c.conn.close()
+        except OSError:
+            pass
+        link.clients.pop(fd, None)
+
+    def __removeLink(self, link):
+        self.__closeLink(link)
+        if link in self.links:
+            self.links.remove(link)
+
+    def __closeLink(self, link):
+        for c in list(link.clients.values()):
+            self.__closeClient(link, c)
+        if link.sock is not None:
+            self.__sel.unregister(link.sock)
+        if link.unixSock is not None:
+            self.__sel.unregister(link.unixSock)
+        if link.fd >= 0:
+            self.__sel.unregister(link.fd)
+        link.close()
+
+# eof
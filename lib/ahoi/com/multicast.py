@@ -0,0 +1,210 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for publishing received packets as UDP multicast telemetry.
+
+Every datagram carries one packet (as sent by the modem, without
+framing) after a header with magic, format version, sequence number and
+receive time. Subscribers may lose datagrams; gaps are detected by the
+sequence number.
+"""
+
+import select
+import socket
+import struct
+import time
+from typing import Union
+
+from ahoi.com.base import DECODE_ERRORS, ModemBaseCom
+from ahoi.com.registry import checkOptions
+from ahoi.modem.packet import byteArrayToPacket, getBytes
+
+MCAST_GROUP = '239.255.24.64'
+MCAST_PORT = 2466
+MCAST_MAGIC = b'AHOM'
+MCAST_FORMAT = '>4sBIQ'  # magic, format version, sequence number, rx time (ns since epoch)
+MCAST_VERSION = 1
+MCAST_HDR_LEN = struct.calcsize(MCAST_FORMAT)
+
+
+class MulticastPublisher:
+    """Send packets to a multicast group (loss tolerant, never blocks)."""
+
+    def __init__(self, group=MCAST_GROUP, port=MCAST_PORT, ttl=1, iface=None):
+        self.group = group
+        self.port = port
+        self.seq = 0
+        self.numDropped = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        if iface is not None:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(iface))
+        self.sock.setblocking(False)
+
+    def publish(self, data, t=None):
+        """Send packet bytes (as decoded by the streamer), t in s since epoch."""
+        ns = time.time_ns() if t is None else int(t * 1e9)
+        hdr = struct.pack(MCAST_FORMAT, MCAST_MAGIC, MCAST_VERSION, self.seq, ns)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        try:
+            self.sock.sendto(hdr + bytes(data), (self.group, self.port))
+        except OSError:
+            self.numDropped += 1
+
+    def publishPkt(self, pkt, t=None):
+        """Send a packet."""
+        self.publish(getBytes(pkt), t)
+
+    def close(self):
+        """Close socket."""
+        self.sock.close()
+
+
+class MulticastReader(ModemBaseCom):
+    """Receive packets published to a multicast group.
+
+    Packets are handed to the callback like those of any other com
+    interface, with the publisher's receive time as rxWallTime; the
+    receive time of the last packet is kept in lastRxTime. Sending is not
+    possible.
+    """
+
+    TIMEOUT = 0.5
+
+    def __init__(self, group=MCAST_GROUP, port=MCAST_PORT, cb=None, iface=None):
+        super().__init__("%s:%u" % (group, int(port)), cb)
+        self.group = group
+        self.port = int(port)
+        self.iface = iface
+        self.sock = None  # type: Union[socket.socket, None]
+        self.lastRxTime = 0.0  # s since epoch
+        self.numRx = 0
+        self.numLost = 0
+        self.__decodeErrors = DECODE_ERRORS.labels(self.dev)
+        self.__nextSeq = None  # type: Union[int, None]
+        self.__running = False
+
+    @classmethod
+    def fromUri(cls, scheme, loc, opts):
+        """Create from URI (mcast://239.255.24.64:2466?iface=192.168.0.2)."""
+        checkOptions(opts, ('iface',))
+        group, _, port = loc.rstrip('/').partition(':')
+        return cls(group if group else MCAST_GROUP, port if port else MCAST_PORT, iface=opts.get('iface'))
+
+    def connect(self, cb=None):
+        """Join multicast group, return success."""
+        super().connect(cb)
+        print("Joining multicast group %s" % self.dev)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.sock.bind(('', self.port))
+            mreq = socket.inet_aton(self.group) + socket.inet_aton(self.iface if self.iface else '0.0.0.0')
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        except OSError as e:
+            print("ERROR: cannot join multicast group %s: %s" % (self.dev, str(e)))
+            self.sock.close()
+            self.sock = None
+            return False
+        self.sock.settimeout(self.TIMEOUT)
+        self.__running = True
+        return True
+
+    def close(self):
+        """Terminate."""
+        self.__running = False
+        super().close()
+
+    def receive(self):
+        """Receive packets (blocking, until closed)."""
+        while self.__running and self.sock is not None:
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.processDatagram(data)
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def poll(self, timeout=0.0):
+        """Handle received datagrams, waiting up to timeout (s) for the first one."""
+        sock = self.sock
+        if not self.__running or sock is None:
+            return -1
+        n = 0
+        while len(select.select([sock], [], [], timeout if n == 0 else 0)[0]) > 0:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                return -1
+            self.processDatagram(data)
+            n += len(data)
+        return n
+
+    def fileno(self):
+        """File descriptor of the multicast socket."""
+        return self.sock.fileno() if self.sock is not None else None
+
+    def processDatagram(self, data):
+        """Decode a datagram and pass its packet on."""
+        if len(data) < MCAST_HDR_LEN:
+            return
+        magic, fmt, seq, ns = struct.unpack(MCAST_FORMAT, data[0:MCAST_HDR_LEN])
+        if magic != MCAST_MAGIC or fmt != MCAST_VERSION:
+            return
+        if self.__nextSeq is not None and seq != self.__nextSeq:
+            gap = (seq - self.__nextSeq) & 0xFFFFFFFF
+            if gap < 0x80000000:
+                self.numLost += gap  # else reordered or publisher restarted
+        self.__nextSeq = (seq + 1) & 0xFFFFFFFF
+        self.numRx += 1
+        self.lastRxTime = ns / 1e9
+        if self.rxCallback is not None:
+            try:
+                pkt = byteArrayToPacket(bytearray(data[MCAST_HDR_LEN:]), time.monotonic_ns(), ns)
+            except struct.error:
+                self.__decodeErrors.inc()  # not a packet (e.g., foreign sender)
+                return
+            self.rxCallback(pkt)
+
+    def send(self, pkt):
+        """Drop packet (telemetry is receive only)."""
+        pass
+
+# eof
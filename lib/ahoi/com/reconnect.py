@@ -0,0 +1,113 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for reconnecting com interfaces with exponential backoff."""
+
+import random
+import time
+from typing import Callable, Union
+
+
+class ReconnectPolicy:
+    """When and how often to retry connecting a com interface.
+
+    The n-th retry waits initialDelay * factor**n seconds (at most
+    maxDelay), randomized by +/- jitter (fraction). maxAttempts limits
+    the number of attempts (None for unlimited). Callbacks get the com
+    interface: onDisconnect(com) when the link drops, onReconnect(com,
+    attempts) when it is up again, onGiveUp(com) after the last attempt
+    failed.
+    """
+
+    def __init__(self, initialDelay=0.5, maxDelay=30.0, factor=2.0, jitter=0.1, maxAttempts=None,
+                 onDisconnect=None, onReconnect=None, onGiveUp=None):
+        self.initialDelay = initialDelay
+        self.maxDelay = maxDelay
+        self.factor = factor
+        self.jitter = jitter
+        self.maxAttempts = maxAttempts  # type: Union[int, None]
+        self.onDisconnect = onDisconnect  # type: Union[Callable, None]
+        self.onReconnect = onReconnect  # type: Union[Callable, None]
+        self.onGiveUp = onGiveUp  # type: Union[Callable, None]
+
+    @classmethod
+    def fromOptions(cls, opts):
+        """Create from URI options reconnect (max attempts, 0 for unlimited) and backoff (initial delay).
+
+        Returns None if no reconnect option is given.
+        """
+        if 'reconnect' not in opts:
+            return None
+        maxAttempts = int(opts['reconnect'])
+        return cls(initialDelay=float(opts.get('backoff', 0.5)),
+                   maxAttempts=maxAttempts if maxAttempts > 0 else None)
+
+    def delay(self, retry):
+        """Time to wait before the retry-th retry (0 for first)."""
+        d = min(self.initialDelay * self.factor ** retry, self.maxDelay)
+        if self.jitter > 0:
+            d *= 1.0 + random.uniform(-self.jitter, self.jitter)
+        return max(0.0, d)
+
+    def run(self, connectFn, com=None, stop=None):
+        """Call connectFn until it returns True, return number of attempts (0 if failed).
+
+        Exceptions of connectFn count as failed attempts. stop() is polled
+        while waiting and aborts retrying if True.
+        """
+        dev = getattr(com, 'dev', '')
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if connectFn():
+                    return attempt
+                err = 'failed'
+            except Exception as e:
+                err = str(e)
+            if self.maxAttempts is not None and attempt >= self.maxAttempts:
+                print("ERROR: cannot connect to %s (%s), giving up after %u attempt(s)" % (dev, err, attempt))
+                if self.onGiveUp is not None:
+                    self.onGiveUp(com)
+                return 0
+            d = self.delay(attempt - 1)
+            print("Cannot connect to %s (%s), retrying in %.1f s" % (dev, err, d))
+            tEnd = time.monotonic() + d
+            while time.monotonic() < tEnd:
+                if stop is not None and stop():
+                    return 0
+                time.sleep(max(0.0, min(0.1, tEnd - time.monotonic())))
+
+# eof
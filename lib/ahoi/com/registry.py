@@ -0,0 +1,107 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for creating modem com interfaces from URIs.
+
+A transport is selected by the URI scheme, e.g.
+
+    serial:///dev/ttyUSB0?baudrate=115200&txDelay=0.1
+    tcp://192.168.0.10:2464?rcvbuf=65536
+    pty:///dev/pts/3
+    unix:///tmp/ahoi.sock
+    replay:///path/to/sfwd.tcp.log?speed=2
+    mcast://239.255.24.64:2466
+    shm://ahoi
+    sim://?id=3&peer=5:100
+
+Query parameters are passed to the transport's fromUri(). Transport
+modules are imported on first use only.
+"""
+
+import importlib
+from urllib.parse import urlsplit, parse_qsl
+from typing import Dict, Tuple
+
+# scheme -> (module, class)
+TRANSPORTS = {
+    'serial': ('ahoi.com.serial', 'ModemSerialCom'),
+    'pty': ('ahoi.com.serial', 'ModemSerialCom'),
+    'tcp': ('ahoi.com.socket', 'ModemSocketCom'),
+    'unix': ('ahoi.com.unix', 'ModemUnixCom'),
+    'replay': ('ahoi.com.replay', 'ModemReplayCom'),
+    'mcast': ('ahoi.com.multicast', 'MulticastReader'),
+    'shm': ('ahoi.com.shmring', 'ModemShmCom'),
+    'sim': ('ahoi.sim.com', 'ModemSimCom'),
+}  # type: Dict[str, Tuple[str, str]]
+
+
+def register(scheme, module, cls):
+    """Register transport class cls (name) in module for scheme."""
+    TRANSPORTS[scheme.lower()] = (module, cls)
+
+
+def isUri(dev):
+    """Check if dev is a URI (scheme://...)."""
+    return isinstance(dev, str) and '://' in dev
+
+
+def parse(uri):
+    """Split uri into scheme, location (host:port or path) and options."""
+    parts = urlsplit(uri)
+    loc = parts.netloc + parts.path
+    opts = dict(parse_qsl(parts.query))  # type: Dict[str, str]
+    return parts.scheme.lower(), loc, opts
+
+
+def checkOptions(opts, known):
+    """Raise ValueError for options not in known."""
+    unknown = set(opts) - set(known)
+    if unknown:
+        raise ValueError("unknown option(s) %s (known: %s)" % (', '.join(sorted(unknown)), ', '.join(known)))
+
+
+def fromUri(uri):
+    """Create (unconnected) com interface for uri.
+
+    Raises ValueError for unknown schemes or invalid options.
+    """
+    scheme, loc, opts = parse(uri)
+    if scheme not in TRANSPORTS:
+        raise ValueError("unknown transport '%s' (known: %s)" % (scheme, ', '.join(sorted(TRANSPORTS))))
+    module, cls = TRANSPORTS[scheme]
+    comType = getattr(importlib.import_module(module), cls)
+    return comType.fromUri(scheme, loc, opts)
+
+# eof
@@ -0,0 +1,112 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for replaying recorded packet logs as modem com interface."""
+
+import os.path
+import time
+
+from ahoi.com.base import ModemBaseCom
+from ahoi.com.registry import checkOptions
+
+
+class ModemReplayCom(ModemBaseCom):
+    """Feed packets from a log file (as written by logOn) to the receiver.
+
+    Packets are replayed with their recorded timing, scaled by speed
+    (0 for as fast as possible), and carry the recorded time as
+    rxWallTime. Sent packets are counted and dropped.
+    """
+
+    def __init__(self, dev=None, cb=None, speed=1.0, loop=False):
+        super().__init__(dev, cb)
+        self.speed = speed
+        self.loop = loop
+        self.numTx = 0
+        self.__running = False
+
+    @classmethod
+    def fromUri(cls, scheme, loc, opts):
+        """Create from URI (replay:///path/to/file.log?speed=1.0&loop=0)."""
+        checkOptions(opts, ('speed', 'loop'))
+        return cls(loc, speed=float(opts.get('speed', 1.0)), loop=bool(int(opts.get('loop', 0))))
+
+    def connect(self, cb=None):
+        """Check log file and register callback, return success."""
+        super().connect(cb)
+        if self.dev is None or not os.path.isfile(self.dev):
+            print("ERROR: cannot open log file %s!" % self.dev)
+            exit()
+        print("Replaying packets from %s" % self.dev)
+        self.__running = True
+        return True
+
+    def close(self):
+        """Terminate."""
+        self.__running = False
+        super().close()
+
+    def receive(self):
+        """Replay log (blocking)."""
+        while self.__running:
+            self.__replay()
+            if not self.loop:
+                break
+
+    def __replay(self):
+        t0 = None
+        tStart = time.monotonic()
+        with open(self.dev, 'r') as f:
+            for l in f:
+                if not self.__running:
+                    return
+                # first field is the timestamp, following ones are pkt octets
+                o = l.split()
+                if len(o) < 7:
+                    continue
+                t = float(o[0])
+                if t0 is None:
+                    t0 = t
+                if self.speed > 0:
+                    delay = tStart + (t - t0) / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.processRx(self.streamer.enc(bytes.fromhex(''.join(o[1:]))), rxWallTime=int(t * 1e9))
+
+    def send(self, pkt):
+        """Drop packet (nobody to send to)."""
+        self.numTx += 1
+
+# eof
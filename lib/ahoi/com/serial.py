@@ -35,6 +35,7 @@
 
 """Module for serial modem com interfacing."""
 
+import select
 import time
 from typing import Union
 
@@ -42,6 +43,8 @@ import serial
 from serial.tools.list_ports import comports
 
 from ahoi.com.base import ModemBaseCom
+from ahoi.com.registry import checkOptions
+from ahoi.com.reconnect import ReconnectPolicy
 
 
 class ModemSerialCom(ModemBaseCom):
@@ -50,31 +53,59 @@ class ModemSerialCom(ModemBaseCom):
         """Initialize serial com."""
         super().__init__(dev, cb)
         self.com = None # type: Union[serial.Serial, None]
+        self.baudrate = 115200
+        self.timeout = 0.1  # read timeout (s)
         self.txDelay = 0.1
+        self.pktPinLine = 'cts'  # modem control line wired to the pkt pin
         self.__keepAlive = False
+        self.__txNext = 0.0  # earliest time of next write (monotonic s)
 
     def __del__(self):
         """Close connection."""
         self.close()
 
     def connect(self, cb=None):
-        """Open the serial connection."""
+        """Open the serial connection, return success (False if the reconnect policy gave up)."""
         if cb is not None:
             self.rxCallback = cb
+        self.closing = False
+
+        print("Using serial connection at %s" % self.dev)
+        if self.reconnectPolicy is not None:
+            return self.retryConnect(self.open, initial=True)
 
         try:
-            print("Using serial connection at %s" % self.dev)
-            self.com = serial.Serial(
-                port=self.dev,
-                baudrate=115200,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS,
-                timeout=0.1
-            )
+            self.open()
         except:
             print("ERROR: cannot connect to %s!" % self.dev)
             exit()
+        return True
+
+    def open(self):
+        """Open the serial port (raises serial.SerialException on failure)."""
+        self.com = serial.Serial(
+            port=self.dev,
+            baudrate=self.baudrate,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            bytesize=serial.EIGHTBITS,
+            timeout=self.timeout
+        )
+        return True
+
+    @classmethod
+    def fromUri(cls, scheme, loc, opts):
+        """Create from URI (serial:///dev/ttyUSB0?baudrate=115200&timeout=0.1&txDelay=0.1&pktPin=cts&reconnect=0&backoff=0.5)."""
+        checkOptions(opts, ('baudrate', 'timeout', 'txDelay', 'pktPin', 'reconnect', 'backoff'))
+        com = cls(loc)
+        if scheme == 'pty':
+            com.txDelay = 0.0  # no UART to wait for
+        com.baudrate = int(opts.get('baudrate', com.baudrate))
+        com.timeout = float(opts.get('timeout', com.timeout))
+        com.txDelay = float(opts.get('txDelay', com.txDelay))
+        com.pktPinLine = opts.get('pktPin', com.pktPinLine)
+        com.setReconnectPolicy(ReconnectPolicy.fromOptions(opts))
+        return com
 
     def reconnect(self):
         if self.com is not None:
@@ -90,6 +121,7 @@ class ModemSerialCom(ModemBaseCom):
 
     def close(self):
         """Terminate."""
+        self.closing = True
         try:
             if self.com is not None:
                 self.com.close()
@@ -104,14 +136,60 @@ class ModemSerialCom(ModemBaseCom):
             try:
                 rx = self.com.read(self.com.in_waiting or 1)
             except:
-                if not self.__keepAlive:
-                    print("ERROR: Cannot receive packet, serial connection not open")
-                    return
+                if self.__keepAlive:
+                    time.sleep(self.timeout)
+                    continue
+                if self.__reconnect():
+                    continue
+                print("ERROR: Cannot receive packet, serial connection not open")
+                return
 
             super().processRx(rx)
 
         return
 
+    def poll(self, timeout=0.0):
+        """Handle received bytes, waiting up to timeout (s) for them."""
+        if not self.com or not self.com.is_open:
+            return 0 if self.__reconnect() else -1
+        try:
+            n = self.com.in_waiting
+            if n == 0 and timeout > 0:
+                select.select([self.com.fileno()], [], [], timeout)
+                n = self.com.in_waiting
+            rx = self.com.read(n) if n > 0 else b''
+        except (serial.SerialException, OSError) as e:
+            if self.__reconnect():
+                return 0
+            print("ERROR: cannot receive from %s: %s" % (self.dev, str(e)))
+            return -1
+
+        if len(rx) > 0:
+            super().processRx(rx)
+        return len(rx)
+
+    def fileno(self):
+        """File descriptor of the serial port (POSIX only)."""
+        if not self.com or not self.com.is_open:
+            return None
+        return self.com.fileno()
+
+    def __reconnect(self):
+        """Reopen the device after it was lost (e.g., unplugged), return success."""
+        if self.reconnectPolicy is None or self.closing or self.com is None:
+            return False
+        try:
+            self.com.close()
+        except:
+            pass
+        return self.retryConnect(self.open)
+
+    def getPktPin(self):
+        """Read state of the modem's pkt pin (wired to a control line)."""
+        if not self.com or not self.com.is_open:
+            return False
+        return bool(getattr(self.com, self.pktPinLine))
+
     @classmethod
     def scanAndSelect(cls):
         # TODO any better solution possible?
@@ -120,14 +198,34 @@ class ModemSerialCom(ModemBaseCom):
     def send(self, pkt):
         """Send a packet."""
         if not self.com or not self.com.is_open:
+            if self.reconnectPolicy is not None:
+                self.queueTx(super().processTx(pkt))
+                return
             print("ERROR: Cannot send packet, serial connection not open")
             return
 
         # send encoded data
         tx = super().processTx(pkt)
-        self.com.write(tx)
-
-        time.sleep(self.txDelay)
+        try:
+            self.writeRaw(tx)
+        except serial.SerialException:
+            if self.reconnectPolicy is None:
+                raise
+            self.queueTx(tx)  # sent after reconnect
+
+    def writeRaw(self, tx):
+        """Write encoded data, txDelay after the previous write (time for the modem)."""
+        if self.com is None:
+            raise serial.SerialException("not connected")
+        # reserve a slot, so that the lock is not held while waiting
+        with self.txLock:
+            now = time.monotonic()
+            t = max(now, self.__txNext)
+            self.__txNext = t + self.txDelay
+        if t > now:
+            time.sleep(t - now)
+        with self.txLock:
+            self.com.write(tx)
 
     @staticmethod
     def scan():
@@ -0,0 +1,336 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for serving a modem to several TCP clients."""
+
+import queue
+import selectors
+import socket
+import threading
+from typing import Callable, Dict, Union
+
+from ahoi.com.base import ModemBaseCom
+from ahoi.com.socket import ModemSocketCom, peerName
+from ahoi.com.unix import removeStale
+from ahoi.com.streamer import Streamer
+from ahoi.metrics.registry import trackQueue
+
+
+class Client:
+    """Connection to one client with its own decoder and send buffer."""
+
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.streamer = Streamer()
+        self.txBuf = bytearray()
+        self.events = 0  # selector events registered for
+        self.numSkipped = 0  # frames not sent due to a full buffer
+        self.closing = False
+
+
+class ModemSocketServer(ModemBaseCom):
+    """TCP (and Unix socket) server fanning out modem packets to many clients.
+
+    Packets passed to send() (received from the modem) are queued to
+    every client. A client whose send buffer exceeds maxBuf bytes is
+    either disconnected (DISCONNECT) or skips frames until it catches up
+    (THROTTLE). Packets received from the clients are merged into one
+    queue and handed to the callback (e.g. the modem's send) on a
+    separate thread; while this queue is full, clients are not read
+    from, which throttles them via TCP.
+    """
+
+    DISCONNECT = 'disconnect'
+    THROTTLE = 'throttle'
+
+    SELECT_TIMEOUT = 0.5
+    RECV_SIZE = 4096
+
+    def __init__(self, host='', port=None, cb=None, maxClients=16, maxBuf=65536,
+                 policy=DISCONNECT, maxTxQueue=64, unixPath=None):
+        super().__init__('', None)
+        self.host = host
+        if port is not None and int(port) > 0:
+            self.port = int(port)
+        else:
+            self.port = ModemSocketCom.DFLT_PORT
+        self.dev = "%s:%u" % (self.host, self.port)
+        self.maxClients = maxClients
+        self.maxBuf = maxBuf
+        self.policy = policy
+        self.maxTxQueue = maxTxQueue
+        self.clients = {}  # type: Dict[int, Client]
+        self.stats = {'accepted': 0, 'closed': 0, 'dropped': 0, 'skipped': 0, 'rxPkt': 0, 'txPkt': 0}
+        self.sock = None  # type: Union[socket.socket, None]
+        self.unixPath = unixPath  # also accept clients at this Unix socket
+        self.unixSock = None  # type: Union[socket.socket, None]
+        self.__deliver = cb  # type: Union[Callable, None]
+        self.__sel = selectors.DefaultSelector()
+        self.__lock = threading.Lock()  # protects clients and their buffers
+        self.__txQueue = queue.Queue()  # type: queue.Queue
+        self.__txFull = False
+        self.__wakeR, self.__wakeW = socket.socketpair()
+        self.__wakeR.setblocking(False)
+        self.__wakeW.setblocking(False)
+        self.__running = False
+        self.__txThread = None  # type: Union[threading.Thread, None]
+        # decoded packets of all clients go to one queue
+        self.rxCallback = self.__enqueue
+        trackQueue('server:%s' % self.dev, self, lambda s: s.__txQueue.qsize())
+
+    def start(self, cb=None):
+        """Start server."""
+        if cb is not None:
+            self.__deliver = cb
+
+        print("Opening server via TCP at %s:%u" % (self.host, self.port))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.sock.bind((self.host, self.port))
+            self.sock.listen(self.maxClients)
+        except Exception as e:
+            print("server.start(): " + str(e))  # FIXME debug message
+            print("ERROR: cannot create server.")
+            exit()
+        self.sock.setblocking(False)
+        self.__sel.register(self.sock, selectors.EVENT_READ, None)
+
+        if self.unixPath is not None:
+            print("Opening server via Unix socket at %s" % self.unixPath)
+            removeStale(self.unixPath)
+            self.unixSock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                self.unixSock.bind(self.unixPath)
+                self.unixSock.listen(self.maxClients)
+            except Exception as e:
+                print("server.start(): " + str(e))  # FIXME debug message
+                print("ERROR: cannot create server.")
+                exit()
+            self.unixSock.setblocking(False)
+            self.__sel.register(self.unixSock, selectors.EVENT_READ, None)
+        self.__sel.register(self.__wakeR, selectors.EVENT_READ, self.__wakeR)
+
+        self.__running = True
+        self.__txThread = threading.Thread(target=self.__runTx, daemon=True)
+        self.__txThread.start()
+
+    def close(self):
+        """Terminate."""
+        if self.__running:
+            self.__running = False
+            self.__wakeup()
+            self.__txQueue.put(None)
+        super().close()
+
+    def receive(self):
+        """Serve clients (blocking, until closed)."""
+        if self.sock is None:
+            return
+        while self.__running:
+            for key, mask in self.__sel.select(self.SELECT_TIMEOUT):
+                if key.data is None:
+                    self.__accept(key.fileobj)
+                elif key.data is self.__wakeR:
+                    self.__drainWakeup()
+                else:
+                    if mask & selectors.EVENT_READ:
+                        self.__read(key.data)
+                    if mask & selectors.EVENT_WRITE and not key.data.closing:
+                        with self.__lock:
+                            self.__flush(key.data)
+            self.__update()
+
+        # finish up
+        with self.__lock:
+            for c in list(self.clients.values()):
+                self.__closeClient(c)
+        self.__sel.unregister(self.sock)
+        self.sock.close()
+        self.sock = None
+        if self.unixSock is not None:
+            self.__sel.unregister(self.unixSock)
+            self.unixSock.close()
+            self.unixSock = None
+            removeStale(self.unixPath)
+
+    def send(self, pkt):
+        """Send a packet to all clients."""
+        self.sendRaw(self.processTx(pkt))
+        self.stats['txPkt'] += 1
+
+    def sendRaw(self, data):
+        """Send encoded data to all clients."""
+        wake = False
+        with self.__lock:
+            for c in self.clients.values():
+                if c.closing:
+                    continue
+                if len(c.txBuf) + len(data) > self.maxBuf:
+                    if self.policy == self.THROTTLE:
+                        c.numSkipped += 1
+                        self.stats['skipped'] += 1
+                        continue
+                    print("Client %s too slow, disconnecting" % peerName(c.addr))
+                    self.stats['dropped'] += 1
+                    c.closing = True
+                    wake = True
+                    continue
+                c.txBuf += data
+                self.__flush(c)
+                if len(c.txBuf) > 0:
+                    wake = True  # let loop wait for the client to become writable
+        if wake:
+            self.__wakeup()
+
+    def numClients(self):
+        """Number of connected clients."""
+        return len(self.clients)
+
+    def __accept(self, sock):
+        try:
+            conn, addr = sock.accept()
+        except OSError:
+            return
+        if len(self.clients) >= self.maxClients:
+            print("Connection from %s refused (too many clients)" % peerName(addr))
+            conn.close()
+            return
+        conn.setblocking(False)
+        if conn.family == socket.AF_INET:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        c = Client(conn, addr)
+        with self.__lock:
+            self.clients[conn.fileno()] = c
+        c.events = selectors.EVENT_READ
+        self.__sel.register(conn, c.events, c)
+        self.stats['accepted'] += 1
+        print("Connection from %s established" % peerName(addr))
+
+    def __read(self, c):
+        try:
+            rx = c.conn.recv(self.RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            rx = b''
+        if not rx:
+            print("Client %s disconnected" % peerName(c.addr))
+            with self.__lock:
+                self.__closeClient(c)
+            return
+        self.processRx(rx, c.streamer)
+
+    def __flush(self, c):
+        """Write as much buffered data as possible (with lock held)."""
+        if len(c.txBuf) == 0:
+            return
+        try:
+            n = c.conn.send(c.txBuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            c.closing = True
+            return
+        del c.txBuf[:n]
+
+    def __update(self):
+        """Update events to wait for and close clients marked for closing."""
+        with self.__lock:
+            for c in list(self.clients.values()):
+                if c.closing:
+                    self.__closeClient(c)
+                    continue
+                events = 0 if self.__txFull else selectors.EVENT_READ
+                if len(c.txBuf) > 0:
+                    events |= selectors.EVENT_WRITE
+                if events != c.events:
+                    if c.events == 0:
+                        self.__sel.register(c.conn, events, c)
+                    elif events == 0:
+                        self.__sel.unregister(c.conn)
+                    else:
+                        self.__sel.modify(c.conn, events, c)
+                    c.events = events
+
+    def __closeClient(self, c):
+        """Close client connection (with lock held)."""
+        fd = c.conn.fileno()
+        if c.events != 0:
+            self.__sel.unregister(c.conn)
+            c.events = 0
+        try:
+            c.conn.close()
+        except OSError:
+            pass
+        self.clients.pop(fd, None)
+        self.stats['closed'] += 1
+
+    def __wakeup(self):
+        try:
+            self.__wakeW.send(b'\0')
+        except OSError:
+            pass  # wakeup already pending
+
+    def __drainWakeup(self):
+        try:
+            while self.__wakeR.recv(256):
+                pass
+        except OSError:
+            pass
+
+    def __enqueue(self, pkt):
+        self.stats['rxPkt'] += 1
+        self.__txQueue.put(pkt)
+        if self.__txQueue.qsize() >= self.maxTxQueue:
+            self.__txFull = True  # stop reading from clients
+
+    def __runTx(self):
+        """Hand packets from all clients to the callback, one at a time."""
+        while True:
+            pkt = self.__txQueue.get()
+            if pkt is None:
+                return
+            if self.__txFull and self.__txQueue.qsize() < self.maxTxQueue // 2:
+                self.__txFull = False
+                self.__wakeup()
+            if self.__deliver is not None:
+                try:
+                    self.__deliver(pkt)
+                except Exception as e:
+                    print("server tx: %s" % str(e))
+
+# eof
@@ -0,0 +1,368 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for handing received packets to other processes via shared memory.
+
+A ShmRingWriter keeps the most recent packets (as sent by the modem,
+without framing) with their receive time in a ring buffer in a named
+shared memory block. Any number of ShmRingReaders, typically in other
+processes, follow the ring at their own pace without copying. The writer
+never waits for readers: a reader that falls behind by more than the
+ring size loses the oldest packets (counted in numLost).
+
+The writer publishes a record before advancing the head, and advances
+the tail (oldest record) before overwriting. Readers check the tail
+again after reading, so an overwritten record is detected, not returned.
+
+Feeding a ring from a modem's receive path and consuming it elsewhere:
+
+    ring = ShmRingWriter('ahoi')
+    modem.com.addTelemetry(ring)
+    ...
+    for rec in ShmRingReader('ahoi').records():
+        process(rec.time, rec.data)  # data is a memoryview into the ring
+
+or, in the consuming process, modem.connect('shm://ahoi').
+"""
+
+import collections
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Set, Union
+
+from ahoi.com.base import ModemBaseCom
+from ahoi.com.registry import checkOptions
+from ahoi.modem.packet import byteArrayToPacket, getBytes
+
+RING_MAGIC = b'AHOR'
+RING_VERSION = 1
+RING_FORMAT = '<4sBB2xQQQQ'  # magic, version, closed, capacity, head, tail, seq
+RING_HDR_LEN = 64
+HEAD_OFFSET = 16
+TAIL_OFFSET = 24
+SEQ_OFFSET = 32
+CLOSED_OFFSET = 5
+
+REC_FORMAT = '<IIQ'  # data length, sequence number, rx time (ns since epoch)
+REC_HDR_LEN = struct.calcsize(REC_FORMAT)
+REC_WRAP = 0xFFFFFFFF  # length marking the unused end of the ring
+
+DFLT_SIZE = 1 << 20
+
+Record = collections.namedtuple('Record', ['seq', 'time', 'data'])
+
+created = set()  # type: Set[str]  # names of blocks created by this process
+
+
+def recLen(n):
+    """Space taken by a record with n data bytes (8-byte aligned)."""
+    return REC_HDR_LEN + ((n + 7) & ~7)
+
+
+def create(name, size):
+    """Create a shared memory block (name None for a random one), replacing a stale one."""
+    try:
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+    except FileExistsError:
+        stale = shared_memory.SharedMemory(name)
+        stale.close()
+        stale.unlink()
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+    created.add(shm.name)
+    return shm
+
+
+def attach(name):
+    """Open an existing shared memory block without taking ownership."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)  # pylint: disable=E1123
+    shm = shared_memory.SharedMemory(name)
+    if shm.name not in created:
+        # otherwise, the block is removed when this process exits
+        resource_tracker.unregister(shm._name, 'shared_memory')  # type: ignore
+    return shm
+
+
+class ShmRingWriter:
+    """Single producer of a shared memory packet ring of size bytes."""
+
+    def __init__(self, name=None, size=DFLT_SIZE):
+        size = (int(size) + 7) & ~7
+        self.shm = create(name, RING_HDR_LEN + size)
+        self.name = self.shm.name
+        self.capacity = size
+        self.numDropped = 0  # packets too large for the ring
+        self.__head = 0
+        self.__tail = 0
+        self.__seq = 0
+        self.__hdr = memoryview(self.shm.buf)[0:RING_HDR_LEN]
+        self.__data = memoryview(self.shm.buf)[RING_HDR_LEN:RING_HDR_LEN + size]
+        self.__closed = False
+        struct.pack_into(RING_FORMAT, self.__hdr, 0, RING_MAGIC, RING_VERSION, 0, size, 0, 0, 0)
+
+    def publish(self, data, t=None):
+        """Append packet bytes (as decoded by the streamer), t in s since epoch."""
+        n = len(data)
+        size = recLen(n)
+        if size > self.capacity:
+            self.numDropped += 1
+            return
+        ns = time.time_ns() if t is None else int(t * 1e9)
+
+        pos = self.__head
+        off = pos % self.capacity
+        wrap = off + size > self.capacity
+        if wrap:
+            pos += self.capacity - off
+        self.__advanceTail(pos + size)
+        if wrap:
+            struct.pack_into('<I', self.__data, off, REC_WRAP)
+            off = 0
+
+        struct.pack_into(REC_FORMAT, self.__data, off, n, self.__seq & 0xFFFFFFFF, ns)
+        self.__data[off + REC_HDR_LEN:off + REC_HDR_LEN + n] = data
+        self.__seq += 1
+        self.__head = pos + size
+        struct.pack_into('<Q', self.__hdr, SEQ_OFFSET, self.__seq)
+        struct.pack_into('<Q', self.__hdr, HEAD_OFFSET, self.__head)
+
+    def publishPkt(self, pkt, t=None):
+        """Append a packet."""
+        self.publish(getBytes(pkt), t)
+
+    def close(self, unlink=True):
+        """Mark ring closed (readers stop when done) and release it."""
+        if self.__closed:
+            return
+        self.__closed = True
+        struct.pack_into('<B', self.__hdr, CLOSED_OFFSET, 1)
+        self.__hdr.release()
+        self.__data.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+    def __advanceTail(self, end):
+        """Drop oldest records until the ring has room up to end."""
+        while end - self.__tail > self.capacity:
+            off = self.__tail % self.capacity
+            n = struct.unpack_from('<I', self.__data, off)[0]
+            if n == REC_WRAP:
+                self.__tail += self.capacity - off
+            else:
+                self.__tail += recLen(n)
+        struct.pack_into('<Q', self.__hdr, TAIL_OFFSET, self.__tail)
+
+
+class ShmRingReader:
+    """One consumer of a shared memory packet ring.
+
+    Starts with the oldest packet in the ring if fromStart, else with the
+    next one published. The data of returned records are views into the
+    ring; they must be released (or dropped) before close() and are only
+    valid until the writer overwrites them, which intact() tells.
+    """
+
+    POLL = 0.001  # s
+
+    def __init__(self, name, fromStart=False):
+        self.shm = attach(name)
+        magic, version, _, self.capacity, head, tail, _ = struct.unpack_from(RING_FORMAT, memoryview(self.shm.buf), 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            self.shm.close()
+            raise ValueError("%s is no ahoi packet ring" % name)
+        self.name = name
+        self.numRx = 0
+        self.numLost = 0
+        self.pos = tail if fromStart else head
+        self.__last = self.pos
+        self.__nextSeq = None  # type: Union[int, None]
+        self.__hdr = memoryview(self.shm.buf)[0:RING_HDR_LEN]
+        self.__data = memoryview(self.shm.buf)[RING_HDR_LEN:RING_HDR_LEN + self.capacity]
+        self.__detached = False
+
+    def closed(self):
+        """Check if the writer has closed the ring."""
+        return self.__hdr[CLOSED_OFFSET] != 0
+
+    def pending(self):
+        """Number of bytes not read yet."""
+        return self.__get(HEAD_OFFSET) - self.pos
+
+    def read(self):
+        """Return next record or None if there is none."""
+        while True:
+            head = self.__get(HEAD_OFFSET)
+            if self.pos >= head:
+                return None
+            tail = self.__get(TAIL_OFFSET)
+            if self.pos < tail:
+                self.pos = tail  # overrun, lost records are counted by seq
+            off = self.pos % self.capacity
+            n = struct.unpack_from('<I', self.__data, off)[0]
+            if n == REC_WRAP:
+                if self.__get(TAIL_OFFSET) <= self.pos:
+                    self.pos += self.capacity - off
+                continue
+            if n > self.capacity - off - REC_HDR_LEN:
+                if self.__get(TAIL_OFFSET) <= self.pos:
+                    self.pos = head  # corrupt, resync
+                continue
+            n, seq, ns = struct.unpack_from(REC_FORMAT, self.__data, off)
+            if self.__get(TAIL_OFFSET) > self.pos:
+                continue  # overwritten while reading
+            recPos = self.pos
+            self.pos += recLen(n)
+
+            if self.__nextSeq is not None and seq != self.__nextSeq:
+                self.numLost += (seq - self.__nextSeq) & 0xFFFFFFFF
+            self.__nextSeq = (seq + 1) & 0xFFFFFFFF
+            self.numRx += 1
+            self.__last = recPos
+            return Record(seq, ns / 1e9, self.__data[off + REC_HDR_LEN:off + REC_HDR_LEN + n])
+
+    def intact(self):
+        """Check if the data of the last record returned are still valid."""
+        return self.__get(TAIL_OFFSET) <= self.__last
+
+    def records(self, timeout=None, stop=None):
+        """Yield records as they are published.
+
+        Ends when the ring is closed (and read), stop() returns True, or
+        no record was published for timeout seconds.
+        """
+        tLast = time.monotonic()
+        while stop is None or not stop():
+            rec = self.read()
+            if rec is not None:
+                yield rec
+                tLast = time.monotonic()
+                continue
+            if self.closed():
+                return
+            if timeout is not None and time.monotonic() - tLast >= timeout:
+                return
+            time.sleep(self.POLL)
+
+    def packets(self, timeout=None, stop=None):
+        """Yield decoded packets (copied from the ring) as they are published."""
+        for rec in self.records(timeout, stop):
+            data = bytearray(rec.data)
+            rec.data.release()
+            if self.intact():
+                yield byteArrayToPacket(data, time.monotonic_ns(), int(rec.time * 1e9))
+            else:
+                self.numLost += 1
+
+    def close(self):
+        """Detach from ring (views of returned records must be released)."""
+        if self.__detached:
+            return
+        self.__detached = True
+        self.__hdr.release()
+        self.__data.release()
+        try:
+            self.shm.close()
+        except BufferError:
+            print("WARNING: records of ring %s still in use" % self.name)
+
+    def __get(self, offset):
+        return struct.unpack_from('<Q', self.__hdr, offset)[0]
+
+
+class ModemShmCom(ModemBaseCom):
+    """Receive packets from a shared memory ring (e.g. in a separate process).
+
+    Packets are handed to the callback like those of any other com
+    interface, with the writer's receive time as rxWallTime; the
+    receive time of the last packet is kept in lastRxTime. Sending is not
+    possible.
+    """
+
+    def __init__(self, name, cb=None, fromStart=False):
+        super().__init__(name, cb)
+        self.name = name
+        self.fromStart = fromStart
+        self.reader = None  # type: Union[ShmRingReader, None]
+        self.lastRxTime = 0.0  # s since epoch
+        self.__running = False
+
+    @classmethod
+    def fromUri(cls, scheme, loc, opts):
+        """Create from URI (shm://ahoi?fromStart=1)."""
+        checkOptions(opts, ('fromStart',))
+        return cls(loc.strip('/'), fromStart=opts.get('fromStart', '0') not in ('0', 'false', 'no'))
+
+    def connect(self, cb=None):
+        """Attach to ring, return success."""
+        super().connect(cb)
+        print("Attaching to shared memory ring %s" % self.name)
+        try:
+            self.reader = ShmRingReader(self.name, self.fromStart)
+        except (OSError, ValueError) as e:
+            print("ERROR: cannot attach to shared memory ring %s: %s" % (self.name, str(e)))
+            return False
+        self.__running = True
+        return True
+
+    def close(self):
+        """Terminate."""
+        self.__running = False
+        super().close()
+
+    def receive(self):
+        """Receive packets (blocking, until closed)."""
+        reader = self.reader
+        if reader is None:
+            return
+        for rec in reader.records(stop=lambda: not self.__running):
+            self.lastRxTime = rec.time
+            cb = self.rxCallback  # type: Union[Callable, None]
+            pkt = byteArrayToPacket(bytearray(rec.data), time.monotonic_ns(), int(rec.time * 1e9))
+            rec.data.release()
+            if not reader.intact():
+                reader.numLost += 1
+            elif cb is not None:
+                cb(pkt)
+        reader.close()
+        self.reader = None
+
+    def send(self, pkt):
+        """Drop packet (ring is receive only)."""
+        pass
+
+# eof
@@ -34,18 +34,40 @@
 #
 
 """Module for TCP modem com interfacing."""
+import errno
+import select
+import selectors
 import socket
+import struct
+import time
+from typing import Dict, Union
 
 import ahoi.modem.packet
 from ahoi.com.base import ModemBaseCom
+from ahoi.com.beacon import BeaconListener
+from ahoi.com.registry import checkOptions
+from ahoi.com.reconnect import ReconnectPolicy
+from ahoi.com.streamer import Streamer
+
+
+def peerName(addr):
+    """Printable address of a connected peer (TCP or Unix socket)."""
+    if isinstance(addr, tuple):
+        return "%s:%u" % addr[0:2]
+    return addr if addr else 'local client'
 
 
 class ModemSocketCom(ModemBaseCom):
     DFLT_PORT = 2464  # ahoi
 
+    FAMILY = socket.AF_INET
+    PROTO = 'TCP'
+
     CLIENT_TIMEOUT = 1.0
     SERVER_TIMEOUT = 1.0
 
+    RX_CHUNK = 4096  # max. bytes read (and decoded) at once
+
     def __init__(self, host='', port=None, cb=None):
         """Initialize socket com."""
         # FIXME how to handle host and port?
@@ -59,17 +81,50 @@ class ModemSocketCom(ModemBaseCom):
         self.sock = None
         self.conn = None
         self.serverMode = False
+        self.rcvBuf = None  # type: Union[int, None]
+        self.sndBuf = None  # type: Union[int, None]
         self.__forceClose = False
 
     def __del__(self):
         """Close connection."""
         self.close()
 
+    @classmethod
+    def fromUri(cls, scheme, loc, opts):
+        """Create from URI (tcp://host:port?rcvbuf=65536&sndbuf=65536&reconnect=0&backoff=0.5)."""
+        checkOptions(opts, ('rcvbuf', 'sndbuf', 'reconnect', 'backoff'))
+        host, _, port = loc.rstrip('/').partition(':')
+        com = cls(host, port if port else None)
+        if 'rcvbuf' in opts:
+            com.rcvBuf = int(opts['rcvbuf'])
+        if 'sndbuf' in opts:
+            com.sndBuf = int(opts['sndbuf'])
+        com.setReconnectPolicy(ReconnectPolicy.fromOptions(opts))
+        return com
+
+    def __setBufSizes(self, sock):
+        if self.rcvBuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvBuf)
+        if self.sndBuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndBuf)
+
     def __makeDev(self):
         #h = self.host
         #if not h:
         #    h = 'localhost'
-        self.dev = "%s:%u" % (self.host, self.port)
+        self.dev = self.devName()
+
+    def devName(self):
+        """Name of the connection."""
+        return "%s:%u" % (self.host, self.port)
+
+    def sockAddr(self):
+        """Address to connect or bind to."""
+        return (self.host, self.port)
+
+    def setNoDelay(self, sock):
+        """Send small packets immediately."""
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     def start(self, cb=None):
         """Start as server."""
@@ -81,15 +136,16 @@ class ModemSocketCom(ModemBaseCom):
         if cb is not None:
             self.rxCallback = cb
 
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock = socket.socket(self.FAMILY, socket.SOCK_STREAM)
+        self.__setBufSizes(self.sock)  # inherited by accepted connections
         #self.sock.settimeout(None) # disable time-out
         self.sock.settimeout(self.SERVER_TIMEOUT)
-        print("Opening server via TCP at %s:%u" % (self.host, self.port))
+        print("Opening server via %s at %s" % (self.PROTO, self.dev))
         #print("Opening server via TCP at %s:%u" % ('localhost', self.port))
         self.conn = None
 
         try:
-            self.sock.bind((self.host, self.port))
+            self.sock.bind(self.sockAddr())
             self.sock.listen(1)
         except Exception as e:
             print("socket.start(): " + str(e))  # FIXME debug message
@@ -97,32 +153,59 @@ class ModemSocketCom(ModemBaseCom):
             exit()
 
     def connect(self, cb=None):
-        """Connect to server."""
+        """Connect to server, return success (False if the reconnect policy gave up)."""
         if cb is not None:
             self.rxCallback = cb
+        self.closing = False
 
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        #self.sock.settimeout(None) # disable time-out
-        # FIXME do we need a time-out here?
-        # having it leads to a 103 exception (software abort),
-        # in interleaving fashion with expected 111 (conn refused)
-        #self.sock.settimeout(self.CLIENT_TIMEOUT)
+        print("Connecting via %s to %s" % (self.PROTO, self.dev))
+        if self.reconnectPolicy is not None:
+            return self.retryConnect(self.__open, initial=True)
 
-        print("Connecting via TCP to %s:%u" % (self.host, self.port))
         while True:
             try:
-                self.sock.connect((self.host, self.port))
-                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                self.conn = self.sock
+                self.__open()
                 break
             except Exception as e:
                 print("socket.connect(): " + str(e))  # FIXME debug message
                 choice = input("Server not available. Retry? [Y/n] ")
                 if choice.lower() in ["n", "no"]:
                     exit()
+        return True
+
+    def __open(self):
+        sock = socket.socket(self.FAMILY, socket.SOCK_STREAM)
+        self.__setBufSizes(sock)
+        #sock.settimeout(None) # disable time-out
+        # FIXME do we need a time-out here?
+        # having it leads to a 103 exception (software abort),
+        # in interleaving fashion with expected 111 (conn refused)
+        #sock.settimeout(self.CLIENT_TIMEOUT)
+        try:
+            sock.connect(self.sockAddr())
+        except:
+            sock.close()
+            raise
+        self.setNoDelay(sock)
+        self.sock = sock
+        self.conn = sock
+        return True
+
+    def __reconnect(self):
+        """Reconnect to server after the connection dropped, return success."""
+        if self.reconnectPolicy is None or self.closing or self.serverMode:
+            return False
+        try:
+            if self.conn is not None:
+                self.conn.close()
+        except OSError:
+            pass
+        self.conn = None
+        return self.retryConnect(self.__open)
 
     def close(self):
         """Terminate."""
+        self.closing = True
         if self.sock:
             self.__forceClose = True
             if self.sock != self.conn and self.conn:
@@ -153,11 +236,11 @@ class ModemSocketCom(ModemBaseCom):
                     while not self.__forceClose:
                         try:
                             self.conn, addr = self.sock.accept()
-                            self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                            self.setNoDelay(self.conn)
                             #self.sock.settimeout(self.SERVER_TIMEOUT)
                             # make sure that receiving doesn't block forever
                             self.conn.settimeout(self.SERVER_TIMEOUT)
-                            print("Connection from %s:%u established" % (addr[0], addr[1]))
+                            print("Connection from %s established" % peerName(addr))
                             break
                         except socket.timeout:
                             continue
@@ -168,9 +251,11 @@ class ModemSocketCom(ModemBaseCom):
                 while self.conn and not self.__forceClose:
                     try:
                         #rx = self.conn.recv(1, socket.MSG_CMSG_CLOEXEC)
-                        rx = self.conn.recv(1)
+                        rx = self.conn.recv(self.RX_CHUNK)
                         if not rx:
                             if not self.serverMode:
+                                if self.__reconnect():
+                                    continue
                                 print("ERROR: socket probably disconnected")
                                 return  # FIXME is this enough?
                             else:
@@ -179,6 +264,8 @@ class ModemSocketCom(ModemBaseCom):
                     except socket.timeout:
                         continue
                     except Exception as e:
+                        if self.__reconnect():
+                            continue
                         print("socket.receive() rx: " + str(e))  # FIXME debug message
                         return
 
@@ -186,12 +273,80 @@ class ModemSocketCom(ModemBaseCom):
 
         return
 
+    def poll(self, timeout=0.0):
+        """Handle received bytes, waiting up to timeout (s) for them.
+
+        In server mode, a waiting client is accepted first.
+        """
+        if self.sock is None:
+            return -1
+        if self.conn is None:
+            if not self.serverMode:
+                return 0 if self.__reconnect() else -1
+            if len(select.select([self.sock], [], [], timeout)[0]) == 0:
+                return 0
+            try:
+                self.conn, addr = self.sock.accept()
+            except OSError as e:
+                print("socket.poll() srv: " + str(e))  # FIXME debug message
+                return -1
+            self.setNoDelay(self.conn)
+            self.conn.settimeout(self.SERVER_TIMEOUT)
+            print("Connection from %s established" % peerName(addr))
+            return 0
+
+        if len(select.select([self.conn], [], [], timeout)[0]) == 0:
+            return 0
+        try:
+            rx = self.conn.recv(self.RX_CHUNK)
+        except OSError as e:
+            if self.__reconnect():
+                return 0
+            print("socket.poll() rx: " + str(e))  # FIXME debug message
+            return -1
+        if not rx:
+            if self.serverMode:
+                print("Client disconnected")
+                self.conn.close()
+                self.conn = None
+                return 0
+            if self.__reconnect():
+                return 0
+            print("ERROR: socket probably disconnected")
+            return -1
+
+        super().processRx(rx)
+        return len(rx)
+
+    def fileno(self):
+        """File descriptor of the connection (of the server socket, while waiting for a client)."""
+        if self.conn is not None:
+            return self.conn.fileno()
+        if self.serverMode and self.sock is not None:
+            return self.sock.fileno()
+        return None
+
     def send(self, pkt):
         """Send a packet."""
 
         # send encoded data
         tx = super().processTx(pkt)
-        if self.conn is not None:
+        if self.reconnectPolicy is None:
+            if self.conn is not None:
+                self.writeRaw(tx)
+            return
+
+        # keep packet until reconnected
+        try:
+            self.writeRaw(tx)
+        except OSError:
+            self.queueTx(tx)
+
+    def writeRaw(self, tx):
+        """Write encoded data."""
+        with self.txLock:
+            if self.conn is None:
+                raise OSError("not connected")
             self.conn.sendall(tx)
 
     @classmethod
@@ -200,7 +355,8 @@ class ModemSocketCom(ModemBaseCom):
         return ModemBaseCom.scanAndSelect(cls)
 
     @staticmethod
-    def scan(subrange=range(1, 255), port=None, timeout=0.1):
+    def scan(subrange=range(1, 255), port=None, timeout=0.5, maxConcurrent=64, verify=False):
+        """Probe local /24 network for gateways, return list of IPs."""
         baseIp = ModemSocketCom.__getip()
         baseIpParts = baseIp.split('.')
         ipLst = []
@@ -210,39 +366,126 @@ class ModemSocketCom(ModemBaseCom):
         if port is None:
             port = ModemSocketCom.DFLT_PORT
 
-        baseIpParts[3] = str(subrange[0])
-        sip = '.'.join(baseIpParts)
-        baseIpParts[3] = str(subrange[-1])
-        eip = '.'.join(baseIpParts)
-        print("probing network %s - %s on port %u" % (sip, eip, port))
-        i = 0
-        for p in subrange:
-            if i % 64 == 0:
-                print('%3u: ' % (subrange[i]), end='', flush=True)
-
-            # prepare ip address to test
-            baseIpParts[3] = str(p)
-            tip = '.'.join(baseIpParts)
-            #print("%s " % tip, end='')
-
-            # try to connect and add to list, if successful
-            try:
-                tsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                tsock.settimeout(timeout)  # disable time-out
-                tsock.connect((tip, port))
-                tsock.close()
-                ipLst.append(tip)
-                print('*', end='', flush=True)
-            except:
-                print('.', end='', flush=True)
-
-            # line-wrap
-            i = i + 1
-            if i % 64 == 0 or i == len(subrange):
-                print('', flush=True)
+        prefix = '.'.join(baseIpParts[0:3]) + '.'
+        print("probing network %s%u - %s%u on port %u" % (prefix, subrange[0], prefix, subrange[-1], port))
+        hosts = [prefix + str(p) for p in subrange]
+        for (tip, version) in ModemSocketCom.scanIter(hosts, port, timeout, maxConcurrent, verify):
+            if version is not None:
+                print("found %s (%s)" % (tip, version), flush=True)
+            else:
+                print("found %s" % tip, flush=True)
+            ipLst.append(tip)
+        print("found %u host(s)" % len(ipLst))
 
         return ipLst
 
+    @staticmethod
+    def scanIter(hosts, port=None, timeout=0.5, maxConcurrent=64, verify=False):
+        """Probe hosts concurrently, yield (host, version) as they respond.
+
+        At most maxConcurrent connection attempts are pending at a time.
+        With verify, a version request is sent to every responding host
+        and only hosts answering it are yielded (with the version string,
+        else version is None).
+        """
+        if port is None:
+            port = ModemSocketCom.DFLT_PORT
+        request = bytes(Streamer().enc(ahoi.modem.packet.getBytes(ahoi.modem.packet.makePacket(pkt_type=0x80))))
+
+        sel = selectors.DefaultSelector()
+        pending = iter(hosts)
+        probes = {}  # type: Dict[socket.socket, list]  # sock -> [host, deadline, streamer]
+        more = True
+        try:
+            while more or probes:
+                # start new probes
+                while more and len(probes) < maxConcurrent:
+                    host = next(pending, None)
+                    if host is None:
+                        more = False
+                        break
+                    tsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    tsock.setblocking(False)
+                    err = tsock.connect_ex((host, port))
+                    if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                        tsock.close()
+                        continue
+                    probes[tsock] = [host, time.monotonic() + timeout, None]
+                    sel.register(tsock, selectors.EVENT_WRITE, tsock)
+
+                # wait for connections and responses
+                if probes:
+                    now = time.monotonic()
+                    wait = max(0.0, min(p[1] for p in probes.values()) - now)
+                    for key, mask in sel.select(wait):
+                        tsock = key.data
+                        host, deadline, streamer = probes[tsock]
+                        found = None
+                        if streamer is None:
+                            # connection attempt finished
+                            if tsock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0:
+                                found = False
+                            elif not verify:
+                                yield (host, None)
+                                found = True
+                            else:
+                                try:
+                                    tsock.send(request)
+                                except OSError:
+                                    found = False
+                                else:
+                                    probes[tsock][1] = time.monotonic() + timeout
+                                    probes[tsock][2] = Streamer()
+                                    sel.modify(tsock, selectors.EVENT_READ, tsock)
+                        else:
+                            # wait for version response
+                            try:
+                                rx = tsock.recv(4096)
+                            except OSError:
+                                rx = b''
+                            if not rx:
+                                found = False
+                            for b in rx:
+                                r = streamer.dec(b)
+                                if r is not None:
+                                    try:
+                                        pkt = ahoi.modem.packet.byteArrayToPacket(r)
+                                    except struct.error:
+                                        found = False  # garbage, not a modem
+                                        break
+                                    if pkt.header.type == 0x80:
+                                        yield (host, bytes(pkt.payload).decode('ascii', 'replace'))
+                                        found = True
+                                        break
+                        if found is not None:
+                            sel.unregister(tsock)
+                            tsock.close()
+                            del probes[tsock]
+
+                # drop probes that timed out
+                now = time.monotonic()
+                for tsock in [t for (t, p) in probes.items() if p[1] <= now]:
+                    sel.unregister(tsock)
+                    tsock.close()
+                    del probes[tsock]
+        finally:
+            for tsock in probes:
+                tsock.close()
+            sel.close()
+
+    @staticmethod
+    def discover(timeout=0.5, addr='<broadcast>', num=None):
+        """Find gateways via UDP beacons, return list of Gateway tuples.
+
+        Waits up to timeout seconds, or until num gateways are found.
+        """
+        listener = BeaconListener()
+        listener.start()
+        listener.query(addr)
+        gateways = listener.wait(timeout, num)
+        listener.close()
+        return gateways
+
     @staticmethod
     def __getip():
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
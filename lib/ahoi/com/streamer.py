@@ -37,6 +37,10 @@
 
 import copy
 
+from ahoi.metrics.registry import REGISTRY
+
+FRAMING_ABORTS = REGISTRY.counter('ahoi_framing_aborts_total', 'Frames aborted due to an invalid byte after DLE').labels()
+
 
 class Streamer:
     DLE = 0x10
@@ -81,6 +85,7 @@ class Streamer:
                 del self.res[:]
                 self.flagInPacket = False
                 self.flagDLE = False
+                FRAMING_ABORTS.inc()
 
         return None
 
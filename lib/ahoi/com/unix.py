@@ -0,0 +1,115 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for Unix domain socket modem com interfacing.
+
+Same-host clients (e.g., of sfwd) can use a Unix domain socket instead
+of TCP, which bypasses the TCP/IP stack and does not depend on the
+network configuration.
+"""
+
+import os
+import socket
+import stat
+
+from ahoi.com.socket import ModemSocketCom
+from ahoi.com.registry import checkOptions
+from ahoi.com.reconnect import ReconnectPolicy
+
+DFLT_PATH = '/tmp/ahoi.sock'
+
+
+def removeStale(path):
+    """Remove socket file left over by a previous server."""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+class ModemUnixCom(ModemSocketCom):
+    """Modem com via a Unix domain socket (client or server)."""
+
+    FAMILY = socket.AF_UNIX
+    PROTO = 'Unix socket'
+
+    def __init__(self, path=None, cb=None):
+        """Initialize Unix socket com."""
+        super().__init__(path if path else DFLT_PATH, None, cb)
+
+    @classmethod
+    def fromUri(cls, scheme, loc, opts):
+        """Create from URI (unix:///tmp/ahoi.sock?reconnect=0&backoff=0.5)."""
+        checkOptions(opts, ('rcvbuf', 'sndbuf', 'reconnect', 'backoff'))
+        com = cls(loc)
+        if 'rcvbuf' in opts:
+            com.rcvBuf = int(opts['rcvbuf'])
+        if 'sndbuf' in opts:
+            com.sndBuf = int(opts['sndbuf'])
+        com.setReconnectPolicy(ReconnectPolicy.fromOptions(opts))
+        return com
+
+    def devName(self):
+        """Name of the connection (socket path)."""
+        return self.host
+
+    def sockAddr(self):
+        """Path to connect or bind to."""
+        return self.host
+
+    def setNoDelay(self, sock):
+        """Nothing to do (no Nagle algorithm)."""
+        pass
+
+    def start(self, cb=None):
+        """Start as server."""
+        removeStale(self.host)
+        super().start(cb)
+
+    def close(self):
+        """Terminate (and remove socket file of server)."""
+        path = self.host
+        serverMode = self.serverMode and self.sock is not None
+        super().close()
+        if serverMode:
+            removeStale(path)
+
+    @staticmethod
+    def scan():
+        """Find sockets in default location."""
+        return [DFLT_PATH] if os.path.exists(DFLT_PATH) else []
+
+# eof
@@ -35,11 +35,15 @@
 
 """Handler base class."""
 from abc import ABC
+from typing import Tuple, Union
 
 
 class Handler(ABC):
     """Handler."""
 
+    # packet types to subscribe to (None for all)
+    PKT_TYPES = None  # type: Union[Tuple[int, ...], None]
+
     def reset(self):
         """reset internal state."""
         pass
@@ -40,17 +40,19 @@ from collections import deque
 from typing import Deque
 
 from ahoi.handlers.Handler import Handler
-import matplotlib.pyplot as plt
 
 class RangingHandler(Handler):
     """RangingHandler."""
 
+    PKT_TYPES = (0x7F,)
+
     def __init__(self, c=1490, n=100):
         # TODO
         self.seq = deque()  # type: Deque[int]
         self.dist = deque() # type: Deque[int]
         self.c = c
         self.n = n
+        import matplotlib.pyplot as plt  # slow to load, import only when needed
         self.fig = plt.figure()
         self.ax = self.fig.add_subplot(1, 1, 1)
 
@@ -88,6 +90,8 @@ class RangingHandler(Handler):
         return True
 
     def plot(self):
+        import matplotlib.pyplot as plt
+
         # reset plot
         self.ax.clear()
 
@@ -112,6 +116,7 @@ class RangingHandler(Handler):
 
     def close(self):
         if self.fig:
+            import matplotlib.pyplot as plt
             plt.close(self.fig)
 
         # EOF
@@ -43,6 +43,8 @@ from ahoi.handlers.Handler import Handler
 class SampleHandler(Handler):
     """SampleHandler."""
 
+    PKT_TYPES = (0xA0,)
+
     def __init__(self, nAdc=12):
         # TODO
         self.src = -1
@@ -37,10 +37,6 @@
 
 from ahoi.handlers.SampleHandler import SampleHandler
 
-import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.mlab import window_none
-
 
 class SamplePlotHandler(SampleHandler):
     """SamplePlotHandler."""
@@ -77,6 +73,11 @@ class SamplePlotHandler(SampleHandler):
         return ret
 
     def plot(self):
+        # numpy and matplotlib are slow to load, import only when plotting
+        import numpy as np
+        import matplotlib.pyplot as plt
+        from matplotlib.mlab import window_none
+
         if self.fig is None or self.axs is None:
             self.fig, self.axs = plt.subplots(nrows=2, ncols=1, figsize=(10, 6))  # figsize = (a,b)
             self.__cbar = False
@@ -146,6 +147,7 @@ class SamplePlotHandler(SampleHandler):
 
     def close(self):
         if self.fig:
+            import matplotlib.pyplot as plt
             plt.close(self.fig)
             self.fig = None
 
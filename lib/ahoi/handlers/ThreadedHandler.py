@@ -0,0 +1,171 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Handler wrapper running another handler on a worker thread."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+from ahoi.handlers.Handler import Handler
+from ahoi.metrics import trace
+from ahoi.metrics.registry import trackQueue
+
+
+class ThreadedHandler(Handler):
+    """ThreadedHandler.
+
+    handler is a Handler or a function taking a packet (e.g., an rx
+    callback that sends, sleeps or updates a GUI). Packets are put into a bounded queue on the receiving thread and are
+    handed to the wrapped handler by a worker thread. If the queue is full,
+    the policy decides what happens:
+    BLOCK waits for the worker (no loss, but stalls the receiving thread),
+    DROP_OLDEST discards the oldest queued packet and
+    COALESCE only keeps the latest queued packet per packet type and source
+    (and drops the oldest, if still full).
+    """
+
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop-oldest'
+    COALESCE = 'coalesce-latest'
+
+    numInstances = 0  # to name queues in metrics
+
+    def __init__(self, handler, policy=BLOCK, maxlen=64):
+        if policy not in (self.BLOCK, self.DROP_OLDEST, self.COALESCE):
+            raise ValueError("unknown queue policy '%s'" % policy)
+        self.handler = handler
+        self.PKT_TYPES = getattr(handler, 'PKT_TYPES', None)
+        self.policy = policy
+        self.maxlen = max(1, maxlen)
+        self.queue = OrderedDict()  # type: OrderedDict
+        self.numDropped = 0
+        self.numHandled = 0
+        self.__cond = threading.Condition()
+        self.__seq = 0
+        self.__running = True
+        self.__handle = getattr(handler, 'handlePkt', handler)
+        self.__name = getattr(handler, '__qualname__', type(handler).__name__)
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        ThreadedHandler.numInstances += 1
+        trackQueue('%s.%u' % (self.__name, ThreadedHandler.numInstances), self,
+                   lambda h: len(h.queue), lambda h: h.numDropped)
+
+    def reset(self):
+        """reset internal state (numDropped is kept as statistics)."""
+        with self.__cond:
+            self.queue.clear()
+            self.numHandled = 0
+            self.__cond.notify_all()
+        if hasattr(self.handler, 'reset'):
+            self.handler.reset()
+
+    def handlePkt(self, pkt):
+        """queue a modem pkt for the worker thread"""
+        with self.__cond:
+            if not self.__running:
+                return False
+
+            if self.policy == self.COALESCE:
+                key = (pkt.header.type, pkt.header.src)  # type: Hashable
+                if key in self.queue:
+                    del self.queue[key]
+                    self.numDropped += 1
+            else:
+                key = self.__seq
+                self.__seq += 1
+
+            if len(self.queue) >= self.maxlen:
+                if self.policy == self.BLOCK:
+                    while len(self.queue) >= self.maxlen and self.__running:
+                        self.__cond.wait()
+                    if not self.__running:
+                        return False  # closed meanwhile, no worker to handle pkt
+                else:
+                    self.queue.popitem(last=False)
+                    self.numDropped += 1
+
+            self.queue[key] = pkt
+            self.__cond.notify_all()
+
+        return True
+
+    def update(self):
+        """update internal state, redraw, etc."""
+        if hasattr(self.handler, 'update'):
+            self.handler.update()
+
+    def qsize(self):
+        """Number of packets waiting for the worker."""
+        return len(self.queue)
+
+    def close(self):
+        """Stop worker (after handling queued packets) and close handler."""
+        with self.__cond:
+            if not self.__running:
+                return
+            self.__running = False
+            self.__cond.notify_all()
+        if threading.current_thread() is not self.__thread:
+            self.__thread.join()
+        if hasattr(self.handler, 'close'):
+            self.handler.close()
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while self.__running and len(self.queue) == 0:
+                    self.__cond.wait()
+                if len(self.queue) == 0:
+                    return
+                pkt = self.queue.popitem(last=False)[1]
+                self.__cond.notify_all()
+
+            tr = trace.tracer
+            if tr is not None:
+                t0 = time.monotonic_ns()
+                if pkt.rxTime is not None:
+                    tr.span('wait:' + self.__name, pkt.rxTime, t0, pkt.header.type, 'handler')
+            try:
+                self.__handle(pkt)
+            except Exception as e:
+                print("ThreadedHandler: %s" % str(e))
+            self.numHandled += 1
+            if tr is not None:
+                tr.span('run:' + self.__name, t0, time.monotonic_ns(), pkt.header.type, 'handler')
+
+# EOF
@@ -35,8 +35,6 @@
 
 from io import BytesIO
 
-from PIL import Image
-
 # jfif symbols
 SOI = 0xD8  # Start Of Image
 APP0 = 0xE0  # JFIF tag
@@ -151,6 +149,8 @@ class jfif_splitter:
         self._split()
 
     def getImage(self):
+        from PIL import Image
+
         if not self.headerComplete:
             return None
 
@@ -39,13 +39,16 @@ import os
 import threading
 import time
 from dataclasses import dataclass
-from typing import Union
+from typing import Union, TYPE_CHECKING
 
-from ahoi.imgtx.helpers import camera
-# other imports
-from ahoi.imgtx.helpers import imageviewer, jfif_splitter
+# other imports (camera and GUI are imported when needed, they are slow to load)
+from ahoi.imgtx.helpers import jfif_splitter
 # modem imports
 from ahoi.modem.modem import Modem
+from ahoi.handlers.ThreadedHandler import ThreadedHandler
+
+if TYPE_CHECKING:
+    from ahoi.imgtx.helpers import imageviewer
 
 SIMULATION = False  # simulation mode with bridged FTDI connectors. Soft-Ack required!
 
@@ -130,7 +133,9 @@ class ImageTx:
         self.myModem = Modem()
         self.myModem.connect(dev)
         self.myModem.setRxEcho(True)
-        self.myModem.addRxCallback(self._receive)
+        # _receive sends acks, sleeps and updates the GUI, keep it off the rx thread
+        self.rxHandler = ThreadedHandler(self._receive)
+        self.myModem.addRxHandler(self.rxHandler)
         self.myModem.receive(thread=True)
 
         self._initModem(rxGain, agc, txGain, bitSpread)
@@ -346,6 +351,8 @@ class ImageTx:
             self._endImgReceiving(rxPktStat)
 
     def _startImgReceiving(self):
+        from ahoi.imgtx.helpers import imageviewer
+
         if self.gui is None:
             self.gui = imageviewer.imageviewer()
         else:
@@ -490,6 +497,8 @@ class ImageTx:
         self._startReceivingTimeoutTimer()
 
     def transmitImg(self):
+        from ahoi.imgtx.helpers import camera
+
         cam = camera.camera()
         img = cam.capture(self.imgParam.size, self.imgParam.useFlash)
 
@@ -603,6 +612,7 @@ class ImageTx:
         self.runTransThread = False
         self.lock.release()
         self.transThread.join(1)
+        self.rxHandler.close()
         if self.gui is not None:
             self.gui.close()
         if self.myModem is not None:
@@ -0,0 +1,67 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for lateration (position estimate from distances to anchors)."""
+
+import numpy as np
+
+
+def laterate(anchors, z=0.0):
+    """Estimate position (x, y) of a node at known depth z.
+
+    anchors is a list of (x, y, z, d) tuples with d being the measured
+    distance to the anchor. Returns None for less than 3 anchors.
+    """
+    N = len(anchors)
+    if N < 3:
+        return None
+
+    ## prepare matrix
+    M = np.empty([N - 1, 2], dtype=float)   # type: np.ndarray
+    b = np.empty([N - 1, 1], dtype=float)   # type: np.ndarray
+    x0, y0, z0, d0 = anchors[0]
+    rr0 = -d0 ** 2 + (z0 - z) ** 2 + x0 ** 2 + y0 ** 2
+    for i in range(1, N):
+        xi, yi, zi, di = anchors[i]
+        rri = di ** 2 - (zi - z) ** 2
+        M[i - 1][0] = 2 * (x0 - xi)
+        M[i - 1][1] = 2 * (y0 - yi)
+        b[i - 1] = rri + rr0 - xi ** 2 - yi ** 2
+
+    ## solve with BLAS
+    x, y = np.linalg.lstsq(M, b, rcond=None)[0].ravel()
+    return float(x), float(y)
+
+# eof
@@ -0,0 +1,99 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for serving metrics via HTTP in the Prometheus text format."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Union
+
+from ahoi.metrics.registry import REGISTRY
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DFLT_PORT = 9464
+
+
+class MetricsServer:
+    """Serve the metrics of registry at http://host:port/metrics."""
+
+    def __init__(self, host='', port=DFLT_PORT, registry=REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.httpd = None  # type: Union[ThreadingHTTPServer, None]
+        self.__thread = None  # type: Union[threading.Thread, None]
+
+    def start(self):
+        """Start serving in a background thread, return success."""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # no line per scrape
+
+        try:
+            self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            print("ERROR: cannot serve metrics at port %u: %s" % (self.port, str(e)))
+            return False
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        print("Serving metrics via HTTP at %s:%u" % (self.host, self.port))
+        self.__thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.__thread.start()
+        return True
+
+    def close(self):
+        """Stop serving."""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+# eof
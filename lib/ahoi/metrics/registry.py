@@ -0,0 +1,268 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for collecting counters, gauges and histograms.
+
+Metrics are registered once (by name) in a Registry, usually the global
+REGISTRY, and their series (one per combination of label values) are
+looked up once and kept by the code that updates them:
+
+    RX_BYTES = REGISTRY.counter('ahoi_rx_bytes_total', 'Bytes received', ('dev',))
+    rxBytes = RX_BYTES.labels('/dev/ttyUSB0')
+    rxBytes.inc(len(rx))
+
+Updates are guarded by a lock per metric, as series are updated from
+the receiving thread, senders and server threads. A series can also be
+read from a function at collection time (setFunction), which costs
+nothing on the data path, e.g. for queue depths. Such a series is removed once its
+function raises ReferenceError (use a weakref.proxy to its object).
+
+snapshot() returns all values, text() renders them in the Prometheus
+text format (see ahoi.metrics.exporter).
+"""
+
+import bisect
+import math
+import threading
+import weakref
+from typing import Callable, Dict, List, Tuple, Union
+
+# default histogram buckets (upper bounds in s), from 10 us to 10 s
+TIME_BUCKETS = (1e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+class Series:
+    """Value of a counter or gauge for one set of label values."""
+
+    __slots__ = ('value', 'fn', 'lock')
+
+    def __init__(self, lock):
+        self.value = 0.0
+        self.fn = None  # type: Union[Callable, None]
+        self.lock = lock
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+    def dec(self, n=1):
+        with self.lock:
+            self.value -= n
+
+    def set(self, v):
+        self.value = v
+
+    def setFunction(self, fn):
+        """Read value from fn() when collected."""
+        self.fn = fn
+
+    def get(self):
+        if self.fn is not None:
+            return self.fn()
+        return self.value
+
+
+class HistogramSeries:
+    """Distribution of observed values for one set of label values."""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count', 'lock')
+
+    def __init__(self, bounds, lock):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = lock
+
+    def observe(self, v):
+        i = bisect.bisect_left(self.bounds, v)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += v
+            self.count += 1
+
+    def get(self):
+        """Return dict of cumulative bucket counts (by upper bound), sum and count."""
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+            count = self.count
+        buckets = {}
+        n = 0
+        for (b, c) in zip(self.bounds + (math.inf,), counts):
+            n += c
+            buckets[b] = n
+        return {'buckets': buckets, 'sum': total, 'count': count}
+
+
+class Metric:
+    """Named metric with series per label values."""
+
+    def __init__(self, kind, name, help='', labelNames=(), buckets=TIME_BUCKETS):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # type: Dict[Tuple[str, ...], Union[Series, HistogramSeries]]
+        self.__lock = threading.Lock()  # for adding and removing series
+        self.__updateLock = threading.Lock()  # for updating values of series
+
+    def labels(self, *values):
+        """Return series for label values (created on first use)."""
+        key = tuple(str(v) for v in values)
+        s = self.series.get(key)
+        if s is None:
+            if len(key) != len(self.labelNames):
+                raise ValueError("%s expects labels %s" % (self.name, ', '.join(self.labelNames)))
+            with self.__lock:
+                s = self.series.get(key)
+                if s is None:
+                    if self.kind == 'histogram':
+                        s = HistogramSeries(self.buckets, self.__updateLock)
+                    else:
+                        s = Series(self.__updateLock)
+                    series = dict(self.series)
+                    series[key] = s
+                    self.series = series  # swap, so that readers need no lock
+        return s
+
+    def remove(self, *values):
+        """Remove series for label values."""
+        key = tuple(str(v) for v in values)
+        with self.__lock:
+            series = dict(self.series)
+            series.pop(key, None)
+            self.series = series
+
+    def collect(self):
+        """Return list of (label values, value) of all series."""
+        res = []
+        for (key, s) in self.series.items():
+            try:
+                v = s.get()
+            except ReferenceError:
+                self.remove(*key)  # object of function is gone
+                continue
+            if v is not None:
+                res.append((key, v))
+        return res
+
+
+class Registry:
+    """Set of metrics by name."""
+
+    def __init__(self):
+        self.metrics = {}  # type: Dict[str, Metric]
+        self.__lock = threading.Lock()
+
+    def counter(self, name, help='', labelNames=()):
+        """Register (or return registered) counter."""
+        return self.__register('counter', name, help, labelNames)
+
+    def gauge(self, name, help='', labelNames=()):
+        """Register (or return registered) gauge."""
+        return self.__register('gauge', name, help, labelNames)
+
+    def histogram(self, name, help='', labelNames=(), buckets=TIME_BUCKETS):
+        """Register (or return registered) histogram with buckets (upper bounds)."""
+        return self.__register('histogram', name, help, labelNames, buckets)
+
+    def snapshot(self):
+        """Return dict of metric name to list of (labels as dict, value)."""
+        res = {}
+        for m in list(self.metrics.values()):
+            res[m.name] = [(dict(zip(m.labelNames, key)), v) for (key, v) in m.collect()]
+        return res
+
+    def text(self):
+        """Render all metrics in the Prometheus text format."""
+        lines = []  # type: List[str]
+        for m in sorted(self.metrics.values(), key=lambda m: m.name):
+            lines.append("# HELP %s %s" % (m.name, m.help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append("# TYPE %s %s" % (m.name, m.kind))
+            for (key, v) in sorted(m.collect()):
+                labels = list(zip(m.labelNames, key))
+                if m.kind != 'histogram':
+                    lines.append("%s%s %s" % (m.name, formatLabels(labels), formatValue(v)))
+                    continue
+                for (b, n) in v['buckets'].items():
+                    lines.append("%s_bucket%s %u" % (m.name, formatLabels(labels + [('le', formatValue(b))]), n))
+                lines.append("%s_sum%s %s" % (m.name, formatLabels(labels), formatValue(v['sum'])))
+                lines.append("%s_count%s %u" % (m.name, formatLabels(labels), v['count']))
+        return "\n".join(lines) + "\n"
+
+    def __register(self, kind, name, help, labelNames, buckets=TIME_BUCKETS):
+        with self.__lock:
+            m = self.metrics.get(name)
+            if m is None:
+                m = Metric(kind, name, help, labelNames, buckets)
+                self.metrics[name] = m
+            elif m.kind != kind or m.labelNames != tuple(labelNames):
+                raise ValueError("metric %s already registered as %s %s" % (name, m.kind, m.labelNames))
+            return m
+
+
+def formatLabels(labels):
+    """Render list of (name, value) as {name="value",...}."""
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for (k, v) in labels) + '}'
+
+
+def formatValue(v):
+    """Render number as Prometheus value."""
+    if v == math.inf:
+        return '+Inf'
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return '%d' % v
+    return repr(v)
+
+
+REGISTRY = Registry()
+
+QUEUE_DEPTH = REGISTRY.gauge('ahoi_queue_depth', 'Entries waiting in a queue', ('queue',))
+QUEUE_DROPPED = REGISTRY.counter('ahoi_queue_dropped_total', 'Entries dropped from a full queue', ('queue',))
+
+
+def trackQueue(name, obj, depth, dropped=None):
+    """Report depth(obj) and dropped(obj) of queue name (until obj is gone)."""
+    ref = weakref.proxy(obj)
+    QUEUE_DEPTH.labels(name).setFunction(lambda: depth(ref))
+    if dropped is not None:
+        QUEUE_DROPPED.labels(name).setFunction(lambda: dropped(ref))
+
+# eof
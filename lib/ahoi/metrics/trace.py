@@ -0,0 +1,160 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for tracing packets through the receive pipeline.
+
+While enabled, the stages of the receive path record events with
+time.monotonic_ns() timestamps into a preallocated ring (the oldest
+events are overwritten):
+
+    read      bytes read from the connection (arg: number of bytes)
+    frame     end of frame decoded by the streamer (arg: frame length)
+    decode    frame converted to a packet (arg: packet type)
+    dispatch  packet handed to all rx callbacks (arg: packet type)
+    <cb>      one rx callback or handler (category handler)
+    wait:<h>  packet waiting in the queue of a ThreadedHandler
+    run:<h>   packet handled by the worker of a ThreadedHandler
+
+Every hook is a single check of the module's tracer for None, so tracing
+costs next to nothing when disabled:
+
+    tr = trace.tracer
+    if tr is not None:
+        tr.span('decode', t0, time.monotonic_ns(), pkt.header.type)
+
+The trace is written in the Chrome trace event format (load it in
+chrome://tracing or ui.perfetto.dev).
+"""
+
+import array
+import json
+import os
+import threading
+from typing import List, Union
+
+DFLT_SIZE = 1 << 16
+
+
+class Tracer:
+    """Ring of size trace events.
+
+    Recording takes no lock; events of concurrent threads may rarely
+    overwrite each other.
+    """
+
+    def __init__(self, size=DFLT_SIZE):
+        self.size = size
+        self.num = 0  # events recorded (incl. overwritten ones)
+        self.start = array.array('q', bytes(8 * size))  # ns
+        self.dur = array.array('q', bytes(8 * size))  # ns, -1 for instant events
+        self.name = [''] * size  # type: List[str]
+        self.cat = [''] * size  # type: List[str]
+        self.arg = [None] * size  # type: List
+        self.tid = [0] * size  # type: List[int]
+
+    def instant(self, name, t, arg=None, cat='rx'):
+        """Record an event at t (ns)."""
+        i = self.num % self.size
+        self.num += 1
+        self.start[i] = t
+        self.dur[i] = -1
+        self.name[i] = name
+        self.cat[i] = cat
+        self.arg[i] = arg
+        self.tid[i] = threading.get_ident()
+
+    def span(self, name, t0, t1, arg=None, cat='rx'):
+        """Record an event lasting from t0 to t1 (ns)."""
+        i = self.num % self.size
+        self.num += 1
+        self.start[i] = t0
+        self.dur[i] = t1 - t0
+        self.name[i] = name
+        self.cat[i] = cat
+        self.arg[i] = arg
+        self.tid[i] = threading.get_ident()
+
+    def clear(self):
+        """Drop all events."""
+        self.num = 0
+
+    def events(self):
+        """Return recorded events (oldest first) in the Chrome trace event format."""
+        pid = os.getpid()
+        first = max(0, self.num - self.size)
+        res = []
+        for n in range(first, self.num):
+            i = n % self.size
+            ev = {'name': self.name[i], 'cat': self.cat[i], 'ts': self.start[i] / 1e3, 'pid': pid, 'tid': self.tid[i]}
+            if self.dur[i] < 0:
+                ev['ph'] = 'i'
+                ev['s'] = 't'
+            else:
+                ev['ph'] = 'X'
+                ev['dur'] = self.dur[i] / 1e3
+            if self.arg[i] is not None:
+                ev['args'] = {'arg': self.arg[i]}
+            res.append(ev)
+        for t in threading.enumerate():
+            if t.ident is not None:
+                res.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': t.ident, 'args': {'name': t.name}})
+        return res
+
+    def dump(self, fileName):
+        """Write recorded events to fileName (Chrome trace JSON), return number of events."""
+        events = self.events()
+        with open(fileName, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ns'}, f)
+        return min(self.num, self.size)
+
+
+tracer = None  # type: Union[Tracer, None]
+
+
+def enable(size=DFLT_SIZE):
+    """Start tracing into a new ring of size events, return tracer."""
+    global tracer
+    tracer = Tracer(size)
+    return tracer
+
+
+def disable():
+    """Stop tracing, return tracer (with the recorded events) or None."""
+    global tracer
+    tr = tracer
+    tracer = None
+    return tr
+
+# eof
@@ -0,0 +1,145 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for caching modem configuration values."""
+
+import time
+from typing import Dict, Tuple, Union
+
+
+class ConfigCache:
+    """Cache of modem configuration values (keyed by command type).
+
+    Values are taken from the payload of the modem's responses to get and
+    set commands (so that rejected or lost set commands are not cached).
+    Responses are assumed to use the same encoding, which holds for all
+    command types listed in TYPES.
+    """
+
+    # get/set commands with a plain (non-indexed) value
+    TYPES = frozenset([
+        0x80,  # version (read-only)
+        0x83,  # config (read-only)
+        0x84,  # id
+        0x89,  # pkt pin
+        0x90,  # freq bands num
+        0x92,  # freq carrier num
+        0x94,  # rx thresh
+        0x95,  # bit spread
+        0x97,  # sync len
+        0x98,  # agc
+        0x9A,  # tx gain
+        0x9B,  # peak win len
+        0x9C,  # transducer
+        0x9E,  # rx gain
+        0xA1,  # sniff mode
+        0xA8,  # range delay
+    ])
+
+    # commands after which no cached value can be trusted anymore
+    RESET_TYPES = frozenset([
+        0x86,  # bootloader
+        0x87,  # reset
+    ])
+
+    # set commands that change the values of other commands
+    CHANGES = {
+        0x99: frozenset([0x9E]),  # raw rx gain changes rx gain
+    }
+
+    # values that are changed by the modem itself while AGC is on
+    AGC_TYPE = 0x98
+    AGC_TYPES = frozenset([0x9E])
+
+    ID_TYPE = 0x84
+
+    def __init__(self, maxAge=None):
+        """Initialize cache (maxAge in seconds, None for no expiry)."""
+        self.maxAge = maxAge  # type: Union[float, None]
+        self.entries = {}  # type: Dict[int, Tuple[bytes, float]]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, type):
+        """Return cached payload of a command type, or None if not fresh."""
+        entry = self.entries.get(type)
+        if entry is None or not self.__isStable(type):
+            self.misses = self.misses + 1
+            return None
+        if self.maxAge is not None and time.monotonic() - entry[1] > self.maxAge:
+            del self.entries[type]
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        return entry[0]
+
+    def put(self, type, payload):
+        """Record the payload of a setter or of a get response."""
+        if type not in self.TYPES or len(payload) == 0:
+            return
+        if type == self.AGC_TYPE:
+            # AGC changes the gain
+            for t in self.AGC_TYPES:
+                self.entries.pop(t, None)
+        self.entries[type] = (bytes(payload), time.monotonic())
+
+    def changed(self, type):
+        """Drop values changed by a set command of type (until the response arrives)."""
+        self.entries.pop(type, None)
+        for t in self.CHANGES.get(type, ()):
+            self.entries.pop(t, None)
+
+    def modemId(self):
+        """Return cached id of the modem (None if unknown)."""
+        entry = self.entries.get(self.ID_TYPE)
+        if entry is None or len(entry[0]) == 0:
+            return None
+        return entry[0][0]
+
+    def invalidate(self, type=None):
+        """Drop a single or (if type is None) all cached values."""
+        if type is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(type, None)
+
+    def __isStable(self, type):
+        """Check whether a value can only be changed by the host."""
+        if type not in self.AGC_TYPES:
+            return True
+        agc = self.entries.get(self.AGC_TYPE)
+        return agc is not None and not any(agc[0])
+
+# eof
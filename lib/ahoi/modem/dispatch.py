@@ -0,0 +1,159 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for dispatching received packets to subscribers."""
+
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Tuple, Union
+
+from ahoi.metrics import trace
+from ahoi.metrics.registry import REGISTRY, HistogramSeries
+
+HANDLER_TIME = REGISTRY.histogram('ahoi_handler_seconds', 'Time spent in rx callbacks and handlers', ('handler',))
+
+
+def cbName(cb):
+    """Name of callback (e.g., RangingHandler.handlePkt)."""
+    return getattr(cb, '__qualname__', type(cb).__name__)
+
+
+class RxDispatcher:
+    """Dispatch table for received packets keyed by packet type and source.
+
+    A type or source of None subscribes to all types or sources (wildcard).
+    Each packet is handed to every interested subscriber once, in the order
+    of subscription. The subscribers for a (type, source) pair are looked
+    up once and kept in a table until subscriptions change, so the cost per
+    packet does not grow with the number of subscribers that are not
+    interested in it. If timing is on, the time spent in each subscriber is
+    recorded (ahoi_handler_seconds); it is off by default, as it adds two
+    clock reads and a histogram update per subscriber and packet. Received
+    packets (those with an rxTime) are traced while tracing is enabled
+    (see ahoi.metrics.trace).
+    """
+
+    def __init__(self, timing=False):
+        """Initialize dispatcher."""
+        self.timing = timing
+        # subscriptions in order: (cb, ((types, srcs), ...), time histogram, name),
+        # types and srcs are sets or None (wildcard)
+        self.subs = ()  # type: Tuple[Tuple[Callable, Tuple[Tuple[Union[FrozenSet[int], None], Union[FrozenSet[int], None]], ...], HistogramSeries, str], ...]
+        # (type, src) -> ((cb, time histogram, name), ...), filled on first packet
+        self.table = {}  # type: Dict[Tuple[int, int], Tuple[Tuple[Callable, HistogramSeries, str], ...]]
+        self.__lock = threading.Lock()
+
+    def subscribe(self, cb, type=None, src=None):
+        """Subscribe cb to packets of type(s) from src(s)."""
+        filt = (RxDispatcher.__keys(type), RxDispatcher.__keys(src))
+        with self.__lock:
+            subs = list(self.subs)
+            for (i, (f, filts, h, name)) in enumerate(subs):
+                if f == cb:
+                    if filt not in filts:
+                        subs[i] = (f, filts + (filt,), h, name)
+                    break
+            else:
+                name = cbName(cb)
+                subs.append((cb, (filt,), HANDLER_TIME.labels(name), name))
+            self.__swap(tuple(subs))
+
+    def unsubscribe(self, cb):
+        """Remove all subscriptions of cb."""
+        with self.__lock:
+            self.__swap(tuple(sub for sub in self.subs if sub[0] != cb))
+
+    def dispatch(self, pkt):
+        """Hand pkt to all interested subscribers."""
+        table = self.table
+        subs = table.get((pkt.header.type, pkt.header.src))
+        if subs is None:
+            subs = self.__lookup(pkt.header.type, pkt.header.src, table)
+        tr = trace.tracer
+        if tr is not None and pkt.rxTime is not None:
+            self.__dispatchTraced(pkt, subs, tr)
+            return
+        if not self.timing:
+            for (f, _, _) in subs:
+                f(pkt)
+            return
+
+        # end of one call is start of the next
+        t0 = time.perf_counter()
+        for (f, h, _) in subs:
+            f(pkt)
+            t1 = time.perf_counter()
+            h.observe(t1 - t0)
+            t0 = t1
+
+    def __dispatchTraced(self, pkt, subs, tr):
+        """Dispatch pkt, recording a trace span per subscriber."""
+        t = pkt.header.type
+        tStart = t0 = time.monotonic_ns()
+        for (f, h, name) in subs:
+            f(pkt)
+            t1 = time.monotonic_ns()
+            if self.timing:
+                h.observe((t1 - t0) / 1e9)
+            tr.span(name, t0, t1, t, 'handler')
+            t0 = t1
+        tr.span('dispatch', tStart, t0, t)
+
+    def __lookup(self, t, s, table):
+        """Find subscribers for packets of type t from s, keep them in table."""
+        with self.__lock:
+            if table is not self.table:
+                table = self.table  # subscriptions changed meanwhile
+            subs = tuple((f, h, name) for (f, filts, h, name) in self.subs
+                         if any((types is None or t in types) and (srcs is None or s in srcs)
+                                for (types, srcs) in filts))
+            table[(t, s)] = subs
+        return subs
+
+    def __swap(self, subs):
+        """Replace subscriptions (with lock held), so that dispatching needs no lock."""
+        self.subs = subs
+        self.table = {}
+
+    @staticmethod
+    def __keys(val):
+        """Turn a single value, an iterable or None (wildcard) into a set of keys."""
+        if val is None:
+            return None
+        if isinstance(val, int):
+            return frozenset((val,))
+        return frozenset(val)
+
+# eof
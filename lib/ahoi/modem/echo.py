@@ -0,0 +1,182 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for echoing packets to the console without slowing down reception.
+
+Packets are queued by the sending or receiving thread (no formatting, no
+I/O there) and printed by a printer thread. The queue is bounded: if the
+console cannot keep up, the oldest packets are dropped. Repeats of the
+same packet are coalesced into one line (with a count) and at most rate
+lines are printed per second. Packets that are dropped or exceed the rate
+are summed up in a line like
+
+    ... 42 packets not echoed (31 RX, 11 TX)
+"""
+
+import string
+import threading
+import time
+from collections import deque
+from typing import Deque, List
+
+from ahoi.modem.packet import packet2HexString
+
+PRINTABLE = (string.digits + string.ascii_letters + string.punctuation).encode('ascii')
+NON_PRINTABLE = bytes(b for b in range(256) if b not in PRINTABLE)
+
+
+def echoLine(direction, pkt, t, num=1):
+    """Format echo line of pkt (direction 'RX' or 'TX') at time t (s)."""
+    output = "%s@%.3f %s" % (direction, t, packet2HexString(pkt))
+    if direction == 'RX':
+        output = "\n" + output + "(" + pkt.payload.translate(None, NON_PRINTABLE).decode('ascii') + ")"
+    if num > 1:
+        output += " x%u" % num
+    return output
+
+
+class EchoPrinter:
+    """Print echoed packets on a thread of its own.
+
+    maxlen bounds the number of queued packets, rate limits the printed
+    lines per second (with bursts of up to rate lines).
+    """
+
+    def __init__(self, maxlen=256, rate=50.0):
+        self.maxlen = max(1, maxlen)
+        self.rate = rate
+        self.numPrinted = 0
+        self.numSuppressed = 0
+        self.queue = deque()  # type: Deque[List]  # [direction, pkt, time, num]
+        self.__suppressed = {'RX': 0, 'TX': 0}  # since last summary
+        self.__tokens = rate
+        self.__tLast = time.monotonic()
+        self.__cond = threading.Condition()
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name='EchoPrinter', daemon=True)
+        self.__thread.start()
+
+    def put(self, direction, pkt, t=None):
+        """Queue pkt for echoing (direction 'RX' or 'TX', t in s)."""
+        if t is None:
+            t = time.time()
+        with self.__cond:
+            if len(self.queue) > 0:
+                last = self.queue[-1]
+                if last[0] == direction and last[1].header == pkt.header and last[1].payload == pkt.payload:
+                    last[2] = t
+                    last[3] += 1
+                    return
+            if len(self.queue) >= self.maxlen:
+                old = self.queue.popleft()
+                self.__suppressed[old[0]] += old[3]
+            self.queue.append([direction, pkt, t, 1])
+            self.__cond.notify()
+
+    def close(self):
+        """Print queued packets and stop printer thread."""
+        with self.__cond:
+            if not self.__running:
+                return
+            self.__running = False
+            self.__cond.notify()
+        if threading.current_thread() is not self.__thread:
+            self.__thread.join()
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while self.__running and len(self.queue) == 0:
+                    delay = self.__summaryDelay()
+                    if delay is None:
+                        self.__cond.wait()
+                    elif delay <= 0 or not self.__cond.wait(delay):
+                        break  # print summary now
+                batch = list(self.queue)
+                self.queue.clear()
+                running = self.__running
+
+            lines = []  # type: List[str]
+            for (direction, pkt, t, num) in batch:
+                if not running or self.__take():
+                    self.__summary(lines)
+                    lines.append(echoLine(direction, pkt, t, num))
+                    self.numPrinted += num
+                else:
+                    with self.__cond:
+                        self.__suppressed[direction] += num
+            if not running or (len(batch) == 0 and self.__take()):
+                self.__summary(lines)
+            if len(lines) > 0:
+                print("\n".join(lines), flush=True)
+            if not running and len(self.queue) == 0:
+                return
+
+    def __refill(self):
+        """Refill rate tokens, return available tokens."""
+        now = time.monotonic()
+        self.__tokens = min(self.rate, self.__tokens + (now - self.__tLast) * self.rate)
+        self.__tLast = now
+        return self.__tokens
+
+    def __take(self):
+        """Take a token for a line, return success."""
+        if self.rate <= 0:
+            return True
+        if self.__refill() < 1.0:
+            return False
+        self.__tokens -= 1.0
+        return True
+
+    def __summaryDelay(self):
+        """Return time (s) until a pending summary may be printed, None if none pending."""
+        if self.__suppressed['RX'] == 0 and self.__suppressed['TX'] == 0:
+            return None
+        if self.rate <= 0:
+            return 0.0
+        return max(0.0, (1.0 - self.__refill()) / self.rate)
+
+    def __summary(self, lines):
+        """Append summary of suppressed packets to lines."""
+        with self.__cond:
+            rx = self.__suppressed['RX']
+            tx = self.__suppressed['TX']
+            self.__suppressed['RX'] = 0
+            self.__suppressed['TX'] = 0
+        if rx + tx > 0:
+            self.numSuppressed += rx + tx
+            lines.append("... %u packets not echoed (%u RX, %u TX)" % (rx + tx, rx, tx))
+
+# eof
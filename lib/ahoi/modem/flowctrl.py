@@ -0,0 +1,152 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for flow control of packets handed to the modem."""
+
+import time
+import threading
+from typing import Callable, Dict, Tuple, Union
+
+from ahoi.modem.packet import ACK_PLAIN, ACK_RANGE, MM_ADDR_BCAST
+
+
+class FlowControl:
+    """Pace data packets by the occupancy of the modem's packet queue.
+
+    In SIGNAL mode, a stand-in for the pkt pin in queue state mode
+    (pktPin(1)) is polled, e.g. a modem control line of the serial port
+    the pin is wired to. The next packet is released as soon as the queue
+    has run empty.
+
+    In ACK mode, up to window packets may be in flight. The slot of a
+    packet that requests an ack is freed by the (hard or ranging) ack
+    matching the packet by source and dsn, or after timeout seconds if its
+    ack is lost. Packets that will not be acked (no ack requested, or a
+    broadcast without ranging) hold their slot for gap seconds, which
+    should be about the airtime of a packet, as nothing tells when the
+    modem is done with them.
+    """
+
+    SIGNAL = 'signal'
+    ACK = 'ack'
+
+    ACK_TYPE = 0x7F
+
+    def __init__(self, mode, window=1, signal=None, timeout=5.0, gap=1.0, settle=0.05, pollIntvl=1e-3):
+        if mode not in (self.SIGNAL, self.ACK):
+            raise ValueError("unknown flow control mode '%s'" % mode)
+        if mode == self.SIGNAL and signal is None:
+            raise ValueError("flow control mode '%s' needs a signal" % mode)
+        self.mode = mode
+        self.window = max(1, window)
+        self.signal = signal  # type: Union[Callable[[], bool], None]
+        self.timeout = timeout  # max. time to wait for a slot (s)
+        self.gap = gap  # time a packet without ack holds its slot (s)
+        self.settle = settle  # time for the pin to rise after sending (s)
+        self.pollIntvl = pollIntvl
+        # (dst, dsn) -> expiry (monotonic s), (-1, n) for packets without ack
+        self.inFlight = {}  # type: Dict[Tuple[int, int], float]
+        self.numTimeouts = 0
+        self.__numNoAck = 0
+        self.__cond = threading.Condition()
+        self.__sentAt = 0.0
+        self.__seenBusy = True
+
+    def acquire(self):
+        """Wait until the modem can take another packet (False on timeout)."""
+        if self.mode == self.SIGNAL:
+            return self.__waitSignal()
+        return self.__waitSlot()
+
+    def sent(self, pkt):
+        """Account for pkt handed to the modem."""
+        now = time.monotonic()
+        if self.mode == self.SIGNAL:
+            self.__sentAt = now
+            self.__seenBusy = False
+            return
+
+        ack = pkt.header.status & (ACK_PLAIN | ACK_RANGE)
+        with self.__cond:
+            if ack == 0 or (pkt.header.dst == MM_ADDR_BCAST and not ack & ACK_RANGE):
+                # no ack will come, assume the modem is done after gap
+                self.__numNoAck += 1
+                self.inFlight[(-1, self.__numNoAck)] = now + self.gap
+            else:
+                self.inFlight[(pkt.header.dst, pkt.header.dsn)] = now + self.timeout
+
+    def handlePkt(self, pkt):
+        """Free the slot of the acked packet (used as rx callback)."""
+        if self.mode != self.ACK or pkt.header.type != self.ACK_TYPE:
+            return
+        with self.__cond:
+            # acked by its destination or, for ranging broadcasts, by anyone
+            if (self.inFlight.pop((pkt.header.src, pkt.header.dsn), None) is not None
+                    or self.inFlight.pop((MM_ADDR_BCAST, pkt.header.dsn), None) is not None):
+                self.__cond.notify()
+
+    def __waitSignal(self):
+        signal = self.signal
+        if signal is None:
+            return True
+        end = time.monotonic() + self.timeout
+        while True:
+            now = time.monotonic()
+            if signal():
+                self.__seenBusy = True
+            elif self.__seenBusy or now - self.__sentAt > self.settle:
+                # queue ran empty (or pin never rose for the last packet)
+                return True
+            if now > end:
+                self.numTimeouts += 1
+                return False
+            time.sleep(self.pollIntvl)
+
+    def __waitSlot(self):
+        end = time.monotonic() + self.timeout
+        with self.__cond:
+            while True:
+                now = time.monotonic()
+                # forget packets that will not be acked anymore
+                for key in [k for (k, t) in self.inFlight.items() if t <= now]:
+                    del self.inFlight[key]
+                if len(self.inFlight) < self.window:
+                    return True
+                if now > end:
+                    self.numTimeouts += 1
+                    return False
+                self.__cond.wait(min(end, min(self.inFlight.values())) - now)
+
+# eof
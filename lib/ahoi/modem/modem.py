@@ -36,17 +36,20 @@
 """Module for modem."""
 
 import time
-import string
 import os.path
 import threading
-import subprocess
-from typing import Union
+from typing import Dict, Union
 
-from ahoi.modem.packet import makePacket, packet2HexString, isCmdType
+from ahoi.modem.packet import makePacket, isCmdType, ACK_NONE
+from ahoi.modem.cache import ConfigCache
+from ahoi.modem.dispatch import RxDispatcher
+from ahoi.modem.echo import EchoPrinter
+from ahoi.modem.flowctrl import FlowControl
 
 from ahoi.com.base import ModemBaseCom
-from ahoi.com.serial import ModemSerialCom
-from ahoi.com.socket import ModemSocketCom
+from ahoi.metrics.registry import REGISTRY
+
+CMD_RTT = REGISTRY.histogram('ahoi_command_rtt_seconds', 'Time from sending a command to receiving its response', ('type',))
 
 
 class Modem:
@@ -57,13 +60,19 @@ class Modem:
         self.timeout = 1.0  # timeout for response to any command
         self.blocking = False
         self.seqNumber = 0
-        self.rxCallbacks = []
-        self.rxHandlers = []
+        self.__txLock = threading.RLock()  # serializes assignment of seqnos
+        self.__respEvent = threading.Event()  # set on any received packet
+        self.rxDispatcher = RxDispatcher()
         #self.logFile = None
         self.rxThread = None
+        self.__pollThread = None  # type: Union[int, None]  # thread driving poll() (instead of a receive thread)
         self.echoTx = False
         self.echoRx = False
+        self.echoPrinter = None # type: Union[EchoPrinter, None]
         self.com = None # type: Union[ModemBaseCom, None]
+        self.cfgCache = None # type: Union[ConfigCache, None]
+        self.flowCtrl = None # type: Union[FlowControl, None]
+        self.__cmdSent = {}  # type: Dict[int, int]  # send time (ns) of pending commands by type
 
         # consts
         self.MAX_PEAKWINLEN = 640  # us
@@ -73,14 +82,33 @@ class Modem:
         self.close()
 
     def connect(self, dev=None):
+        """Connect to modem at dev (com, device name or URI), return success.
+
+        Fails if dev is invalid or the reconnect policy of the connection
+        gave up.
+        """
         if self.com:
             self.com.close()
 
+        # new connection, possibly to a different modem
+        if self.cfgCache is not None:
+            self.cfgCache.invalidate()
+
         if dev:
             if isinstance(dev, ModemBaseCom):
                 self.com = dev
             elif isinstance(dev, str):
-                if dev.startswith("tcp@"):
+                if '://' in dev:
+                    # transport selected by URI scheme (see ahoi.com.registry)
+                    from ahoi.com import registry
+                    try:
+                        self.com = registry.fromUri(dev)
+                    except (ValueError, ImportError) as e:
+                        print("ERROR: cannot connect to %s: %s" % (dev, str(e)))
+                        self.com = None
+                        return False
+                elif dev.startswith("tcp@"):
+                    from ahoi.com.socket import ModemSocketCom
                     dev = dev[4:]
                     tcpparts = dev.split(':')
                     if len(tcpparts) == 1:
@@ -88,39 +116,83 @@ class Modem:
                     else:
                         self.com = ModemSocketCom(tcpparts[0], tcpparts[1])
                 else:
+                    from ahoi.com.serial import ModemSerialCom
                     self.com = ModemSerialCom(dev)
             else:
                 pass
             #raise( ... ) TODO
         else:
+            from ahoi.com.serial import ModemSerialCom
             dev = ModemSerialCom.scanAndSelect()
             self.com = ModemSerialCom(dev)
 
-        self.com.connect(self.__receivePacket)
+        if self.com is None:
+            return False
+
+        # modem may have been reset or replaced while disconnected
+        self.com.reconnectCb = self.__onReconnect
+        return self.com.connect(self.__receivePacket)
+
+    def __onReconnect(self):
+        if self.cfgCache is not None:
+            self.cfgCache.invalidate()
 
     # activate blocking mode
     def setModeBlocking(self, block=True):
         #self.timeout = to
         self.blocking = block
 
-    def addRxCallback(self, cb):
-        """Add a function to be called on rx pkt."""
-        self.rxCallbacks.append(cb)
+    def setConfigCache(self, enable=True, maxAge=None):
+        """Serve get commands from cached config values (maxAge in seconds)."""
+        if enable:
+            self.cfgCache = ConfigCache(maxAge)
+        else:
+            self.cfgCache = None
+
+    def setFlowControl(self, mode=None, window=1, signal=None, timeout=5.0, gap=1.0):
+        """Pace data packets by the modem's queue state (None to disable).
+
+        mode 'signal' polls signal (default: the pkt pin line of a serial
+        connection) with the pkt pin in queue state mode, mode 'ack' allows
+        window unacknowledged packets, counting packets that will not be
+        acked for gap seconds (see FlowControl).
+        """
+        if self.flowCtrl is not None:
+            self.rxDispatcher.unsubscribe(self.flowCtrl.handlePkt)
+            self.flowCtrl = None
+        if mode is None:
+            return 0
+
+        if mode == FlowControl.SIGNAL and signal is None:
+            signal = getattr(self.com, 'getPktPin', None)
+            if signal is None:
+                print("ERROR: connection provides no pkt pin signal")
+                return -1
+
+        self.flowCtrl = FlowControl(mode, window, signal, timeout, gap)
+        self.rxDispatcher.subscribe(self.flowCtrl.handlePkt, FlowControl.ACK_TYPE)
+        if mode == FlowControl.SIGNAL:
+            return self.pktPin(1)  # queue state
+        return 0
+
+    def addRxCallback(self, cb, type=None, src=None):
+        """Add a function to be called on rx pkt (of type(s) from src(s), None for all)."""
+        self.rxDispatcher.subscribe(cb, type, src)
 
     def removeRxCallback(self, cb):
         """Remove a function to be called on rx pkt."""
-        if cb in self.rxCallbacks:
-            self.rxCallbacks.remove(cb)
+        self.rxDispatcher.unsubscribe(cb)
 
-    def addRxHandler(self, cb, type=None):
-        """Add a handler (class) to be called on rx pkt."""
-        # add filter for packet types
-        self.rxHandlers.append(cb)
+    def addRxHandler(self, h, type=None, src=None):
+        """Add a handler (class) to be called on rx pkt (of type(s) from src(s))."""
+        # use packet types announced by the handler, if no filter is given
+        if type is None:
+            type = getattr(h, 'PKT_TYPES', None)
+        self.rxDispatcher.subscribe(h.handlePkt, type, src)
 
     def removeRxHandler(self, h, type=None):
         """Remove a handler (class) to be called on rx pkt."""
-        if h in self.rxHandlers:
-            self.rxHandlers.remove(h)
+        self.rxDispatcher.unsubscribe(h.handlePkt)
 
     def close(self):
         """Terminate."""
@@ -133,10 +205,15 @@ class Modem:
         if self.rxThread is not None:
             self.rxThread.join()
 
+        if self.echoPrinter is not None:
+            self.echoPrinter.close()
+            self.echoPrinter = None
+
     def __receivePacket(self, pkt):
         # echoing
-        if self.echoRx:
-            self.__printRxRaw(pkt)
+        echo = self.echoPrinter
+        if self.echoRx and echo is not None:
+            echo.put('RX', pkt, time.time() if pkt.rxWallTime is None else pkt.rxWallTime / 1e9)
 
         # logging
         #if self.logFile is not None and not self.logFile.closed:
@@ -145,12 +222,17 @@ class Modem:
         #    os.fsync(self.logFile.fileno())
 
         # FIXME right position?
-        self.__waitResp = False  # received packet, unblock
+        self.__respEvent.set()  # received packet, unblock
+
+        if isCmdType(pkt):
+            if self.cfgCache is not None:
+                self.cfgCache.put(pkt.header.type, pkt.payload)
+            tSent = self.__cmdSent.pop(pkt.header.type, None)
+            if tSent is not None:
+                tRx = pkt.rxTime if pkt.rxTime is not None else time.monotonic_ns()
+                CMD_RTT.labels('0x%02X' % pkt.header.type).observe((tRx - tSent) / 1e9)
 
-        for f in self.rxCallbacks:
-            f(pkt)
-        for h in self.rxHandlers:
-            h.handlePkt(pkt)
+        self.rxDispatcher.dispatch(pkt)
 
     def receive(self, thread=False):
         if self.com is not None:
@@ -160,48 +242,120 @@ class Modem:
                 self.rxThread = threading.Thread(target=self.com.receive)
                 self.rxThread.start()
 
-    def send(self, src, dst, type, payload=bytearray(), status=None, dsn=None):
-        """Send a packet."""
-        if dsn is None or dsn > 255:
-            dsn = self.seqNumber
+    def poll(self, timeout=0.0):
+        """Receive and dispatch what has arrived, waiting up to timeout (s).
 
-        pkt = makePacket(src, dst, type, status, dsn, payload)
-        return self.__sendPacket(pkt)
+        Instead of receive(), for loops that drive the modem themselves:
+        callbacks and handlers run on the calling thread, and commands in
+        blocking mode sent by the same thread poll for their response.
+        Return number of bytes handled, -1 if the connection is closed.
+        """
+        if self.com is None:
+            return -1
+        self.__pollThread = threading.get_ident()
+        return self.com.poll(timeout)
 
-    def __sendPacket(self, pkt):
-        """Send a packet."""
-        # output
-        if self.echoTx:
-            output = "TX@"
-            output += "{:.3f}".format(time.time())
-            output += " "
-            output += packet2HexString(pkt)
-            print(output)
-            # packet.printPacket(pkt)
+    def fileno(self):
+        """File descriptor of the connection for select/epoll loops (None if there is none)."""
+        if self.com is None:
+            return None
+        return self.com.fileno()
 
-        # hand over to com
-        if self.com is not None:
-            self.com.send(pkt)  # FIXME how to handle delays with different connections?
+    def send(self, src, dst, type, payload=bytearray(), status=None, dsn=None):
+        """Send a packet (with the next sequence number, if dsn is not given)."""
+        seqDsn = dsn is None or dsn > 255
+        pkt = makePacket(src, dst, type, status, 0 if seqDsn else dsn, payload)
+        return self.__sendPacket(pkt, seqDsn)
+
+    def __sendPacket(self, pkt, seqDsn=False):
+        """Send a packet (with dsn set to the sequence number, if seqDsn)."""
+        # answer from or update config cache
+        if self.cfgCache is not None and isCmdType(pkt):
+            if self.__cacheTx(pkt):
+                return 0
+
+        # wait for room in the modem's packet queue (other senders may go
+        # ahead meanwhile, so the window may be exceeded by concurrent senders)
+        flowCtrl = self.flowCtrl if not isCmdType(pkt) else None
+        if flowCtrl is not None and not flowCtrl.acquire():
+            print("WARNING: flow control timeout, sending anyway")
+
+        wait = self.blocking and isCmdType(pkt)
+
+        # one sender at a time for seqnos (an uncontended lock is cheap); the
+        # com serializes (and paces) writes itself, so a slow write does not
+        # hold up other senders here
+        with self.__txLock:
+            if seqDsn:
+                pkt = pkt._replace(header=pkt.header._replace(dsn=self.seqNumber))
+
+            # manage seqnos
+            self.seqNumber = (self.seqNumber + 1) % 256
+
+            # arm before sending, so that a fast response is not missed
+            if wait:
+                self.__respEvent.clear()
+
+            # output
+            echo = self.echoPrinter
+            if self.echoTx and echo is not None:
+                echo.put('TX', pkt)
+
+            if self.com is not None and isCmdType(pkt):
+                self.__cmdSent[pkt.header.type] = time.monotonic_ns()
 
-        # manage seqnos
-        self.seqNumber = (self.seqNumber + 1) % 256
+        # hand over to com
+        com = self.com
+        if com is not None:
+            com.send(pkt)  # FIXME how to handle delays with different connections?
+        if flowCtrl is not None:
+            flowCtrl.sent(pkt)
 
         # FIXME how to handle delays with different connections?
-        if self.blocking and isCmdType(pkt):
-            self.__waitResp = True
-            n = self.timeout / 10e-3
-            while n > 0 and self.__waitResp:
-                time.sleep(10e-3)
-                n = n - 1
-
-            if n == 0 and self.__waitResp:
-                print("timeout")
-                # FIXME through exception or so, if not received?
+        if wait and not self.__waitResponse():
+            print("timeout")
+            # FIXME through exception or so, if not received?
         #else:
         #    time.sleep()
 
         return 0  # HOTFIX to avoid mosh showing improper parameter use for commands
-        #return not self.__waitResp
+
+    def __waitResponse(self):
+        """Wait for a response (polling, on the thread driving poll()), return success."""
+        if self.__pollThread != threading.get_ident() or self.rxThread is not None:
+            return self.__respEvent.wait(self.timeout)
+        deadline = time.monotonic() + self.timeout
+        while not self.__respEvent.is_set():
+            left = deadline - time.monotonic()
+            if left <= 0 or self.poll(left) < 0:
+                return self.__respEvent.is_set()
+        return True
+
+    def __cacheTx(self, pkt):
+        """Serve a get command from the config cache, or invalidate changed values.
+
+        Set values are cached when the modem's response arrives.
+        """
+        cache = self.cfgCache
+        if cache is None:
+            return False
+
+        t = pkt.header.type
+        if t in ConfigCache.RESET_TYPES:
+            cache.invalidate()
+        elif len(pkt.payload) > 0:
+            cache.changed(t)
+        else:
+            # answer as the modem would, so its own id is needed
+            modemId = cache.modemId()
+            if modemId is None:
+                return False
+            payload = cache.get(t)
+            if payload is not None:
+                # hand cached value to callbacks (not echoed or traced, no rxTime)
+                self.rxDispatcher.dispatch(makePacket(modemId, pkt.header.src, t, ACK_NONE, pkt.header.dsn, payload))
+                return True
+        return False
 
     def getVersion(self):
         """Get firmware version."""
@@ -474,6 +628,9 @@ class Modem:
         return self.__sendPacket(pkt)
 
     def program(self, img='ahoi.hex', empty=False):
+        import subprocess
+        from ahoi.com.serial import ModemSerialCom
+
         # check if serially connected
         if not isinstance(self.com, ModemSerialCom):
             print("ERROR: programming only supported via serial communiation")
@@ -493,6 +650,10 @@ class Modem:
                 # TODO handle msg
                 return -1
 
+        # new firmware, forget about old config
+        if self.cfgCache is not None:
+            self.cfgCache.invalidate()
+
         # disconnect MoSh from serial
         self.com.disconnect()
 
@@ -542,26 +703,22 @@ class Modem:
     def setTxEcho(self, echo):
         """Turn TX echos on/off"""
         self.echoTx = echo
+        self.__initEcho()
 
     def setRxEcho(self, echo):
-        """Turn TX echos on/off"""
+        """Turn RX echos on/off"""
         self.echoRx = echo
-
-    def __printRxRaw(self, pkt):
-        output = "RX@"
-        output += "{:.3f}".format(time.time())
-        output += " "
-        output += packet2HexString(pkt)
-        output += "("
-        output += "".join(
-            filter(
-                lambda x: x
-                          in string.digits + string.ascii_letters + string.punctuation,
-                pkt.payload.decode("ascii", "ignore"),
-            )
-        )
-        output += ")"
-        print("")
-        print(output)
+        self.__initEcho()
+
+    def setEchoLimits(self, rate=50.0, maxlen=256):
+        """Limit echos to rate lines per second and maxlen queued packets (see EchoPrinter)."""
+        if self.echoPrinter is not None:
+            self.echoPrinter.close()
+        self.echoPrinter = EchoPrinter(maxlen, rate)
+
+    def __initEcho(self):
+        """Start printer thread when echoing is turned on."""
+        if (self.echoRx or self.echoTx) and self.echoPrinter is None:
+            self.echoPrinter = EchoPrinter()
 
 # eof
@@ -51,12 +51,15 @@ ACK_PLAIN = 1
 ACK_RANGE = 2
 
 Header = collections.namedtuple('Header', ['src', 'dst', 'type', 'status', 'dsn', 'len'])
-Packet = collections.namedtuple('Packet', ['header', 'payload', 'footer'])
+# rxTime (time.monotonic_ns()) and rxWallTime (time.time_ns()) of received
+# packets are taken when the end of the frame was read, None otherwise
+Packet = collections.namedtuple('Packet', ['header', 'payload', 'footer', 'rxTime', 'rxWallTime'],
+                                defaults=(None, None))
 Footer = collections.namedtuple('Footer', ['power', 'rssi', 'biterrors', 'agcMean', 'agcMin', 'agcMax'])
 
 
-def byteArrayToPacket(rxBytes):
-    """Convert received byte array to packet."""
+def byteArrayToPacket(rxBytes, rxTime=None, rxWallTime=None):
+    """Convert received byte array to packet (received at rxTime and rxWallTime in ns)."""
     headLen = len(HEADER_FORMAT)
     # FIXME please do proper error handling
     # if len(rxBytes) < headLen:
@@ -83,7 +86,7 @@ def byteArrayToPacket(rxBytes):
         footer = Footer(*struct.unpack(FOOTER_FORMAT, footerBytes))
     else:
         footer = None  # Footer(0, 0, 0, 0, 0, 0)
-    return Packet(header, payload, footer)
+    return Packet(header, payload, footer, rxTime, rxWallTime)
 
 
 def makePacket(src=0, dst=MM_ADDR_BCAST, pkt_type=0, ack=ACK_NONE, dsn=0, payload=bytes()):
@@ -0,0 +1,182 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for simulating a shared acoustic channel between emulated modems."""
+
+import math
+import random
+import threading
+import time
+from typing import Dict, List, Tuple, Union
+
+from ahoi.modem.packet import MM_ADDR_BCAST, ACK_PLAIN, ACK_RANGE
+from ahoi.sim.emulator import ModemEmulator
+from ahoi.sim.scheduler import Scheduler
+
+
+class Reception:
+    """A packet arriving at a node."""
+
+    def __init__(self, pkt, start, end, tof):
+        self.pkt = pkt
+        self.start = start
+        self.end = end
+        self.tof = tof  # one-way propagation delay (s)
+        self.corrupt = False
+
+
+class AcousticChannel:
+    """Shared medium for a set of emulated modems.
+
+    A packet sent by a node reaches every other node (within maxRange)
+    after the propagation delay given by their distance and the speed of
+    sound, and occupies the receiver for the packet's airtime (which
+    depends on the sender's bit spread and the payload length). Receptions
+    that overlap at a receiver collide and are lost, as are receptions
+    while the receiver is transmitting itself (half duplex). Remaining
+    packets are lost with probability loss. Modems queue their
+    transmissions, and receivers send hard acks and ranging acks (after
+    their range delay) over the channel as well.
+    """
+
+    SPAN_KEEP = 60.0  # how long own transmissions are remembered (s)
+
+    def __init__(self, sos=1500.0, loss=0.0, maxRange=None, seed=None):
+        self.sos = sos  # speed of sound (m/s)
+        self.loss = loss  # packet loss probability
+        self.maxRange = maxRange  # type: Union[float, None]
+        self.scheduler = Scheduler()
+        self.nodes = []  # type: List[ModemEmulator]
+        self.pos = {}  # type: Dict[ModemEmulator, Tuple[float, float, float]]
+        self.txBusy = {}  # type: Dict[ModemEmulator, float]
+        self.txSpans = {}  # type: Dict[ModemEmulator, List[Tuple[float, float]]]
+        self.rx = {}  # type: Dict[ModemEmulator, List[Reception]]
+        self.stats = {'tx': 0, 'delivered': 0, 'lost': 0, 'collided': 0, 'halfDuplex': 0}
+        self.__random = random.Random(seed)
+        self.__lock = threading.RLock()
+
+    def addNode(self, id, x, y, z=0.0, latency=0.0):
+        """Add an emulated modem at position (x,y,z) in m."""
+        node = ModemEmulator(id, latency, self.sos, self.scheduler)
+        node.medium = self
+        with self.__lock:
+            self.nodes.append(node)
+            self.pos[node] = (float(x), float(y), float(z))
+            self.txBusy[node] = 0.0
+            self.txSpans[node] = []
+            self.rx[node] = []
+        return node
+
+    def move(self, node, x, y, z=0.0):
+        """Move a node (affects packets sent afterwards)."""
+        with self.__lock:
+            self.pos[node] = (float(x), float(y), float(z))
+
+    def distance(self, a, b):
+        """Distance between two nodes (m)."""
+        return math.sqrt(sum((pa - pb) ** 2 for (pa, pb) in zip(self.pos[a], self.pos[b])))
+
+    def close(self):
+        """Stop simulation and close all nodes."""
+        self.scheduler.close()
+        for node in self.nodes:
+            node.close()
+
+    def transmit(self, node, pkt):
+        """Send pkt from node (called by the node's emulator)."""
+        with self.__lock:
+            now = time.monotonic()
+            airtime = node.airtime(pkt.header.len)
+            # the modem sends queued packets back to back
+            start = max(now, self.txBusy[node])
+            self.txBusy[node] = start + airtime
+            spans = self.txSpans[node]
+            spans.append((start, start + airtime))
+            while spans[0][1] < now - self.SPAN_KEEP:
+                spans.pop(0)
+            self.stats['tx'] += 1
+
+            for other in self.nodes:
+                if other is node:
+                    continue
+                d = self.distance(node, other)
+                if self.maxRange is not None and d > self.maxRange:
+                    continue
+                tof = d / self.sos
+                r = Reception(pkt, start + tof, start + tof + airtime, tof)
+                self.scheduler.at(r.start, self.__rxStart, other, r)
+
+    def __rxStart(self, node, r):
+        with self.__lock:
+            active = self.rx[node]
+            for o in active:
+                if o.end > r.start:
+                    o.corrupt = True
+                    r.corrupt = True
+            active.append(r)
+        self.scheduler.at(r.end, self.__rxEnd, node, r)
+
+    def __rxEnd(self, node, r):
+        with self.__lock:
+            self.rx[node].remove(r)
+            # receiver was sending during reception
+            halfDuplex = any(s < r.end and e > r.start for (s, e) in self.txSpans[node])
+
+            if r.corrupt or halfDuplex:
+                self.stats['collided' if r.corrupt else 'halfDuplex'] += 1
+                node.stats['sync'] += 1
+                node.stats['rxCrcErr'] += 1
+                return
+            if self.__random.random() < self.loss:
+                self.stats['lost'] += 1
+                return
+            self.stats['delivered'] += 1
+
+        node.receive(r.pkt)
+        self.__answer(node, r)
+
+    def __answer(self, node, r):
+        """Let the receiving modem ack the packet, if requested."""
+        pkt = r.pkt
+        if node.config[0xA1][0]:
+            return  # sniff mode: no acks
+        if pkt.header.status == ACK_RANGE and pkt.header.dst in (node.id, MM_ADDR_BCAST):
+            delay = int.from_bytes(node.config[0xA8], 'big') * 1e-6
+            ack = node.makeAck(node.id, pkt.header.src, pkt, r.tof)
+            self.scheduler.after(delay, self.transmit, node, ack)
+        elif pkt.header.status == ACK_PLAIN and pkt.header.dst == node.id:
+            self.transmit(node, node.makeAck(node.id, pkt.header.src, pkt))
+
+# eof
@@ -0,0 +1,82 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for talking to an in-process emulated modem."""
+
+from typing import Union
+
+from ahoi.com.serial import ModemSerialCom
+from ahoi.com.registry import checkOptions
+from ahoi.sim.emulator import ModemEmulator
+
+
+class ModemSimCom(ModemSerialCom):
+    """Serial com to a ModemEmulator started on a pseudo-terminal."""
+
+    def __init__(self, id=0, latency=0.0, peers=None, cb=None):
+        super().__init__(None, cb)
+        self.txDelay = 0.0
+        self.emuId = id
+        self.emuLatency = latency
+        self.emuPeers = peers if peers is not None else {}
+        self.emu = None  # type: Union[ModemEmulator, None]
+
+    @classmethod
+    def fromUri(cls, scheme, loc, opts):
+        """Create from URI (sim://?id=1&latency=0.01&peer=2:100,3:250)."""
+        checkOptions(opts, ('id', 'latency', 'peer'))
+        peers = {}
+        for p in opts.get('peer', '').split(','):
+            if p:
+                pid, dist = p.split(':')
+                peers[int(pid)] = float(dist)
+        return cls(int(opts.get('id', 0)), float(opts.get('latency', 0.0)), peers)
+
+    def connect(self, cb=None):
+        """Start emulator and connect to it, return success."""
+        self.emu = ModemEmulator(self.emuId, self.emuLatency)
+        for (pid, dist) in self.emuPeers.items():
+            self.emu.addPeer(pid, dist)
+        self.dev = self.emu.openPty()
+        return super().connect(cb)
+
+    def close(self):
+        """Terminate (including emulator)."""
+        super().close()
+        if self.emu is not None:
+            self.emu.close()
+            self.emu = None
+
+# eof
@@ -0,0 +1,381 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for emulating an ahoi modem in software."""
+
+import math
+import os
+import random
+import select
+import socket
+import struct
+import threading
+import time
+import tty
+from typing import Any, Callable, Dict, Union
+
+from ahoi.com.streamer import Streamer
+from ahoi.modem.packet import (
+    byteArrayToPacket, getBytes, makePacket, isCmdType, Footer,
+    MM_ADDR_BCAST, ACK_NONE, ACK_RANGE
+)
+from ahoi.sim.scheduler import Scheduler
+
+
+class ModemEmulator:
+    """Software stand-in for an ahoi modem.
+
+    The emulator speaks the DLE/STX framed serial protocol over a
+    pseudo-terminal (openPty, usable as ModemSerialCom device) or a TCP
+    port (listen, usable as tcp@host:port). It answers the commands of
+    Modem from an emulated config, keeps packet statistics, produces
+    oscilloscope samples, and emulates acks and ranging acks of virtual
+    peers at given distances.
+
+    Data packets are handed to medium.transmit(node, pkt), if a medium is
+    set (see AcousticChannel). Otherwise, only virtual peers answer.
+    """
+
+    VERSION = "ahoi emulator 1.0"
+    CONFIG = "FW=emu,FS=200kHz,BAND=50-75kHz"
+
+    ACK_TYPE = 0x7F
+    RANGE_ACK_LEN = 16
+
+    # airtime model: sync preamble plus header, payload and crc bits,
+    # each spread into bitSpread chips
+    SYNC_TIME = 0.1  # s
+    CHIP_TIME = 1.28e-3  # s
+    HEADER_LEN = 6
+    CRC_LEN = 2
+
+    def __init__(self, id=0, latency=0.0, sos=1500.0, scheduler=None):
+        self.id = id
+        self.latency = latency  # command processing latency (s)
+        self.sos = sos  # speed of sound (m/s) for virtual peers
+        self.peers = {}  # type: Dict[int, float]
+        self.medium = None  # type: Any
+        self.config = {}  # type: Dict[int, bytes]
+        self.stats = {}  # type: Dict[str, int]
+        self.dev = None  # type: Union[str, None]
+        self.hostRxCallback = None  # type: Union[Callable, None]
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.__ownScheduler = scheduler is None
+        self.__streamer = Streamer()
+        self.__lock = threading.Lock()  # serializes writes to host
+        self.__master = None  # type: Union[int, None]
+        self.__slave = None  # type: Union[int, None]
+        self.__server = None  # type: Union[socket.socket, None]
+        self.__conn = None  # type: Union[socket.socket, None]
+        self.__running = False
+        self.__thread = None  # type: Union[threading.Thread, None]
+        self.reset()
+
+    def __del__(self):
+        self.close()
+
+    ##
+    # connections
+    ##
+
+    def openPty(self):
+        """Serve host via a pseudo-terminal, returns device name."""
+        self.__master, self.__slave = os.openpty()
+        tty.setraw(self.__slave)  # no echo, no line discipline
+        self.dev = os.ttyname(self.__slave)
+        self.__start(self.__runPty)
+        return self.dev
+
+    def listen(self, host='127.0.0.1', port=0):
+        """Serve host via TCP, returns (host, port)."""
+        self.__server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__server.bind((host, port))
+        self.__server.listen(1)
+        addr = self.__server.getsockname()
+        self.dev = "tcp@%s:%u" % (addr[0], addr[1])
+        self.__start(self.__runTcp)
+        return addr
+
+    def close(self):
+        """Stop emulation and close connections."""
+        self.__running = False
+        if self.__thread is not None and threading.current_thread() is not self.__thread:
+            self.__thread.join()
+        self.__thread = None
+        for fd in (self.__master, self.__slave):
+            if fd is not None:
+                os.close(fd)
+        self.__master = self.__slave = None
+        for s in (self.__conn, self.__server):
+            if s is not None:
+                s.close()
+        self.__conn = self.__server = None
+        if self.__ownScheduler:
+            self.scheduler.close()
+
+    def __start(self, target):
+        self.__running = True
+        self.__thread = threading.Thread(target=target, daemon=True)
+        self.__thread.start()
+
+    def __runPty(self):
+        master = self.__master
+        assert master is not None
+        while self.__running:
+            r, _, _ = select.select([master], [], [], 0.1)
+            if not r:
+                continue
+            try:
+                rx = os.read(master, 4096)
+            except OSError:
+                # no process has the device open
+                time.sleep(0.1)
+                continue
+            self.__processRx(rx)
+
+    def __runTcp(self):
+        assert self.__server is not None
+        self.__server.settimeout(0.1)
+        while self.__running:
+            try:
+                conn, _ = self.__server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.settimeout(0.1)
+            self.__conn = conn
+            while self.__running:
+                try:
+                    rx = conn.recv(4096)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                if not rx:
+                    break
+                self.__processRx(rx)
+            self.__conn = None
+            conn.close()
+
+    def __processRx(self, rx):
+        for b in rx:
+            r = self.__streamer.dec(b)
+            if r is not None:
+                self.handleHostPkt(byteArrayToPacket(r))
+
+    def toHost(self, pkt):
+        """Send a packet to the host."""
+        tx = self.__streamer.enc(getBytes(pkt))
+        with self.__lock:
+            try:
+                if self.__master is not None:
+                    os.write(self.__master, tx)
+                elif self.__conn is not None:
+                    self.__conn.sendall(tx)
+            except OSError:
+                pass  # host is gone
+
+    ##
+    # modem behavior
+    ##
+
+    def reset(self):
+        """Reset config and statistics to defaults."""
+        self.config = {
+            0x84: bytes([self.id]),  # id
+            0x89: bytes([0]),  # pkt pin
+            0x90: bytes([1]),  # freq bands num
+            0x91: bytes([0, 1, 2, 3]),  # freq bands
+            0x92: bytes([4]),  # freq carrier num
+            0x93: bytes(range(16)),  # freq carriers
+            0x94: bytes([50]),  # rx thresh
+            0x95: bytes([3]),  # bit spread
+            0x96: bytes([0, 0]),  # filter raw
+            0x97: bytes([4, 4]),  # sync len
+            0x98: bytes([1]),  # agc
+            0x99: bytes([0, 0]),  # rx gain raw
+            0x9A: bytes([0]),  # tx gain
+            0x9B: (200).to_bytes(2, 'big'),  # peak win len
+            0x9C: bytes([0]),  # transducer
+            0x9E: bytes([0]),  # rx gain
+            0xA1: bytes([0]),  # sniff mode
+            0xA8: (0).to_bytes(4, 'big'),  # range delay
+        }
+        self.clearStats()
+
+    def clearStats(self):
+        """Clear packet, sync and sfd statistics."""
+        self.stats = {
+            'txPkt': 0, 'txAck': 0, 'rxPkt': 0, 'rxAck': 0,
+            'rxCrcErr': 0, 'sync': 0, 'sfd': 0
+        }
+
+    def addPeer(self, id, distance):
+        """Add a virtual peer answering acks and ranging requests."""
+        self.peers[id] = distance
+
+    def airtime(self, paylen):
+        """Time needed to transmit a packet with paylen bytes (s)."""
+        nbits = (self.HEADER_LEN + paylen + self.CRC_LEN) * 8
+        return self.SYNC_TIME + nbits * self.config[0x95][0] * self.CHIP_TIME
+
+    def handleHostPkt(self, pkt):
+        """Handle a packet received from the host."""
+        if self.hostRxCallback is not None:
+            self.hostRxCallback(pkt)
+        if isCmdType(pkt):
+            self.scheduler.after(self.latency, self.__command, pkt)
+        else:
+            self.__transmit(pkt)
+
+    def receive(self, pkt, power=50, rssi=50, biterrors=0):
+        """Hand a packet received via the medium to the host."""
+        self.stats['sync'] += 1
+        self.stats['sfd'] += 1
+        if pkt.header.type == self.ACK_TYPE:
+            self.stats['rxAck'] += 1
+        else:
+            self.stats['rxPkt'] += 1
+
+        # filter other destinations (except when sniffing)
+        if (pkt.header.dst not in (self.id, MM_ADDR_BCAST)
+                and not self.config[0xA1][0]):
+            return
+
+        gain = self.config[0x9E][0]
+        footer = Footer(power, rssi, biterrors, gain, gain, gain)
+        self.toHost(pkt._replace(footer=footer))
+
+    def __transmit(self, pkt):
+        self.stats['txPkt'] += 1
+        # the modem sends with its own id
+        pkt = pkt._replace(header=pkt.header._replace(src=self.id))
+        if self.medium is not None:
+            self.medium.transmit(self, pkt)
+            return
+
+        # no medium: let virtual peers answer
+        if pkt.header.status == ACK_NONE:
+            return
+        if pkt.header.dst == MM_ADDR_BCAST:
+            if pkt.header.status != ACK_RANGE:
+                return
+            peers = list(self.peers.items())
+        elif pkt.header.dst in self.peers:
+            peers = [(pkt.header.dst, self.peers[pkt.header.dst])]
+        else:
+            return
+
+        t = self.airtime(pkt.header.len)
+        tack = self.airtime(self.RANGE_ACK_LEN if pkt.header.status == ACK_RANGE else 0)
+        for (pid, dist) in peers:
+            tof = dist / self.sos
+            delay = t + 2 * tof + tack
+            if pkt.header.status == ACK_RANGE:
+                delay += int.from_bytes(self.config[0xA8], 'big') * 1e-6
+            ack = self.makeAck(pid, self.id, pkt, tof)
+            self.scheduler.after(delay, self.receive, ack)
+
+    def makeAck(self, src, dst, pkt, tof=0.0):
+        """Make (ranging) ack of pkt as sent by src to dst."""
+        payload = bytes()
+        if pkt.header.status == ACK_RANGE:
+            payload = int(round(tof * 1e6)).to_bytes(4, 'big') + bytes(self.RANGE_ACK_LEN - 4)
+        return makePacket(src, dst, self.ACK_TYPE, ACK_NONE, pkt.header.dsn, payload)
+
+    def __command(self, pkt):
+        t = pkt.header.type
+        payload = bytes(pkt.payload)
+        resp = None  # type: Union[bytes, None]
+
+        if t in self.config:
+            if len(payload) > 0:
+                self.config[t] = payload
+                if t == 0x84:
+                    self.id = payload[0]
+            resp = self.config[t]
+        elif t == 0x80:
+            resp = self.VERSION.encode('ascii')
+        elif t == 0x83:
+            resp = self.CONFIG.encode('ascii')
+        elif t == 0x85:
+            resp = (3700).to_bytes(2, 'big')  # mV
+        elif t == 0x86 or t == 0x88:
+            return  # bootloader/sleep: modem goes silent
+        elif t == 0x87:
+            self.reset()
+            resp = bytes()
+        elif t == 0xA0:
+            self.__sample(pkt)
+            return
+        elif t == 0xB8:
+            resp = bytes([random.randint(0, 10)])
+        elif t == 0xB9:
+            resp = bytes(random.randint(0, 10) for _ in range(4))
+        elif t == 0xC0:
+            resp = struct.pack('>IIIII', self.stats['txPkt'], self.stats['txAck'],
+                               self.stats['rxPkt'], self.stats['rxAck'], self.stats['rxCrcErr'])
+        elif t == 0xC2:
+            resp = struct.pack('>I', self.stats['sync'])
+        elif t == 0xC4:
+            resp = struct.pack('>I', self.stats['sfd'])
+        elif t in (0xC1, 0xC3, 0xC5):
+            self.clearStats()
+            resp = bytes()
+        else:
+            resp = bytes()  # tests and unknown commands: plain confirmation
+
+        self.toHost(makePacket(self.id, pkt.header.src, t, ACK_NONE, pkt.header.dsn, resp))
+
+    def __sample(self, pkt):
+        trigger = pkt.payload[0]
+        num = int.from_bytes(pkt.payload[1:3], 'big')
+        self.toHost(makePacket(self.id, pkt.header.src, 0xA0, ACK_NONE, pkt.header.dsn, bytes(pkt.payload)))
+        if trigger == 0:
+            return
+
+        # noisy carrier at 62.5 kHz (sampled at 200 kHz), in chunks of 100 samples
+        data = bytearray()
+        for i in range(num):
+            v = 0.3 * math.sin(2 * math.pi * 62.5 / 200 * i) + random.gauss(0, 0.05)
+            data += max(-2 ** 15, min(2 ** 15 - 1, int(v * 2 ** 14))).to_bytes(2, 'big', signed=True)
+        for i in range(0, len(data), 200):
+            chunk = bytes(data[i:i + 200])
+            self.toHost(makePacket(self.id, pkt.header.src, 0xA0, ACK_NONE, pkt.header.dsn, chunk))
+
+# eof
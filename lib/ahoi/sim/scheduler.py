@@ -0,0 +1,95 @@
+#
+# Copyright 2016-2020
+# 
+# Bernd-Christian Renner, Jan Heitmann, and
+# Hamburg University of Technology (TUHH).
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Module for running timed events of the simulation."""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, List, Tuple
+
+
+class Scheduler:
+    """Run callables at given (monotonic) points in time on one thread."""
+
+    def __init__(self):
+        self.events = []  # type: List[Tuple[float, int, Any, tuple]]
+        self.__cnt = itertools.count()  # keeps order of events at the same time
+        self.__cond = threading.Condition()
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def at(self, t, fn, *args):
+        """Run fn(*args) at monotonic time t."""
+        with self.__cond:
+            heapq.heappush(self.events, (t, next(self.__cnt), fn, args))
+            self.__cond.notify()
+
+    def after(self, delay, fn, *args):
+        """Run fn(*args) after delay seconds."""
+        self.at(time.monotonic() + delay, fn, *args)
+
+    def close(self):
+        """Stop (pending events are discarded)."""
+        with self.__cond:
+            self.__running = False
+            self.events.clear()
+            self.__cond.notify()
+        if threading.current_thread() is not self.__thread:
+            self.__thread.join()
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while self.__running:
+                    if len(self.events) == 0:
+                        self.__cond.wait()
+                        continue
+                    delay = self.events[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.__cond.wait(delay)
+                if not self.__running:
+                    return
+                _, _, fn, args = heapq.heappop(self.events)
+
+            try:
+                fn(*args)
+            except Exception as e:
+                print("Scheduler: %s" % str(e))
+
+# eof